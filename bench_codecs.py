@@ -0,0 +1,97 @@
+"""
+Benchmark of the snapshot codecs on real snapshots: compression ratio,
+compress and decompress speed, and the time to get the products back
+(decompress + JSON parse), which is what the dashboard waits for.
+
+    python bench_codecs.py                         # every products_* snapshot in the current directory
+    python bench_codecs.py products_25-06-2025.7z --repeat 5 --output codecs.json
+
+Each codec runs at its default level and at the levels in LEVELS. The old
+7z read path (extract to a temporary directory, then parse) is timed too.
+"""
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+
+import py7zr
+
+from snapshot_io import CODECS, codec_for_path, list_snapshots
+
+# Extra levels to try besides each codec's default
+LEVELS = {"xz": [1, 9], "gzip": [1, 9], "zstd": [1, 19], "lz4": [9]}
+
+def _best_time(function, repeat):
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def _read_7z_via_tempdir(path):
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        with py7zr.SevenZipFile(path, mode="r") as archive:
+            archive.extractall(path=tmpdirname)
+        extracted_file = next(Path(tmpdirname).glob("*.json"))
+        with open(extracted_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+def bench_snapshot(path, repeat=3):
+    """Results for every codec and level on the JSON of one snapshot"""
+    path = Path(path)
+    raw = codec_for_path(path).decompress(path.read_bytes())
+    mb = len(raw) / (1024 * 1024)
+    results = []
+
+    for codec in CODECS.values():
+        levels = [codec.default_level] + [level for level in LEVELS.get(codec.name, []) if level != codec.default_level]
+        for level in levels:
+            compress_s, packed = _best_time(lambda: codec.compress(raw, level, path.stem + ".json"), repeat)
+            decompress_s, _ = _best_time(lambda: codec.decompress(packed), repeat)
+            load_s, _ = _best_time(lambda: json.loads(codec.decompress(packed)), repeat)
+            stored = codec.name == "json"  # no compression to time
+            results.append({
+                "codec": codec.name if level is None else f"{codec.name}:{level}",
+                "bytes": len(packed),
+                "ratio": round(len(raw) / len(packed), 2),
+                "compress_mb_s": None if stored else round(mb / compress_s, 1),
+                "decompress_mb_s": None if stored else round(mb / decompress_s, 1),
+                "load_seconds": round(load_s, 3),
+            })
+
+    if path.suffix == ".7z":
+        load_s, _ = _best_time(lambda: _read_7z_via_tempdir(path), repeat)
+        results.append({"codec": "7z (temp dir)", "bytes": path.stat().st_size,
+                        "ratio": round(len(raw) / path.stat().st_size, 2), "compress_mb_s": None,
+                        "decompress_mb_s": None, "load_seconds": round(load_s, 3)})
+
+    return {"snapshot": path.name, "json_mb": round(mb, 1), "results": results}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare snapshot codecs on real snapshots")
+    parser.add_argument("snapshots", nargs="*", help="snapshot files (default: every products_* snapshot here)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per measurement; the best is kept")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    snapshots = args.snapshots or list_snapshots(".")
+    if not snapshots:
+        parser.error("no snapshots found")
+
+    reports = []
+    for snapshot in snapshots:
+        report = bench_snapshot(snapshot, args.repeat)
+        reports.append(report)
+        print(f"\n{report['snapshot']} ({report['json_mb']} MB of JSON)")
+        print(f"{'codec':<16}{'size KB':>10}{'ratio':>8}{'comp MB/s':>11}{'decomp MB/s':>13}{'load s':>9}")
+        for r in sorted(report["results"], key=lambda r: r["load_seconds"]):
+            print(f"{r['codec']:<16}{r['bytes'] / 1024:>10.0f}{r['ratio']:>8}"
+                  f"{r['compress_mb_s'] if r['compress_mb_s'] is not None else '-':>11}"
+                  f"{r['decompress_mb_s'] if r['decompress_mb_s'] is not None else '-':>13}{r['load_seconds']:>9}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(reports, f, indent=2)
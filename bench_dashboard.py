@@ -0,0 +1,296 @@
+"""
+Load-test harness for the dashboard: drives productStoreappMain.py headlessly
+with Streamlit's AppTest harness, many simulated sessions open at once,
+against synthetic snapshots, and reports rerun latency percentiles and memory
+per session.
+
+    python bench_dashboard.py --rows 10000 100000 1000000 --sessions 50 --backend sqlite
+    python bench_dashboard.py --rows 100000 --baseline bench_dashboard.json --tolerance 0.25
+
+Each session searches, filters by unit, pages through a store, adds products
+to the cart and changes a quantity. AppTest swaps a process-wide runtime in
+and out around every rerun, so reruns cannot overlap: the sessions are
+interleaved one rerun at a time, which keeps all of them (and their state)
+alive together like on a server. The reruns per second and --think-time then
+give an estimate of the users one instance can serve.
+
+Every snapshot size runs in a fresh process, so its memory is measured from a
+clean start. The run fails (exit code 1) when p95 latency or memory per
+session passes --max-p95-ms / --max-session-mb, or regresses past the
+baseline report by more than --tolerance.
+"""
+import argparse
+import gc
+import json
+import logging
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from queue import Empty
+
+from dashboard_profiler import percentile
+from product_store import write_products
+from snapshot_io import iter_snapshot, read_snapshot
+
+APP_PATH = Path(__file__).parent / "productStoreappMain.py"
+TEMPLATE_SNAPSHOT = Path(__file__).parent / "products_25-06-2025.7z"
+
+SEARCH_TERMS = ["lapte", "apa", "bere", "paine", "cafea", "ciocolata", "branza", "suc", "ou", "detergent"]
+
+def _rss_mb():
+    # Current resident set size; ru_maxrss (peak) where /proc is not available
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def synthetic_products(rows, template=TEMPLATE_SNAPSHOT, seed=1):
+    """Yield rows products resampled from a real snapshot, with fresh ids and jittered prices"""
+    base = read_snapshot(template)
+    rng = random.Random(seed)
+    for i in range(rows):
+        record = dict(base[i % len(base)])
+        if i >= len(base):
+            factor = rng.uniform(0.8, 1.25)
+            # Title is part of product_uuid, which must stay unique per store
+            record["Title"] = f"{record['Title']} #{i // len(base)}"
+            record["Prod ID"] = f"{record['Prod ID']}-{i // len(base)}"
+            record["Product Link"] = f"{record['Product Link']}-{i // len(base)}"
+            record["Current Price"] = round(record["Current Price"] * factor, 2)
+            record["MetrPrice"] = round(record["MetrPrice"] * factor, 2)
+        yield record
+
+def write_fixture(rows, workdir, backend, template=TEMPLATE_SNAPSHOT):
+    """Write the synthetic snapshot (and database) and point the app at them"""
+    # Streamed record by record, so a million rows never sit in memory here
+    snapshot_path = Path(workdir) / "products_synthetic.json"
+    with open(snapshot_path, "w", encoding="utf-8") as f:
+        f.write("[")
+        for i, record in enumerate(synthetic_products(rows, template)):
+            f.write(("," if i else "") + json.dumps(record, ensure_ascii=False))
+        f.write("]")
+    db_path = Path(workdir) / "products.sqlite"
+    if backend == "sqlite":
+        write_products(db_path, iter_snapshot(snapshot_path), snapshot_path.name)
+
+    os.environ["GROCERY_SNAPSHOT"] = str(snapshot_path)
+    os.environ["GROCERY_PRODUCT_DB"] = str(db_path)  # absent for the dataframe backend
+    os.environ.pop("GROCERY_PROFILE", None)
+
+def _share_script_cache():
+    # AppTest compiles the script with a fresh ScriptCache on every rerun; a
+    # real server compiles it once for all sessions, so do the same here
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.testing.v1 import local_script_runner
+
+    shared = ScriptCache()
+    local_script_runner.ScriptCache = lambda: shared
+
+class Session:
+    """One simulated user, recording the latency of each rerun by action"""
+    def __init__(self, seed, timeout):
+        from streamlit.testing.v1 import AppTest
+
+        self.rng = random.Random(seed)
+        self.app = AppTest.from_file(str(APP_PATH), default_timeout=timeout)
+        self.latencies = {}
+        self.errors = 0
+
+    def _timed(self, action, widget_or_app):
+        start = time.perf_counter()
+        widget_or_app.run()
+        self.latencies.setdefault(action, []).append((time.perf_counter() - start) * 1000)
+        if self.app.exception:
+            self.errors += 1
+
+    def scenario(self):
+        """The user's actions, one rerun per step"""
+        app = self.app
+        self._timed("initial", app)
+        yield
+        self._timed("search", app.text_input[0].input(self.rng.choice(SEARCH_TERMS)))
+        yield
+
+        units = app.multiselect[0].options
+        if units:
+            self._timed("filter", app.multiselect[0].select(self.rng.choice(units)))
+            yield
+
+        # Pagers are only shown for stores with more than one page
+        pagers = [w for w in app.number_input if str(w.key).startswith("page_")]
+        if pagers:
+            self._timed("page", self.rng.choice(pagers).set_value(2))
+            yield
+
+        for _ in range(2):
+            boxes = [w for w in app.checkbox if not w.value]
+            if boxes:
+                self._timed("add_to_cart", self.rng.choice(boxes).check())
+                yield
+
+        plus = [b for b in app.button if str(b.key).startswith("inc_")]
+        if plus:
+            self._timed("change_quantity", plus[0].click())
+            yield
+
+        if app.multiselect[0].value:
+            self._timed("clear_filter", app.multiselect[0].set_value([]))
+            yield
+
+def run_sessions(sessions):
+    """Step all sessions round-robin, one rerun at a time, until each is done"""
+    active = [session.scenario() for session in sessions]
+    while active:
+        active = [steps for steps in active if next(steps, StopIteration) is not StopIteration]
+
+def session_memory_mb(count, timeout):
+    """Memory held per open session, traced in a separate pass so tracing does not slow the timed one"""
+    gc.collect()
+    tracemalloc.start()
+    sessions = [Session(10000 + seed, timeout) for seed in range(count)]
+    run_sessions(sessions)
+    gc.collect()
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return retained / count / (1024 * 1024)
+
+def run_size(rows, sessions, backend, timeout=600, template=TEMPLATE_SNAPSHOT, think_time=10.0):
+    """Benchmark one snapshot size in the current process and return its report"""
+    with tempfile.TemporaryDirectory() as workdir:
+        start = time.perf_counter()
+        write_fixture(rows, workdir, backend, template)
+        fixture_seconds = time.perf_counter() - start
+        _share_script_cache()
+        gc.collect()
+        rss_start = _rss_mb()
+
+        # A first session loads the data into the shared caches
+        warmup = Session(0, timeout)
+        start = time.perf_counter()
+        warmup._timed("cold_start", warmup.app)
+        cold_start_ms = (time.perf_counter() - start) * 1000
+        gc.collect()
+        rss_warm = _rss_mb()
+
+        simulated = [Session(seed, timeout) for seed in range(1, sessions + 1)]
+        start = time.perf_counter()
+        run_sessions(simulated)
+        elapsed = time.perf_counter() - start
+        gc.collect()
+        rss_end = _rss_mb()
+        session_mb = session_memory_mb(min(sessions, 10), timeout)
+
+    by_action = {}
+    for session in simulated:
+        for action, values in session.latencies.items():
+            by_action.setdefault(action, []).extend(values)
+    all_reruns = [value for values in by_action.values() for value in values]
+
+    def stats(values):
+        return {"count": len(values), "p50_ms": round(percentile(values, 50), 1),
+                "p95_ms": round(percentile(values, 95), 1), "p99_ms": round(percentile(values, 99), 1),
+                "max_ms": round(max(values), 1)}
+
+    return {
+        "rows": rows,
+        "backend": backend,
+        "sessions": sessions,
+        "fixture_seconds": round(fixture_seconds, 2),
+        "cold_start_ms": round(cold_start_ms, 1),
+        "seconds": round(elapsed, 2),
+        "reruns_per_second": round(len(all_reruns) / elapsed, 2),
+        # Users rerunning once per think_time seconds that keep the instance busy
+        "estimated_users": int(len(all_reruns) / elapsed * think_time),
+        "errors": sum(session.errors for session in simulated),
+        "reruns": stats(all_reruns),
+        "actions": {action: stats(values) for action, values in sorted(by_action.items())},
+        "rss_start_mb": round(rss_start, 1),
+        "data_mb": round(rss_warm - rss_start, 1),
+        "sessions_rss_mb": round(rss_end - rss_warm, 1),
+        "session_mb": round(session_mb, 2),
+    }
+
+def _run_size_worker(queue, *args):
+    # Streamlit warns about the app's unlabeled pager on every rerun
+    logging.disable(logging.WARNING)
+    queue.put(run_size(*args))
+
+def run_isolated(*args):
+    """run_size in a fresh process so memory figures do not carry over between sizes"""
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    worker = ctx.Process(target=_run_size_worker, args=(queue,) + args)
+    worker.start()
+    while True:
+        try:
+            report = queue.get(timeout=1)
+            break
+        except Empty:
+            if not worker.is_alive():
+                raise RuntimeError(f"Benchmark worker exited with code {worker.exitcode}")
+    worker.join()
+    return report
+
+def check_regressions(reports, max_p95_ms=None, max_session_mb=None, baseline=None, tolerance=0.25):
+    """Threshold and baseline violations, as readable messages"""
+    failures = []
+    previous = {(r["rows"], r["backend"]): r for r in (baseline or [])}
+    for report in reports:
+        label = f"{report['rows']} rows ({report['backend']})"
+        p95, session_mb = report["reruns"]["p95_ms"], report["session_mb"]
+        if report["errors"]:
+            failures.append(f"{label}: {report['errors']} reruns raised an exception")
+        if max_p95_ms is not None and p95 > max_p95_ms:
+            failures.append(f"{label}: p95 {p95} ms > {max_p95_ms} ms")
+        if max_session_mb is not None and session_mb > max_session_mb:
+            failures.append(f"{label}: {session_mb} MB per session > {max_session_mb} MB")
+        old = previous.get((report["rows"], report["backend"]))
+        if old:
+            if p95 > old["reruns"]["p95_ms"] * (1 + tolerance):
+                failures.append(f"{label}: p95 {p95} ms regressed from {old['reruns']['p95_ms']} ms")
+            # Ignore changes of a few kilobytes on tiny sessions
+            if session_mb > max(old["session_mb"] * (1 + tolerance), old["session_mb"] + 0.05):
+                failures.append(f"{label}: {session_mb} MB per session regressed from {old['session_mb']} MB")
+    return failures
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test the dashboard with simulated sessions")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000], help="synthetic snapshot sizes")
+    parser.add_argument("--sessions", type=int, default=20, help="simulated sessions kept open together")
+    parser.add_argument("--think-time", type=float, default=10.0, help="seconds between a user's interactions, for the capacity estimate")
+    parser.add_argument("--backend", choices=["sqlite", "dataframe"], default="sqlite")
+    parser.add_argument("--template", default=str(TEMPLATE_SNAPSHOT), help="real snapshot the synthetic rows are drawn from")
+    parser.add_argument("--timeout", type=float, default=600, help="seconds allowed for a single rerun")
+    parser.add_argument("--max-p95-ms", type=float)
+    parser.add_argument("--max-session-mb", type=float)
+    parser.add_argument("--baseline", help="earlier --output report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed regression over the baseline")
+    parser.add_argument("--output", help="write the reports as JSON to this file")
+    args = parser.parse_args()
+
+    reports = []
+    for rows in args.rows:
+        report = run_isolated(rows, args.sessions, args.backend, args.timeout, args.template, args.think_time)
+        print(json.dumps(report, indent=2))
+        reports.append(report)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(reports, f, indent=2)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    failures = check_regressions(reports, args.max_p95_ms, args.max_session_mb, baseline, args.tolerance)
+    for failure in failures:
+        print(f"FAIL {failure}")
+    sys.exit(1 if failures else 0)
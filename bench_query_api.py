@@ -0,0 +1,181 @@
+"""
+Throughput and latency benchmark of query_api.py: a server process and many
+concurrent keep-alive clients replaying a mix of dashboard queries (search,
+filter options, store counts, store pages, cart lookups).
+
+    python bench_query_api.py --clients 1 8 32 --duration 10
+    python bench_query_api.py --db products.sqlite --output bench_query_api.json
+
+Each client count runs three ways:
+- uncached: response cache off, every request queries SQLite
+- cached: the LRU cache warmed by a first pass over the workload
+- revalidate: clients already hold the ETags of the warm-up pass, send them
+  in If-None-Match and get 304 without a body
+Without --db the database is built from the template snapshot in a
+temporary directory.
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+from urllib.parse import urlencode
+
+import query_api
+from dashboard_profiler import percentile
+from product_store import write_products
+from snapshot_io import read_snapshot
+
+TEMPLATE_SNAPSHOT = Path(__file__).parent / "products_25-06-2025.7z"
+SEARCH_TERMS = ["lapte", "apa", "bere", "paine", "cafea", "ciocolata", "branza", "suc", "ou", "detergent"]
+MODES = ["uncached", "cached", "revalidate"]
+
+def workload(db_path, size=500, seed=1):
+    """Request paths shaped like the dashboard's: options, counts and pages under random filters, lookups"""
+    conn = sqlite3.connect(db_path)
+    try:
+        stores = [r[0] for r in conn.execute("SELECT name FROM stores ORDER BY position")]
+        units = [r[0] for r in conn.execute("SELECT DISTINCT unit FROM products WHERE unit IS NOT NULL")]
+        categories = [r[0] for r in conn.execute("SELECT DISTINCT cathegori FROM products WHERE cathegori IS NOT NULL")]
+        uuids = [r[0] for r in conn.execute("SELECT product_uuid FROM products ORDER BY RANDOM() LIMIT 200")]
+    finally:
+        conn.close()
+
+    rng = random.Random(seed)
+    paths = []
+    for _ in range(size):
+        filters = []
+        if rng.random() < 0.6:
+            filters.append(("search", rng.choice(SEARCH_TERMS)))
+        if rng.random() < 0.3:
+            filters.append(("unit", rng.choice(units)))
+        if rng.random() < 0.3:
+            filters.append(("category", rng.choice(categories)))
+        kind = rng.random()
+        if kind < 0.15:
+            paths.append("/options?" + urlencode(filters[:1]))
+        elif kind < 0.35:
+            paths.append("/counts?" + urlencode(filters))
+        elif kind < 0.9:
+            page = [("store", rng.choice(stores)), ("page", rng.randint(1, 3)), ("per_page", 30)]
+            paths.append("/products?" + urlencode(page + filters))
+        else:
+            paths.append("/lookup?" + urlencode([("uuid", u) for u in rng.sample(uuids, 10)]))
+    return paths
+
+def _client(port, paths, deadline, etags, latencies, counts, errors):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    try:
+        i = 0
+        while time.perf_counter() < deadline:
+            path = paths[i % len(paths)]
+            i += 1
+            headers = {"If-None-Match": etags[path]} if etags is not None and path in etags else {}
+            start = time.perf_counter()
+            conn.request("GET", path, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            latencies.append(time.perf_counter() - start)
+            counts[response.status] = counts.get(response.status, 0) + 1
+            if etags is not None and response.getheader("ETag"):
+                etags[path] = response.getheader("ETag")
+    except Exception as e:
+        errors.append(str(e))
+    finally:
+        conn.close()
+
+def run_clients(port, paths, clients, duration, etags=None, seed=1):
+    """
+    Requests per second and latency percentiles of clients hammering the server
+    for duration seconds; with etags ({path: ETag}), clients revalidate
+    """
+    rng = random.Random(seed)
+    latencies, counts, errors = [], {}, []
+    deadline = time.perf_counter() + duration
+    threads = []
+    for _ in range(clients):
+        # Every client walks the workload from its own starting point
+        offset = rng.randrange(len(paths))
+        threads.append(threading.Thread(target=_client, args=(
+            port, paths[offset:] + paths[:offset], deadline, None if etags is None else dict(etags),
+            latencies, counts, errors)))
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return {
+        "clients": clients,
+        "requests": len(latencies),
+        "requests_per_second": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2) if latencies else None,
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2) if latencies else None,
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2) if latencies else None,
+        "statuses": {str(status): count for status, count in sorted(counts.items())},
+        "errors": len(errors),
+    }
+
+def _start_server(db_path, port, cache_size):
+    ready = multiprocessing.Event()
+    server = multiprocessing.Process(target=query_api.serve, args=(db_path, "127.0.0.1", port, None, cache_size, ready),
+                                     daemon=True)
+    server.start()
+    if not ready.wait(30):
+        server.terminate()
+        raise RuntimeError("Query API did not start")
+    return server
+
+def bench(db_path, client_counts, duration, port=8800):
+    paths = workload(db_path)
+    reports = []
+    for mode in MODES:
+        server = _start_server(db_path, port, 0 if mode == "uncached" else query_api.RESPONSE_CACHE_SIZE)
+        try:
+            etags = {}
+            if mode != "uncached":
+                # Fill the cache (and the clients' ETags) with one pass over the workload
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+                for path in paths:
+                    conn.request("GET", path)
+                    response = conn.getresponse()
+                    response.read()
+                    etags[path] = response.getheader("ETag")
+                conn.close()
+            for clients in client_counts:
+                report = run_clients(port, paths, clients, duration, etags if mode == "revalidate" else None)
+                report["mode"] = mode
+                reports.append(report)
+                print(f"{mode:<12}{clients:>8}{report['requests_per_second']:>10}{report['p50_ms']:>9}"
+                      f"{report['p95_ms']:>9}{report['p99_ms']:>9}  {report['statuses']}")
+        finally:
+            server.terminate()
+            server.join()
+    return reports
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the query API with concurrent clients")
+    parser.add_argument("--db", help="product database (default: built from --template)")
+    parser.add_argument("--template", default=str(TEMPLATE_SNAPSHOT))
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per measurement")
+    parser.add_argument("--port", type=int, default=8800)
+    parser.add_argument("--output", help="write the reports as JSON to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = args.db
+        if db_path is None:
+            db_path = str(Path(workdir) / "products.sqlite")
+            write_products(db_path, read_snapshot(args.template), Path(args.template).name)
+        print(f"{'mode':<12}{'clients':>8}{'req/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+        reports = bench(db_path, args.clients, args.duration, args.port)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(reports, f, indent=2)
@@ -0,0 +1,121 @@
+"""
+Load-test harness for the scraper: runs store_scraper.main against a local
+mock_wolt_api server and reports pages/sec, items/sec, retries and peak memory.
+
+    python bench_scraper.py --categories 20 --items-per-category 200 --rate-429 0.02 --output report.json
+    python bench_scraper.py --venues 24 --latency-ms 50 --workers 1 2 4 8   # crawl queue scaling
+
+The server runs in its own process so its memory and CPU are not counted.
+main() runs in a temporary directory, so nothing is written to the repo.
+"""
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+import urllib.request
+
+import mock_wolt_api
+import store_scraper
+
+def _peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def run_benchmark(config, port=8765, request_timeout=2.0, quiet=True, workers=None):
+    """Crawl the mock API once (through the crawl queue with workers) and return the benchmark report"""
+    ready = multiprocessing.Event()
+    server = multiprocessing.Process(target=mock_wolt_api.serve, args=(config, "127.0.0.1", port, ready), daemon=True)
+    server.start()
+    if not ready.wait(10):
+        server.terminate()
+        raise RuntimeError("Mock Wolt API did not start")
+
+    try:
+        store_scraper.venue_urls = mock_wolt_api.venue_url_templates("127.0.0.1", port, config)
+        store_scraper.REQUEST_TIMEOUT = request_timeout
+
+        rss_before = _peak_rss_mb()
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as workdir:
+            os.chdir(workdir)
+            try:
+                output = open(os.devnull, "w") if quiet else sys.stdout
+                with contextlib.redirect_stdout(output):
+                    start = time.perf_counter()
+                    products = store_scraper.main(workers=workers)
+                    elapsed = time.perf_counter() - start
+            finally:
+                os.chdir(cwd)
+
+        run_report = store_scraper.metrics.report()
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/__stats") as response:
+            server_stats = json.load(response)
+    finally:
+        server.terminate()
+        server.join()
+
+    return {
+        "venues": len(config.venues),
+        "workers": workers,
+        "categories_per_venue": config.categories,
+        "items_per_category": config.items_per_category,
+        "seconds": round(elapsed, 3),
+        "pages": server_stats["pages"],
+        "pages_per_second": round(server_stats["pages"] / elapsed, 2),
+        "crawl_pages_per_second": round(server_stats["pages"] / run_report["phases_seconds"]["crawl"], 2),
+        "items_served": server_stats["items"],
+        "items_per_second": round(server_stats["items"] / elapsed, 2),
+        "unique_products": len(products),
+        "requests": server_stats["requests"] - 1,  # minus the /__stats call
+        "retries": run_report["totals"]["retries"],
+        "injected_429": server_stats["injected_429"],
+        "injected_timeouts": server_stats["injected_timeouts"],
+        "bytes_received": server_stats["bytes_sent"],
+        "rss_before_mb": round(rss_before, 1),
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+        "phases_seconds": run_report["phases_seconds"],
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the scraper against a local mock Wolt API")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--venues", type=int, default=len(mock_wolt_api.DEFAULT_VENUES))
+    parser.add_argument("--categories", type=int, default=10)
+    parser.add_argument("--items-per-category", type=int, default=100)
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--duplicate-rate", type=float, default=0.05)
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--timeout-rate", type=float, default=0.0)
+    parser.add_argument("--timeout-delay", type=float, default=3.0, help="stall of an injected timeout (longer than --request-timeout)")
+    parser.add_argument("--request-timeout", type=float, default=2.0, help="client timeout used by the scraper during the run")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--verbose", action="store_true", help="show the scraper's own output")
+    parser.add_argument("--workers", type=int, nargs="+", help="crawl through the job queue with these worker counts, one run each")
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    args = parser.parse_args()
+
+    config = mock_wolt_api.MockConfig(
+        mock_wolt_api.venue_slugs(args.venues), args.categories, args.items_per_category, args.page_size,
+        args.duplicate_rate, args.rate_429, args.timeout_rate, args.timeout_delay, args.latency_ms,
+        args.latency_sigma, args.seed)
+    if args.workers:
+        report = [run_benchmark(config, args.port, args.request_timeout, not args.verbose, workers) for workers in args.workers]
+        # The crawl phase only: writing the snapshot afterwards does not depend on the workers
+        print(f"{'workers':>8}{'crawl s':>10}{'pages/s':>10}{'speedup':>9}")
+        for run in report:
+            print(f"{run['workers']:>8}{run['phases_seconds']['crawl']:>10}{run['crawl_pages_per_second']:>10}"
+                  f"{run['crawl_pages_per_second'] / report[0]['crawl_pages_per_second']:>9.2f}")
+    else:
+        report = run_benchmark(config, args.port, args.request_timeout, quiet=not args.verbose)
+        print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,262 @@
+"""
+Materialized "best value" index: the top k products by MetrPrice per
+(Cathegori, Unit), over all stores and per store.
+
+MetrPrice is the price per g, ml or piece, so a product is only ranked
+against products sold in the same unit. Products without a usable MetrPrice
+(no quantity, or LowValFlag "Low": a misread quantity) are left out.
+
+The index lives in best_value.sqlite. When a new snapshot lands, only the
+groups its changes against the indexed snapshot can move are ranked again
+(changes as produced by snapshot_diff): groups where a ranked product left
+or changed, and groups a new or repriced product now beats the last ranked
+product of. Every other group keeps its rows.
+
+    python best_value_index.py build products_25-06-2025.7z
+    python best_value_index.py update products_26-06-2025.7z [--changes changes.jsonl]
+    python best_value_index.py show "Dairy & Eggs" ml [--stores penny kaufland-pantelimon]
+"""
+import heapq
+import json
+import sqlite3
+from pathlib import Path
+
+from snapshot_diff import merge_join, sorted_records
+from snapshot_io import iter_snapshot
+
+BEST_VALUE_DB = "best_value.sqlite"
+
+# Products kept per group
+TOP_K = 10
+
+# Scope of the groups that rank every store together
+ALL_STORES = ""
+
+# Changed fields that can move a product in its ranking
+RANK_FIELDS = {"Current Price", "Quantity", "Unit", "Cathegori"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS best_value (
+    cathegori TEXT NOT NULL,
+    unit TEXT NOT NULL,
+    scope TEXT NOT NULL,
+    rank INTEGER NOT NULL,
+    store TEXT NOT NULL,
+    prod_id TEXT NOT NULL,
+    title TEXT,
+    current_price REAL,
+    quantity REAL,
+    metr_price REAL,
+    image_url TEXT,
+    product_link TEXT,
+    PRIMARY KEY (cathegori, unit, scope, rank)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS best_value_meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+# (snapshot field, column) of the rows returned by best_value
+RESULT_COLUMNS = [
+    ("Store", "store"),
+    ("Prod ID", "prod_id"),
+    ("Title", "title"),
+    ("Current Price", "current_price"),
+    ("Quantity", "quantity"),
+    ("Unit", "unit"),
+    ("MetrPrice", "metr_price"),
+    ("Image URL", "image_url"),
+    ("Product Link", "product_link"),
+]
+
+def connect(db_path=BEST_VALUE_DB):
+    conn = sqlite3.connect(db_path)
+    conn.executescript(SCHEMA)
+    return conn
+
+def is_ranked(product):
+    metr_price = product.get("MetrPrice")
+    return (bool(metr_price) and metr_price > 0 and product.get("LowValFlag") != "Low"
+            and bool(product.get("Cathegori")) and bool(product.get("Unit")))
+
+def product_groups(product):
+    """(Cathegori, Unit, scope) of the two groups a product is ranked in"""
+    category, unit = product.get("Cathegori"), product.get("Unit")
+    return [(category, unit, ALL_STORES), (category, unit, product.get("Store"))]
+
+def _rank_key(product):
+    # Ties go to (Store, Prod ID) order, so a group ranks the same whatever the product order
+    return product["MetrPrice"], product.get("Store"), product.get("Prod ID")
+
+def rank_groups(products, groups=None, k=TOP_K):
+    """{group: its k lowest MetrPrice products} for the given groups (all of them by default)"""
+    members = {}
+    for product in products:
+        if not is_ranked(product):
+            continue
+        for group in product_groups(product):
+            if groups is None or group in groups:
+                members.setdefault(group, []).append(product)
+    return {group: heapq.nsmallest(k, group_members, key=_rank_key) for group, group_members in members.items()}
+
+def _write_groups(conn, ranked, groups):
+    """Replace the rows of groups with their ranked products"""
+    conn.executemany("DELETE FROM best_value WHERE cathegori = ? AND unit = ? AND scope = ?", groups)
+    conn.executemany("INSERT INTO best_value VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", (
+        (category, unit, scope, rank, p.get("Store"), p.get("Prod ID"), p.get("Title"), p.get("Current Price"),
+         p.get("Quantity"), p.get("MetrPrice"), p.get("Image URL"), p.get("Product Link"))
+        for category, unit, scope in groups
+        for rank, p in enumerate(ranked.get((category, unit, scope), []), 1)))
+
+def _set_meta(conn, snapshot, k):
+    conn.executemany("INSERT OR REPLACE INTO best_value_meta VALUES (?, ?)",
+                     [("snapshot", str(snapshot) if snapshot else None), ("k", str(k))])
+
+def _group_count(conn):
+    return conn.execute("SELECT COUNT(*) FROM (SELECT DISTINCT cathegori, unit, scope FROM best_value)").fetchone()[0]
+
+def build_index(db_path, products, snapshot=None, k=TOP_K):
+    """Rank every group of a snapshot from scratch; returns the counts"""
+    ranked = rank_groups(products, k=k)
+    conn = connect(db_path)
+    try:
+        with conn:
+            conn.execute("DELETE FROM best_value")
+            _write_groups(conn, ranked, list(ranked))
+            _set_meta(conn, snapshot, k)
+        return {"groups": len(ranked), "recomputed": len(ranked), "changes": None}
+    finally:
+        conn.close()
+
+def touched_groups(conn, changes, products_by_key, k=TOP_K):
+    """Groups whose top k a changeset (snapshot_diff entries) can move"""
+    ranked_in = {}
+    for store, prod_id, category, unit, scope in conn.execute(
+            "SELECT store, prod_id, cathegori, unit, scope FROM best_value"):
+        ranked_in.setdefault((store, prod_id), []).append((category, unit, scope))
+    last_ranked = {(category, unit, scope): (count, worst) for category, unit, scope, count, worst in conn.execute(
+        "SELECT cathegori, unit, scope, COUNT(*), MAX(metr_price) FROM best_value GROUP BY cathegori, unit, scope")}
+
+    touched = set()
+    for entry in changes:
+        key = tuple(entry["key"])
+        # A ranked product that left or changed is replaced or shown with its new values
+        touched.update(ranked_in.get(key, ()))
+        product = products_by_key.get(key)
+        if product is None or not is_ranked(product):
+            continue
+        if entry["op"] == "changed" and not RANK_FIELDS & entry["fields"].keys():
+            continue
+        # Elsewhere it only matters if it makes the top k
+        for group in product_groups(product):
+            count, worst = last_ranked.get(group, (0, None))
+            if count < k or product["MetrPrice"] <= worst:
+                touched.add(group)
+    return touched
+
+def update_index(db_path, products, changes, snapshot=None, k=TOP_K):
+    """Rank again only the groups moved by changes against the indexed snapshot; returns the counts"""
+    products = list(products)
+    products_by_key = {(p.get("Store"), p.get("Prod ID")): p for p in products}
+    conn = connect(db_path)
+    try:
+        changes = list(changes)
+        touched = touched_groups(conn, changes, products_by_key, k)
+        ranked = rank_groups(products, touched, k) if touched else {}
+        with conn:
+            _write_groups(conn, ranked, sorted(touched))
+            _set_meta(conn, snapshot, k)
+        return {"groups": _group_count(conn), "recomputed": len(touched), "changes": len(changes)}
+    finally:
+        conn.close()
+
+def indexed_snapshot(db_path=BEST_VALUE_DB):
+    """(snapshot, k) the index was last brought to, or (None, None) without an index"""
+    if not Path(db_path).exists():
+        return None, None
+    conn = connect(db_path)
+    try:
+        meta = dict(conn.execute("SELECT key, value FROM best_value_meta"))
+    finally:
+        conn.close()
+    return meta.get("snapshot"), int(meta["k"]) if meta.get("k") else None
+
+def refresh_index(db_path, products, snapshot, k=TOP_K):
+    """
+    Bring the index to a new snapshot: from its diff with the indexed snapshot
+    when that one is still on disk, from scratch otherwise.
+    """
+    previous, previous_k = indexed_snapshot(db_path)
+    if previous and previous_k == k and previous != str(snapshot) and Path(previous).exists():
+        products = list(products)
+        changes = merge_join(sorted_records(iter_snapshot(previous)), sorted_records(products))
+        return update_index(db_path, products, changes, snapshot, k)
+    return build_index(db_path, products, snapshot, k)
+
+def index_groups(db_path=BEST_VALUE_DB):
+    """Sorted (Cathegori, Unit) pairs that have a ranking"""
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT DISTINCT cathegori, unit FROM best_value WHERE scope = ? ORDER BY 1, 2",
+                            (ALL_STORES,)).fetchall()
+    finally:
+        conn.close()
+
+def best_value(db_path, category, unit, stores=None, k=TOP_K):
+    """Best value products of a (Cathegori, Unit), over all stores or only the given ones"""
+    columns = ", ".join(column for _, column in RESULT_COLUMNS)
+    conn = sqlite3.connect(db_path)
+    try:
+        if stores is None:
+            rows = conn.execute(f"SELECT {columns} FROM best_value WHERE cathegori = ? AND unit = ? AND scope = ? "
+                                "ORDER BY rank LIMIT ?", (category, unit, ALL_STORES, k))
+        else:
+            # The top k of some stores is always within their per-store top k
+            placeholders = ", ".join("?" * len(stores))
+            rows = conn.execute(f"SELECT {columns} FROM best_value WHERE cathegori = ? AND unit = ? "
+                                f"AND scope IN ({placeholders}) ORDER BY metr_price, scope, rank LIMIT ?",
+                                (category, unit, *stores, k))
+        return [dict(zip((field for field, _ in RESULT_COLUMNS), row)) for row in rows]
+    finally:
+        conn.close()
+
+def _read_changes(path):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            yield json.loads(line)
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    from snapshot_io import read_snapshot
+
+    parser = argparse.ArgumentParser(description="Top-k best value products per category and unit")
+    parser.add_argument("--db", default=BEST_VALUE_DB)
+    parser.add_argument("--k", type=int, default=TOP_K)
+    sub = parser.add_subparsers(dest="command", required=True)
+    build_parser = sub.add_parser("build", help="index a snapshot from scratch")
+    build_parser.add_argument("snapshot")
+    update_parser = sub.add_parser("update", help="move the index to a newer snapshot")
+    update_parser.add_argument("snapshot")
+    update_parser.add_argument("--changes", help="snapshot_diff changeset from the indexed snapshot (computed if omitted)")
+    show_parser = sub.add_parser("show", help="print the best value products of a category and unit")
+    show_parser.add_argument("category")
+    show_parser.add_argument("unit")
+    show_parser.add_argument("--stores", nargs="+")
+    args = parser.parse_args()
+
+    if args.command == "show":
+        for rank, row in enumerate(best_value(args.db, args.category, args.unit, args.stores, args.k), 1):
+            print(f"{rank:>3}. {row['MetrPrice']:.5f} LEI/{row['Unit']}  {row['Current Price']} LEI / "
+                  f"{row['Quantity']} {row['Unit']}  {row['Title']} ({row['Store']})")
+    else:
+        start = time.perf_counter()
+        products = read_snapshot(args.snapshot)
+        if args.command == "build":
+            stats = build_index(args.db, products, args.snapshot, args.k)
+        elif args.changes:
+            stats = update_index(args.db, products, _read_changes(args.changes), args.snapshot, args.k)
+        else:
+            stats = refresh_index(args.db, products, args.snapshot, args.k)
+        source = "" if stats["changes"] is None else f" from {stats['changes']} changes"
+        print(f"Ranked {stats['recomputed']} of {stats['groups']} groups{source} "
+              f"in {time.perf_counter() - start:.2f} seconds")
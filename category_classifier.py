@@ -0,0 +1,205 @@
+"""
+Title-keyword classifier for the products data_getting files under
+"Miscellaneous" (their Wolt category has no entry in finalusechateg.json).
+
+category_keywords.json is a list of {"Keyword", "Category"} rules. A keyword
+is one or more whole words of the normalized title (lowercase, no diacritics,
+letters and digits only); a trailing * lets its last word match any word
+starting with it ("ciocolat*" matches "ciocolata" and "ciocolatei"). All the
+rules are compiled into one Aho-Corasick automaton, so a title is scanned
+once however many keywords there are. Every hit scores its number of words
+for its category; the best score wins, and a tie goes to the category hit
+first (titles start with the product type: "Iaurt bio ...").
+
+    python category_classifier.py products_25-06-2025.7z           # what the Miscellaneous products become
+    python category_classifier.py products_25-06-2025.7z --bench   # titles per second, 1..N processes
+"""
+import json
+import os
+import re
+import time
+import unicodedata
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+
+KEYWORDS_FILE = Path(__file__).parent / "category_keywords.json"
+FALLBACK_CATEGORY = "Miscellaneous"
+
+# Titles per task handed to a worker process
+CHUNK_SIZE = 2000
+
+# Every character a normalized title can hold
+ALPHABET = "abcdefghijklmnopqrstuvwxyz0123456789 "
+
+# Romanian diacritics, folded without going through unicodedata
+_FOLD = str.maketrans("ăâîșşțţ", "aaisstt")
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+
+def normalize_title(title):
+    """Lowercase words of a title without diacritics, with a space on each side"""
+    text = title.lower().translate(_FOLD)
+    if not text.isascii():
+        text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii")
+    return f" {_NON_WORD.sub(' ', text).strip()} "
+
+class KeywordAutomaton:
+    """Aho-Corasick automaton over ALPHABET with every transition precomputed"""
+    def __init__(self, patterns):
+        goto, outputs = [{}], [()]
+        for index, pattern in enumerate(patterns):
+            state = 0
+            for char in pattern:
+                if char not in goto[state]:
+                    goto[state][char] = len(goto)
+                    goto.append({})
+                    outputs.append(())
+                state = goto[state][char]
+            outputs[state] += (index,)
+
+        # Breadth first, so a state's failure state (always shallower) is complete
+        # before the state copies its transitions and outputs
+        fail = [0] * len(goto)
+        delta = [None] * len(goto)
+        delta[0] = {char: goto[0].get(char, 0) for char in ALPHABET}
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            outputs[state] += outputs[fail[state]]
+            delta[state] = {**delta[fail[state]], **goto[state]}
+            for char, child in goto[state].items():
+                fail[child] = delta[fail[state]][char]
+                queue.append(child)
+
+        self._delta = delta
+        self._outputs = outputs
+        self.states = len(goto)
+
+    def matches(self, text):
+        """(end position, pattern index) of every occurrence in a normalized text"""
+        delta, outputs = self._delta, self._outputs
+        found = []
+        state = 0
+        for position, char in enumerate(text):
+            state = delta[state][char]
+            if outputs[state]:
+                found.extend((position, index) for index in outputs[state])
+        return found
+
+class CategoryClassifier:
+    """Category of a product title from the keyword rules"""
+    def __init__(self, rules):
+        patterns, self._rules = [], []
+        for rule in rules:
+            keyword = rule["Keyword"].strip()
+            words = normalize_title(keyword.rstrip("*")).split()
+            if not words:
+                continue
+            # The closing space makes the last word whole, unless it is a prefix
+            patterns.append(" " + " ".join(words) + ("" if keyword.endswith("*") else " "))
+            self._rules.append((rule["Category"], len(words)))
+        self._automaton = KeywordAutomaton(patterns)
+
+    @classmethod
+    def from_file(cls, path=KEYWORDS_FILE):
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def classify(self, title, default=FALLBACK_CATEGORY):
+        scores, first_hit = {}, {}
+        for position, index in self._automaton.matches(normalize_title(title or "")):
+            category, score = self._rules[index]
+            scores[category] = scores.get(category, 0) + score
+            first_hit.setdefault(category, position)
+        if not scores:
+            return default
+        return max(scores, key=lambda category: (scores[category], -first_hit[category]))
+
+@lru_cache(maxsize=None)
+def load_classifier(path=KEYWORDS_FILE):
+    """Classifier of a rule file, built once per process"""
+    return CategoryClassifier.from_file(path)
+
+def _classify_chunk(args):
+    path, titles = args
+    classifier = load_classifier(path)
+    return [classifier.classify(title, None) for title in titles]
+
+def classify_titles(titles, processes=None, keywords_path=KEYWORDS_FILE, chunk_size=CHUNK_SIZE):
+    """Category of each title (None when no keyword matches), split over processes for large batches"""
+    titles = list(titles)
+    chunks = [(str(keywords_path), titles[i:i + chunk_size]) for i in range(0, len(titles), chunk_size)]
+    # A pool of one worker would only add the cost of pickling the titles
+    workers = processes or min(len(chunks), os.cpu_count() or 1)
+    if workers <= 1:
+        return [category for chunk in chunks for category in _classify_chunk(chunk)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return [category for result in pool.map(_classify_chunk, chunks) for category in result]
+
+def reclassify(products, processes=None, keywords_path=KEYWORDS_FILE):
+    """Give Miscellaneous products the category their title points to; returns how many changed"""
+    pending = [p for p in products if p.get("Cathegori") == FALLBACK_CATEGORY]
+    if not pending:
+        return 0
+    categories = classify_titles([p.get("Title") for p in pending], processes, keywords_path)
+    changed = 0
+    for product, category in zip(pending, categories):
+        if category is not None:
+            product["Cathegori"] = category
+            changed += 1
+    return changed
+
+def bench(titles, process_counts, repeat=3, keywords_path=KEYWORDS_FILE):
+    """Best titles per second of classify_titles for each process count"""
+    load_classifier(str(keywords_path))  # the parent's build is not part of the stage
+    results = {}
+    for processes in process_counts:
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            classify_titles(titles, processes, keywords_path)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        results[processes] = round(len(titles) / best)
+    return results
+
+if __name__ == "__main__":
+    import argparse
+    from collections import Counter
+
+    from snapshot_io import read_snapshot
+
+    parser = argparse.ArgumentParser(description="Classify product titles by keyword")
+    parser.add_argument("snapshot")
+    parser.add_argument("--keywords", default=str(KEYWORDS_FILE), help="rule file")
+    parser.add_argument("--bench", action="store_true", help="time every title of the snapshot")
+    parser.add_argument("--processes", type=int, help="largest process count to benchmark")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    products = read_snapshot(args.snapshot)
+    start = time.perf_counter()
+    classifier = load_classifier(args.keywords)
+    print(f"Built {classifier._automaton.states} states from {len(classifier._rules)} keywords "
+          f"in {time.perf_counter() - start:.3f} seconds")
+
+    if args.bench:
+        titles = [p.get("Title") for p in products]
+        for processes, rate in bench(titles, range(1, (args.processes or os.cpu_count() or 1) + 1),
+                                     args.repeat, args.keywords).items():
+            print(f"{processes} process(es): {rate} titles/s")
+    else:
+        # How often the rules agree with finalusechateg.json where it has an answer
+        mapped = [p for p in products if p.get("Cathegori") != FALLBACK_CATEGORY]
+        guesses = classify_titles([p.get("Title") for p in mapped], args.processes, args.keywords)
+        covered = [(p, g) for p, g in zip(mapped, guesses) if g is not None]
+        agree = sum(p["Cathegori"] == g for p, g in covered)
+        print(f"Mapped products: {len(covered)}/{len(mapped)} matched a keyword, "
+              f"{agree / max(len(covered), 1):.1%} of them in the same category")
+
+        misc = [p for p in products if p.get("Cathegori") == FALLBACK_CATEGORY]
+        changed = reclassify(products, args.processes, args.keywords)
+        print(f"Miscellaneous products: {changed}/{len(misc)} reclassified")
+        for category, count in Counter(p["Cathegori"] for p in misc).most_common():
+            print(f"  {category:<28}{count:>6}")
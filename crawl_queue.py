@@ -0,0 +1,244 @@
+"""
+Durable crawl job queue for running the scraper over many venues with
+several worker processes or machines.
+
+A queue is a directory (one per crawl run) holding queue.sqlite and a
+results/ folder. A job is one (venue, category id): workers lease a job,
+crawl the category with all its pages, write the products to
+results/<venue>/<category id>.json and mark the job done. A lease runs out
+after LEASE_SECONDS unless renewed (the worker renews it after every page),
+so the jobs of a crashed worker go back to the queue; a job that fails
+MAX_ATTEMPTS times is given up.
+
+Wolt category ids are probed in order until one is missing, so a venue
+starts with PROBE_AHEAD jobs and every found (or given up) category adds
+the id PROBE_AHEAD further. The first missing id ends the venue and drops its
+pending jobs beyond it.
+
+Workers on other machines can share the directory as long as its
+filesystem supports SQLite's file locks (the queue does not use WAL for
+that reason). Re-opening a queue resumes it: finished jobs are kept
+(store_scraper.py --workers N --resume).
+
+    python crawl_queue.py crawl_queue/25-06-2025_030000          # job counts by state
+    python crawl_queue.py crawl_queue/25-06-2025_030000 --jobs   # every unfinished job
+"""
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+CRAWL_QUEUE_DIR = "crawl_queue"
+QUEUE_DB = "queue.sqlite"
+RESULTS_DIR = "results"
+
+# Seconds a leased job stays with its worker without a renewal
+LEASE_SECONDS = 300
+# Leases of a job (including expired ones) before it is given up
+MAX_ATTEMPTS = 5
+# Category ids queued ahead of the last one found, per venue
+PROBE_AHEAD = 4
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS venues (
+    slug TEXT PRIMARY KEY,
+    url_template TEXT NOT NULL,
+    priority INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    missing_from INTEGER
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS jobs (
+    venue TEXT NOT NULL,
+    category_id INTEGER NOT NULL,
+    priority INTEGER NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    items INTEGER,
+    error TEXT,
+    PRIMARY KEY (venue, category_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs(state, priority, category_id);
+"""
+
+class CrawlJob:
+    """A leased (venue, category id)"""
+    def __init__(self, venue, category_id, url_template, attempts):
+        self.venue = venue
+        self.category_id = category_id
+        self.url_template = url_template
+        self.attempts = attempts
+
+    @property
+    def url(self):
+        return self.url_template.format(self.category_id)
+
+class CrawlQueue:
+    """Jobs and results of one crawl, shared by every worker through the directory"""
+    def __init__(self, directory, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS, probe_ahead=PROBE_AHEAD):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.probe_ahead = probe_ahead
+        # Transactions are opened explicitly (BEGIN IMMEDIATE) so a lease is atomic
+        self._conn = sqlite3.connect(self.directory / QUEUE_DB, timeout=60, isolation_level=None)
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    @contextmanager
+    def _write(self):
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield self._conn
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    def seed(self, venues):
+        """Queue the first category ids of each (slug, url template, priority); known venues are kept as they are"""
+        with self._write() as conn:
+            offset = conn.execute("SELECT COUNT(*) FROM venues").fetchone()[0]
+            for position, (slug, url_template, priority) in enumerate(venues, offset):
+                if conn.execute("INSERT OR IGNORE INTO venues VALUES (?, ?, ?, ?, NULL)",
+                                (slug, url_template, priority, position)).rowcount:
+                    conn.executemany("INSERT OR IGNORE INTO jobs (venue, category_id, priority) VALUES (?, ?, ?)",
+                                     [(slug, category_id, priority) for category_id in range(1, self.probe_ahead + 1)])
+
+    def lease(self, worker):
+        """Take the next pending (or expired) job for worker, or None when there is none right now"""
+        now = time.time()
+        with self._write() as conn:
+            while True:
+                row = conn.execute("""
+                    SELECT j.venue, j.category_id, v.url_template, j.attempts
+                    FROM jobs j JOIN venues v ON v.slug = j.venue
+                    WHERE j.state = 'pending' OR (j.state = 'leased' AND j.lease_until < ?)
+                    ORDER BY j.priority DESC, j.category_id, v.position
+                    LIMIT 1
+                """, (now,)).fetchone()
+                if row is None:
+                    return None
+                venue, category_id, url_template, attempts = row
+                if attempts < self.max_attempts:
+                    break
+                # An expired lease whose workers never came back, max_attempts times
+                conn.execute("UPDATE jobs SET state = 'failed', worker = NULL, error = 'lease expired' "
+                             "WHERE venue = ? AND category_id = ?", (venue, category_id))
+                self._queue_next(conn, venue, category_id)
+            conn.execute("UPDATE jobs SET state = 'leased', worker = ?, lease_until = ?, attempts = attempts + 1 "
+                         "WHERE venue = ? AND category_id = ?", (worker, now + self.lease_seconds, venue, category_id))
+        return CrawlJob(venue, category_id, url_template, attempts + 1)
+
+    def _finish(self, conn, job, worker, state, **fields):
+        """Close a job still leased by worker; False if the lease was lost to another worker"""
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        return conn.execute(
+            f"UPDATE jobs SET state = ?, worker = NULL, lease_until = NULL{', ' if fields else ''}{assignments} "
+            "WHERE venue = ? AND category_id = ? AND state = 'leased' AND worker = ?",
+            (state, *fields.values(), job.venue, job.category_id, worker)).rowcount == 1
+
+    def renew(self, job, worker):
+        """Extend the lease of a job still being crawled; False if it was lost"""
+        with self._write() as conn:
+            return conn.execute("UPDATE jobs SET lease_until = ? WHERE venue = ? AND category_id = ? "
+                                "AND state = 'leased' AND worker = ?",
+                                (time.time() + self.lease_seconds, job.venue, job.category_id, worker)).rowcount == 1
+
+    def _queue_next(self, conn, venue, category_id):
+        # Every finished id (done or given up) carries the probe chain on, so
+        # one category that keeps failing does not end the ones after it
+        next_id = category_id + self.probe_ahead
+        missing_from, priority = conn.execute("SELECT missing_from, priority FROM venues WHERE slug = ?",
+                                              (venue,)).fetchone()
+        if missing_from is None or next_id < missing_from:
+            conn.execute("INSERT OR IGNORE INTO jobs (venue, category_id, priority) VALUES (?, ?, ?)",
+                         (venue, next_id, priority))
+
+    def result_path(self, venue, category_id):
+        return self.directory / RESULTS_DIR / venue / f"{category_id}.json"
+
+    def complete(self, job, worker, products, slugs, duplicates=0):
+        """Store the products of a crawled category and queue the next id to probe"""
+        # Written before the job is marked done; a job crawled twice writes the same file
+        path = self.result_path(job.venue, job.category_id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{worker}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"products": products, "slugs": slugs, "duplicates": duplicates}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+        with self._write() as conn:
+            if not self._finish(conn, job, worker, "done", items=len(products), error=None):
+                return False
+            self._queue_next(conn, job.venue, job.category_id)
+        return True
+
+    def missing(self, job, worker):
+        """Record that a category id does not exist: the venue has no categories from there on"""
+        with self._write() as conn:
+            if not self._finish(conn, job, worker, "missing"):
+                return False
+            conn.execute("UPDATE venues SET missing_from = MIN(COALESCE(missing_from, ?), ?) WHERE slug = ?",
+                         (job.category_id, job.category_id, job.venue))
+            conn.execute("DELETE FROM jobs WHERE venue = ? AND category_id > ? AND state = 'pending'",
+                         (job.venue, job.category_id))
+        return True
+
+    def fail(self, job, worker, error):
+        """Put a job back for another attempt, or give it up after max_attempts (and probe the next id)"""
+        state = "failed" if job.attempts >= self.max_attempts else "pending"
+        with self._write() as conn:
+            if not self._finish(conn, job, worker, state, error=str(error)[:500]):
+                return False
+            if state == "failed":
+                self._queue_next(conn, job.venue, job.category_id)
+        return True
+
+    def drained(self):
+        """True when no job is pending or being crawled"""
+        return self._conn.execute("SELECT 1 FROM jobs WHERE state IN ('pending', 'leased') LIMIT 1").fetchone() is None
+
+    def counts(self):
+        """{state: number of jobs}"""
+        return dict(self._conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state"))
+
+    def unfinished(self):
+        """(venue, category id, state, worker, attempts, error) of the jobs not done or missing"""
+        return self._conn.execute("SELECT venue, category_id, state, worker, attempts, error FROM jobs "
+                                  "WHERE state NOT IN ('done', 'missing') ORDER BY venue, category_id").fetchall()
+
+    def results(self):
+        """(venue, category id, result) of every done job, in venue seeding order then category id"""
+        rows = self._conn.execute("""
+            SELECT j.venue, j.category_id FROM jobs j JOIN venues v ON v.slug = j.venue
+            WHERE j.state = 'done' AND (v.missing_from IS NULL OR j.category_id < v.missing_from)
+            ORDER BY v.position, j.category_id
+        """).fetchall()
+        for venue, category_id in rows:
+            with open(self.result_path(venue, category_id), "r", encoding="utf-8") as f:
+                yield venue, category_id, json.load(f)
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Inspect a crawl queue")
+    parser.add_argument("directory")
+    parser.add_argument("--jobs", action="store_true", help="list the jobs that are not finished")
+    args = parser.parse_args()
+
+    queue = CrawlQueue(args.directory)
+    try:
+        for state, count in sorted(queue.counts().items()):
+            print(f"{state:<10}{count:>8}")
+        if args.jobs:
+            for venue, category_id, state, worker, attempts, error in queue.unfinished():
+                print(f"{venue} {category_id}: {state} (worker {worker}, attempt {attempts}){f' - {error}' if error else ''}")
+    finally:
+        queue.close()
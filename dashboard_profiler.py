@@ -0,0 +1,116 @@
+"""
+Opt-in timing of the dashboard's reruns.
+
+Enable with GROCERY_PROFILE=1 in the environment or ?profile=1 in the URL.
+Each rerun is split into stages (data load, search/filter options, counts,
+store pages, card rendering, cart). A stage records its wall time and, when
+given the product store, the rows it touched and the DataFrame copies it made
+(the store counts them per thread, so concurrent sessions do not add up).
+The current rerun is shown in a sidebar panel; every rerun also goes into a
+process-wide aggregate that logs p50/p95 per stage every LOG_EVERY reruns.
+"""
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+
+logger = logging.getLogger("grocery_dashboard.profile")
+
+# Reruns kept per stage for the percentiles, and how often they are logged
+WINDOW = 500
+LOG_EVERY = 50
+
+def profiling_enabled(query_params=None):
+    """True when GROCERY_PROFILE is set or the page was opened with ?profile=1"""
+    if os.environ.get("GROCERY_PROFILE", "").lower() in ("1", "true", "yes"):
+        return True
+    return query_params is not None and query_params.get("profile") in ("1", "true")
+
+def percentile(values, q):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+class ProfileAggregate:
+    """Stage timings of the last WINDOW reruns, shared by all sessions"""
+    def __init__(self, window=WINDOW, log_every=LOG_EVERY):
+        self._lock = threading.Lock()
+        self.window = window
+        self.log_every = log_every
+        self.reruns = 0
+        self.stages = {}
+        # Streamlit only configures its own loggers
+        if not logger.handlers:
+            handler = logging.StreamHandler()
+            handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(message)s"))
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+
+    def add(self, rerun):
+        with self._lock:
+            for name, stage in rerun.items():
+                self.stages.setdefault(name, deque(maxlen=self.window)).append(stage["ms"])
+            self.reruns += 1
+            should_log = self.log_every and self.reruns % self.log_every == 0
+        if should_log:
+            for name, summary in self.summary().items():
+                logger.info("%s: p50 %.1f ms, p95 %.1f ms over %d reruns",
+                            name, summary["p50_ms"], summary["p95_ms"], summary["count"])
+
+    def summary(self):
+        with self._lock:
+            samples = {name: list(values) for name, values in self.stages.items()}
+        return {name: {"count": len(values), "p50_ms": percentile(values, 50), "p95_ms": percentile(values, 95)}
+                for name, values in samples.items()}
+
+class RerunProfiler:
+    """Stage timings and counters of a single rerun"""
+    enabled = True
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = {}
+        self._depth = 0
+
+    @contextmanager
+    def stage(self, name, store=None):
+        # Repeated stages (one per store column, ...) add up; nested stages are
+        # also counted in their parent
+        counters = (store.stats["rows"], store.stats["copies"]) if store is not None else None
+        begin = time.perf_counter()
+        self._depth += 1
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            stage = self.stages.setdefault(name, {"ms": 0.0, "calls": 0, "rows": 0, "copies": 0, "depth": self._depth})
+            stage["ms"] += (time.perf_counter() - begin) * 1000
+            stage["calls"] += 1
+            if counters is not None:
+                stage["rows"] += store.stats["rows"] - counters[0]
+                stage["copies"] += store.stats["copies"] - counters[1]
+
+    def finish(self, aggregate=None):
+        """Close the rerun, add it to the aggregate and return its stages"""
+        self.stages["total"] = {"ms": (time.perf_counter() - self.start) * 1000, "calls": 1,
+                                "rows": sum(s["rows"] for s in self.stages.values() if s["depth"] == 0),
+                                "copies": sum(s["copies"] for s in self.stages.values() if s["depth"] == 0),
+                                "depth": 0}
+        if aggregate is not None:
+            aggregate.add(self.stages)
+        return self.stages
+
+class NullProfiler:
+    """Stand-in used when profiling is off, so the hooks cost nothing"""
+    enabled = False
+
+    def stage(self, name, store=None):
+        return nullcontext()
+
+    def finish(self, aggregate=None):
+        return {}
@@ -0,0 +1,216 @@
+"""
+Local stand-in for the Wolt consumer assortment API, for benchmarking and
+regression-testing the scraper without touching consumer-api.wolt.com.
+
+Serves /consumer-api/consumer-assortment/v1/venues/slug/{slug}/assortment/categories/slug/{id}
+with the fields data_getting reads (category, items, metadata.next_page_token).
+Categories past the end of a venue return 404 like the real API. Catalogs are
+generated deterministically from a seed, page by page, so very large catalogs
+cost no memory. 429 responses, timeouts and response latency can be injected.
+
+    python mock_wolt_api.py --port 8765 --categories 40 --items-per-category 200 --rate-429 0.02
+"""
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+API_PREFIX = "/consumer-api/consumer-assortment/v1/venues/slug/"
+PATH_PATTERN = re.compile(r"^/consumer-api/consumer-assortment/v1/venues/slug/([^/]+)/assortment/categories/slug/([^/?]+)$")
+
+DEFAULT_VENUES = [
+    "freshful-now-67ecf9a6e78872a14652406a",
+    "profi-baia-de-arama-3491-67fce8707ec55f4e5199f8d2",
+    "penny-4469-67ee32d9a0c535a55340303e",
+    "auchan-hypermarket-titan-67e2bd731248946a75c7a535",
+    "carrefour-hypermarket-mega-mall-9139-67ee8dde26be843d2832a717",
+    "kaufland-pantelimon-2470-67ecfaaae78872a1465240a6",
+]
+
+CATEGORY_NAMES = ["Lactate", "Brânzeturi", "Apă", "Bere și cidru", "Fructe", "Legume", "Carne", "Dulciuri",
+                  "Cafea", "Conserve", "Panificație", "Detergenți", "Snacks", "Sucuri", "Vin", "Auto"]
+WORDS = ["Lapte", "Iaurt", "Branza", "Apa minerala", "Bere", "Mere", "Rosii", "Piept de pui", "Ciocolata",
+         "Cafea macinata", "Fasole", "Paine", "Detergent", "Chips", "Suc portocale", "Vin rosu"]
+BRANDS = ["Zuzu", "Napolact", "Borsec", "Ursus", "Milka", "Jacobs", "Ariel", "Lays", "Cotnari", "Pambac"]
+QUANTITIES = ["1L", "1.5L", "500 ml", "6X0 33L", "0 5L", "200g", "1kg", "400 GR", "10 buc", "vrac/kg",
+              "vrac/100G", "per bucata", "30 spalari", "10 oua", ""]
+
+class MockConfig:
+    """Catalog shape and fault injection settings"""
+    def __init__(self, venues=None, categories=30, items_per_category=100, page_size=50,
+                 duplicate_rate=0.05, rate_429=0.0, timeout_rate=0.0, timeout_delay=5.0,
+                 latency_ms=0.0, latency_sigma=0.5, seed=1):
+        self.venues = venues or DEFAULT_VENUES
+        self.categories = categories
+        self.items_per_category = items_per_category
+        self.page_size = page_size
+        self.duplicate_rate = duplicate_rate  # share of items repeated from another category
+        self.rate_429 = rate_429
+        self.timeout_rate = timeout_rate      # requests that stall for timeout_delay seconds
+        self.timeout_delay = timeout_delay
+        self.latency_ms = latency_ms          # median of a log-normal latency distribution
+        self.latency_sigma = latency_sigma
+        self.seed = seed
+
+class MockStats:
+    """Counters shared by the request handler threads"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.values = {"requests": 0, "pages": 0, "items": 0, "not_found": 0,
+                       "injected_429": 0, "injected_timeouts": 0, "bytes_sent": 0}
+
+    def add(self, **counts):
+        with self._lock:
+            for name, value in counts.items():
+                self.values[name] += value
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.values)
+
+def _rng(config, *parts):
+    digest = hashlib.blake2b("|".join(str(p) for p in (config.seed,) + parts).encode(), digest_size=8).digest()
+    return random.Random(int.from_bytes(digest, "little"))
+
+def _item(config, venue, category_id, index):
+    # A share of items reuse the id of an item in category 1, as the real API
+    # lists the same product under several categories
+    rng = _rng(config, venue, category_id, index)
+    if category_id > 1 and rng.random() < config.duplicate_rate:
+        return _item(config, venue, 1, index % config.items_per_category)
+
+    item_id = hashlib.blake2b(f"{venue}|{category_id}|{index}".encode(), digest_size=12).hexdigest()
+    price = rng.randint(100, 20000)
+    name = f"{rng.choice(BRANDS)} {rng.choice(WORDS)} {rng.choice(QUANTITIES)}".strip()
+    item = {
+        "id": item_id,
+        "name": name,
+        "description": name,
+        "price": price,
+        "original_price": price + rng.randint(50, 1000) if rng.random() < 0.2 else None,
+        "images": [{"url": f"https://imageproxy.wolt.com/assets/{item_id}"}],
+    }
+    return item
+
+def category_page(config, venue, category_id, page):
+    """Payload of one page of a category, or None past the end of the venue"""
+    if venue not in config.venues or not 1 <= category_id <= config.categories:
+        return None
+    start = page * config.page_size
+    end = min(start + config.page_size, config.items_per_category)
+    name = CATEGORY_NAMES[(category_id - 1) % len(CATEGORY_NAMES)]
+    return {
+        "category": {"name": name, "slug": f"{name.lower().replace(' ', '-')}-{category_id}"},
+        "items": [_item(config, venue, category_id, i) for i in range(start, end)],
+        "metadata": {"next_page_token": str(page + 1) if end < config.items_per_category else None},
+    }
+
+def make_handler(config, stats):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status, payload):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            try:
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            except (BrokenPipeError, ConnectionResetError):
+                # The client gave up on an injected timeout
+                return
+            stats.add(bytes_sent=len(body))
+
+        def do_GET(self):
+            stats.add(requests=1)
+            parsed = urlparse(self.path)
+            if parsed.path == "/__stats":
+                self._send_json(200, stats.snapshot())
+                return
+
+            rng = random.Random()
+            if config.latency_ms:
+                time.sleep(rng.lognormvariate(0, config.latency_sigma) * config.latency_ms / 1000)
+            if rng.random() < config.timeout_rate:
+                stats.add(injected_timeouts=1)
+                time.sleep(config.timeout_delay)
+            if rng.random() < config.rate_429:
+                stats.add(injected_429=1)
+                self._send_json(429, {"detail": "Too Many Requests"})
+                return
+
+            match = PATH_PATTERN.match(parsed.path)
+            payload = None
+            if match:
+                try:
+                    category_id = int(match.group(2))
+                    page = int(parse_qs(parsed.query).get("page_token", ["0"])[0])
+                except ValueError:
+                    category_id, page = 0, 0
+                payload = category_page(config, match.group(1), category_id, page)
+            if payload is None:
+                stats.add(not_found=1)
+                self._send_json(404, {"detail": "Category not found"})
+                return
+
+            stats.add(pages=1, items=len(payload["items"]))
+            self._send_json(200, payload)
+
+    return Handler
+
+def venue_slugs(count):
+    """The real venue slugs, then synthetic ones (the store name is the part before the first digit)"""
+    synthetic = [f"mock-{''.join(chr(97 + int(d)) for d in str(i))}-{i:024x}" for i in range(len(DEFAULT_VENUES), count)]
+    return DEFAULT_VENUES[:count] + synthetic
+
+def venue_url_templates(host, port, config):
+    """venue_urls entries pointing the scraper at the mock server"""
+    return [f"http://{host}:{port}{API_PREFIX}{venue}/assortment/categories/slug/{{}}?language=ro"
+            for venue in config.venues]
+
+def serve(config, host="127.0.0.1", port=8765, ready=None):
+    """Run the mock API until interrupted (ready, if given, is set once listening)"""
+    stats = MockStats()
+    server = ThreadingHTTPServer((host, port), make_handler(config, stats))
+    server.daemon_threads = True
+    if ready is not None:
+        ready.set()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Local mock of the Wolt assortment API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--venues", type=int, default=len(DEFAULT_VENUES), help="number of venues (first N of the real ones, then synthetic)")
+    parser.add_argument("--categories", type=int, default=30)
+    parser.add_argument("--items-per-category", type=int, default=100)
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--duplicate-rate", type=float, default=0.05)
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--timeout-rate", type=float, default=0.0)
+    parser.add_argument("--timeout-delay", type=float, default=5.0)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    venues = venue_slugs(args.venues)
+    config = MockConfig(venues, args.categories, args.items_per_category, args.page_size, args.duplicate_rate,
+                        args.rate_429, args.timeout_rate, args.timeout_delay, args.latency_ms, args.latency_sigma, args.seed)
+    print(f"Mock Wolt API on http://{args.host}:{args.port} serving {len(venues)} venues")
+    serve(config, args.host, args.port)
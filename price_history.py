@@ -0,0 +1,276 @@
+"""
+Append-only price history.
+
+Instead of keeping every daily archive, each snapshot is compared with the
+last known state of every (store, Prod ID) and only the differences are
+stored:
+- price_changes: a row on the days Current Price / Old Price / MetrPrice
+  changed (NULL prices mark the day a product disappeared)
+- product_versions: the remaining fields (a JSON array in ATTR_FIELDS order),
+  only when one of them changed
+Both tables are keyed by (store, prod_id, day), so a product's series is a
+single index range scan and any day can be rebuilt from the latest rows
+on or before it.
+
+A day holds one state per product. When the last stored day is published
+again (a second crawl, or refresh_scheduler ticking several times a day),
+its rows are taken back out and replaced, so the history keeps the latest
+state of every day.
+"""
+import hashlib
+import json
+import sqlite3
+from datetime import date, datetime
+from pathlib import Path
+
+from product_store import COLUMNS
+
+HISTORY_DB = "price_history.sqlite"
+
+PRICE_FIELDS = ["Current Price", "Old Price", "MetrPrice"]
+SNAPSHOT_FIELDS = [field for field, _, _ in COLUMNS if field != "product_uuid"]
+ATTR_FIELDS = [field for field in SNAPSHOT_FIELDS if field not in PRICE_FIELDS]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    day TEXT PRIMARY KEY,
+    source TEXT,
+    rows INTEGER,
+    price_changes INTEGER,
+    attr_changes INTEGER,
+    removed INTEGER,
+    ingested TEXT
+);
+CREATE TABLE IF NOT EXISTS price_changes (
+    store TEXT NOT NULL,
+    prod_id TEXT NOT NULL,
+    day TEXT NOT NULL,
+    current_price REAL,
+    old_price REAL,
+    metr_price REAL,
+    PRIMARY KEY (store, prod_id, day)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_price_changes_day ON price_changes(day);
+CREATE TABLE IF NOT EXISTS product_versions (
+    store TEXT NOT NULL,
+    prod_id TEXT NOT NULL,
+    day TEXT NOT NULL,
+    attrs TEXT NOT NULL,
+    PRIMARY KEY (store, prod_id, day)
+);
+CREATE TABLE IF NOT EXISTS latest (
+    store TEXT NOT NULL,
+    prod_id TEXT NOT NULL,
+    current_price REAL,
+    old_price REAL,
+    metr_price REAL,
+    attrs_hash INTEGER,
+    present INTEGER NOT NULL,
+    PRIMARY KEY (store, prod_id)
+) WITHOUT ROWID;
+"""
+
+def _day_key(day):
+    """Normalize a date / datetime / ISO string to YYYY-MM-DD"""
+    if isinstance(day, datetime):
+        return day.date().isoformat()
+    if isinstance(day, date):
+        return day.isoformat()
+    return date.fromisoformat(day).isoformat()
+
+def connect(db_path=HISTORY_DB):
+    conn = sqlite3.connect(db_path)
+    conn.executescript(SCHEMA)
+    return conn
+
+def _attrs_hash(attrs):
+    return int.from_bytes(hashlib.blake2b(attrs.encode("utf-8"), digest_size=8).digest(), "little", signed=True)
+
+def _undo_day(conn, day):
+    """Take the last stored day out of the history, putting latest back as of the day before"""
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS undone (store TEXT, prod_id TEXT, PRIMARY KEY (store, prod_id)) WITHOUT ROWID")
+    conn.execute("DELETE FROM undone")
+    conn.execute("INSERT OR IGNORE INTO undone SELECT store, prod_id FROM price_changes WHERE day = ?", (day,))
+    conn.execute("INSERT OR IGNORE INTO undone SELECT store, prod_id FROM product_versions WHERE day = ?", (day,))
+    conn.execute("DELETE FROM price_changes WHERE day = ?", (day,))
+    conn.execute("DELETE FROM product_versions WHERE day = ?", (day,))
+    conn.execute("DELETE FROM snapshots WHERE day = ?", (day,))
+
+    # Products first listed that day are forgotten, the others get their previous state
+    previous = conn.execute("""
+        SELECT u.store, u.prod_id, p.current_price, p.old_price, p.metr_price, v.attrs
+        FROM undone u
+        JOIN price_changes p ON p.store = u.store AND p.prod_id = u.prod_id AND p.day =
+            (SELECT MAX(day) FROM price_changes WHERE store = u.store AND prod_id = u.prod_id)
+        JOIN product_versions v ON v.store = u.store AND v.prod_id = u.prod_id AND v.day =
+            (SELECT MAX(day) FROM product_versions WHERE store = u.store AND prod_id = u.prod_id)
+    """).fetchall()
+    conn.execute("DELETE FROM latest WHERE (store, prod_id) IN (SELECT store, prod_id FROM undone)")
+    conn.executemany("INSERT INTO latest VALUES (?, ?, ?, ?, ?, ?, ?)", [
+        (store, prod_id, current_price, old_price, metr_price, _attrs_hash(attrs), int(current_price is not None))
+        for store, prod_id, current_price, old_price, metr_price, attrs in previous])
+    conn.execute("DELETE FROM undone")
+
+def ingest_snapshot(conn, day, products, source=None, replace=False):
+    """
+    Record one daily snapshot. Days must arrive in order; a day that is
+    already stored is skipped, or with replace (the last day only) recorded
+    again from products. Returns the change counts for the day.
+    """
+    day = _day_key(day)
+    last_day = conn.execute("SELECT MAX(day) FROM snapshots").fetchone()[0]
+    stored = conn.execute("SELECT 1 FROM snapshots WHERE day = ?", (day,)).fetchone() is not None
+    if stored and not (replace and day == last_day):
+        print(f"Snapshot for {day} already in history, skipping")
+        return None
+    if last_day and day < last_day:
+        raise ValueError(f"History is append-only: {day} is older than the last stored day {last_day}")
+
+    conn.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS incoming (
+            store TEXT, prod_id TEXT, current_price REAL, old_price REAL, metr_price REAL,
+            attrs TEXT, attrs_hash INTEGER,
+            PRIMARY KEY (store, prod_id)
+        )
+    """)
+    conn.execute("DELETE FROM incoming")
+
+    def rows():
+        for product in products:
+            attrs = json.dumps([product.get(field) for field in ATTR_FIELDS], ensure_ascii=False)
+            yield (product['Store'], product['Prod ID'], product.get('Current Price'),
+                   product.get('Old Price'), product.get('MetrPrice'), attrs, _attrs_hash(attrs))
+
+    with conn:
+        if stored:
+            _undo_day(conn, day)
+        conn.executemany("INSERT OR REPLACE INTO incoming VALUES (?, ?, ?, ?, ?, ?, ?)", rows())
+        row_count = conn.execute("SELECT COUNT(*) FROM incoming").fetchone()[0]
+
+        price_changes = conn.execute("""
+            INSERT INTO price_changes (store, prod_id, day, current_price, old_price, metr_price)
+            SELECT i.store, i.prod_id, ?, i.current_price, i.old_price, i.metr_price
+            FROM incoming i LEFT JOIN latest l ON l.store = i.store AND l.prod_id = i.prod_id
+            WHERE l.store IS NULL OR l.present = 0
+               OR l.current_price IS NOT i.current_price
+               OR l.old_price IS NOT i.old_price
+               OR l.metr_price IS NOT i.metr_price
+        """, (day,)).rowcount
+
+        attr_changes = conn.execute("""
+            INSERT INTO product_versions (store, prod_id, day, attrs)
+            SELECT i.store, i.prod_id, ?, i.attrs
+            FROM incoming i LEFT JOIN latest l ON l.store = i.store AND l.prod_id = i.prod_id
+            WHERE l.attrs_hash IS NOT i.attrs_hash
+        """, (day,)).rowcount
+
+        # Products that vanished get a NULL price row so reconstruction drops them
+        removed = conn.execute("""
+            INSERT INTO price_changes (store, prod_id, day, current_price, old_price, metr_price)
+            SELECT l.store, l.prod_id, ?, NULL, NULL, NULL
+            FROM latest l
+            WHERE l.present = 1
+              AND NOT EXISTS (SELECT 1 FROM incoming i WHERE i.store = l.store AND i.prod_id = l.prod_id)
+        """, (day,)).rowcount
+
+        conn.execute("UPDATE latest SET present = 0 WHERE present = 1")
+        conn.execute("""
+            INSERT OR REPLACE INTO latest (store, prod_id, current_price, old_price, metr_price, attrs_hash, present)
+            SELECT store, prod_id, current_price, old_price, metr_price, attrs_hash, 1 FROM incoming
+        """)
+        conn.execute("DELETE FROM incoming")
+        conn.execute("INSERT INTO snapshots VALUES (?, ?, ?, ?, ?, ?, ?)", (
+            day, source, row_count, price_changes, attr_changes, removed,
+            datetime.now().isoformat(timespec="seconds")))
+
+    return {"day": day, "rows": row_count, "price_changes": price_changes,
+            "attr_changes": attr_changes, "removed": removed, "replaced": stored}
+
+def record_snapshot(db_path, day, products, source=None, replace=False):
+    """Open the history database, ingest one snapshot and close it"""
+    conn = connect(db_path)
+    try:
+        return ingest_snapshot(conn, day, products, source, replace)
+    finally:
+        conn.close()
+
+def price_series(conn, store, prod_id, start=None, end=None):
+    """
+    Change points of a product's prices as (day, current_price, old_price).
+    Prices stay in effect until the next change point; None means the product
+    was not listed from that day on.
+    """
+    sql = "SELECT day, current_price, old_price FROM price_changes WHERE store = ? AND prod_id = ?"
+    params = [store, prod_id]
+    if start is not None:
+        # Include the change point that was in effect at the start of the range
+        sql += (" AND day >= COALESCE((SELECT MAX(day) FROM price_changes"
+                " WHERE store = ? AND prod_id = ? AND day <= ?), ?)")
+        params += [store, prod_id, _day_key(start), _day_key(start)]
+    if end is not None:
+        sql += " AND day <= ?"
+        params.append(_day_key(end))
+    return conn.execute(sql + " ORDER BY day", params).fetchall()
+
+def snapshot_at(conn, day):
+    """Rebuild the product list as it was on a given day"""
+    day = _day_key(day)
+    cursor = conn.execute("""
+        SELECT p.current_price, p.old_price, p.metr_price, v.attrs
+        FROM (SELECT store, prod_id, MAX(day) AS day FROM price_changes
+              WHERE day <= ? GROUP BY store, prod_id) lp
+        JOIN price_changes p ON p.store = lp.store AND p.prod_id = lp.prod_id AND p.day = lp.day
+        JOIN (SELECT store, prod_id, MAX(day) AS day FROM product_versions
+              WHERE day <= ? GROUP BY store, prod_id) lv ON lv.store = lp.store AND lv.prod_id = lp.prod_id
+        JOIN product_versions v ON v.store = lv.store AND v.prod_id = lv.prod_id AND v.day = lv.day
+        WHERE p.current_price IS NOT NULL
+        ORDER BY lp.store, lp.prod_id
+    """, (day, day))
+
+    products = []
+    for current_price, old_price, metr_price, attrs in cursor:
+        values = dict(zip(ATTR_FIELDS, json.loads(attrs)))
+        values.update({"Current Price": current_price, "Old Price": old_price, "MetrPrice": metr_price})
+        products.append({field: values.get(field) for field in SNAPSHOT_FIELDS})
+    return products
+
+if __name__ == "__main__":
+    import argparse
+    import time
+    from snapshot_io import read_snapshot, snapshot_date
+
+    parser = argparse.ArgumentParser(description="Delta-encoded price history")
+    parser.add_argument("--db", default=HISTORY_DB)
+    sub = parser.add_subparsers(dest="command", required=True)
+    ingest_cmd = sub.add_parser("ingest", help="add daily archives (oldest first)")
+    ingest_cmd.add_argument("archives", nargs="+")
+    series_cmd = sub.add_parser("series", help="price change points of one product")
+    series_cmd.add_argument("store")
+    series_cmd.add_argument("prod_id")
+    at_cmd = sub.add_parser("snapshot", help="rebuild the catalog of a day as JSON")
+    at_cmd.add_argument("day", help="YYYY-MM-DD")
+    at_cmd.add_argument("output")
+    args = parser.parse_args()
+
+    conn = connect(args.db)
+    if args.command == "ingest":
+        from price_rollups import update_rollups
+        for archive in sorted(args.archives, key=snapshot_date):
+            stats = ingest_snapshot(conn, snapshot_date(archive), read_snapshot(archive), Path(archive).name)
+            if stats:
+                print(f"{stats['day']}: {stats['rows']} rows, {stats['price_changes']} price changes, "
+                      f"{stats['attr_changes']} attribute changes, {stats['removed']} removed")
+                update_rollups(conn)
+    elif args.command == "series":
+        start = time.perf_counter()
+        series = price_series(conn, args.store, args.prod_id)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        for day, current_price, old_price in series:
+            print(f"{day}  {current_price}  {old_price}")
+        print(f"{len(series)} change points in {elapsed_ms:.2f} ms")
+    elif args.command == "snapshot":
+        products = snapshot_at(conn, args.day)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(products, f, ensure_ascii=False)
+        print(f"Wrote {len(products)} products for {args.day} to {args.output}")
+    conn.close()
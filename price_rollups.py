@@ -0,0 +1,208 @@
+"""
+Trailing price statistics per product, kept in the price history database.
+
+price_rollups holds one row per listed (store, Prod ID) with the 30 and
+90 day min / median / max of Current Price, whether the store's Old Price
+discount was actually charged recently, and a ready-made badge, so the
+dashboard reads a product's rollup with a single key lookup.
+
+update_rollups is incremental: a product whose price has not moved for 90
+days has a flat rollup that no longer changes, so each new snapshot only
+recomputes the products with a change point inside the trailing windows.
+A replaced day (see price_history) can also take change points out, so the
+products whose rollup no longer matches their latest prices are recomputed
+as well.
+"""
+import sqlite3
+from datetime import date, timedelta
+
+from price_history import HISTORY_DB, connect
+
+WINDOWS = (30, 90)
+
+# Minimum tracked days before "lowest in N days" is claimed
+BADGE_MIN_DAYS = 7
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS price_rollups (
+    store TEXT NOT NULL,
+    prod_id TEXT NOT NULL,
+    first_seen TEXT NOT NULL,
+    current_price REAL,
+    old_price REAL,
+    min_30 REAL, median_30 REAL, max_30 REAL,
+    min_90 REAL, median_90 REAL, max_90 REAL,
+    discount_real INTEGER,
+    badge TEXT,
+    PRIMARY KEY (store, prod_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rollup_meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+def window_stats(series, start, end):
+    """
+    Min, median and max of the daily price between start and end (inclusive).
+    series is a list of (date, price) change points in day order; each price
+    holds until the next change point, None means the product was not listed.
+    """
+    weights = {}
+    for idx, (day, price) in enumerate(series):
+        next_day = series[idx + 1][0] if idx + 1 < len(series) else end + timedelta(days=1)
+        lo, hi = max(day, start), min(next_day - timedelta(days=1), end)
+        if price is None or hi < lo:
+            continue
+        weights[price] = weights.get(price, 0) + (hi - lo).days + 1
+
+    if not weights:
+        return None, None, None
+    prices = sorted(weights)
+    half = sum(weights.values()) / 2
+    running = 0
+    for price in prices:
+        running += weights[price]
+        if running >= half:
+            median = price
+            break
+    return prices[0], median, prices[-1]
+
+def compute_rollup(series, day, first_seen):
+    """Rollup row values for one product as of day"""
+    current_price, old_price = series[-1][1], series[-1][2]
+    prices = [(d, p) for d, p, _ in series]
+    stats = {}
+    for window in WINDOWS:
+        stats[window] = window_stats(prices, day - timedelta(days=window - 1), day)
+
+    # A discount is real if the product actually sold at (or above) the old price recently
+    discount_real = None
+    if old_price and old_price > current_price:
+        discount_real = int(stats[90][2] is not None and stats[90][2] >= old_price - 0.005)
+
+    tracked_days = (day - first_seen).days + 1
+    badge = None
+    for window in (90, 30):
+        low, _, high = stats[window]
+        if tracked_days >= min(window, BADGE_MIN_DAYS) and low is not None and current_price <= low < high:
+            badge = f"Lowest in {min(window, tracked_days)} days"
+            break
+    if badge is None and discount_real == 1:
+        badge = "Real discount"
+
+    return (current_price, old_price, *stats[30], *stats[90], discount_real, badge)
+
+def update_rollups(conn, day=None):
+    """Bring price_rollups up to date with the history as of day (default: latest snapshot)"""
+    conn.executescript(SCHEMA)
+    if day is None:
+        day = conn.execute("SELECT MAX(day) FROM snapshots").fetchone()[0]
+        if day is None:
+            return 0
+    day = date.fromisoformat(str(day))
+    latest_day = conn.execute("SELECT MAX(day) FROM snapshots").fetchone()[0]
+
+    previous = conn.execute("SELECT value FROM rollup_meta WHERE key = 'as_of'").fetchone()
+    if previous is None:
+        threshold = ""  # first build: every product
+    else:
+        # Anything that changed inside the old or the new windows may have a different rollup
+        since = min(day, date.fromisoformat(previous[0])) - timedelta(days=max(WINDOWS))
+        threshold = since.isoformat()
+
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS rollup_todo (store TEXT, prod_id TEXT, PRIMARY KEY (store, prod_id)) WITHOUT ROWID")
+    conn.execute("DELETE FROM rollup_todo")
+    conn.execute("INSERT OR IGNORE INTO rollup_todo SELECT store, prod_id FROM price_changes WHERE day > ? AND day <= ?",
+                 (threshold, day.isoformat()))
+    stale = []
+    if day.isoformat() == latest_day:
+        conn.execute("""
+            INSERT OR IGNORE INTO rollup_todo
+            SELECT l.store, l.prod_id FROM latest l
+            LEFT JOIN price_rollups r ON r.store = l.store AND r.prod_id = l.prod_id
+            WHERE l.present = 1 AND (r.store IS NULL OR r.current_price IS NOT l.current_price
+                                     OR r.old_price IS NOT l.old_price)
+        """)
+        stale = conn.execute("""
+            SELECT r.store, r.prod_id FROM price_rollups r
+            LEFT JOIN latest l ON l.store = r.store AND l.prod_id = r.prod_id
+            WHERE l.present IS NOT 1
+        """).fetchall()
+
+    cursor = conn.execute("""
+        SELECT p.store, p.prod_id, p.day, p.current_price, p.old_price
+        FROM rollup_todo t JOIN price_changes p ON p.store = t.store AND p.prod_id = t.prod_id
+        WHERE p.day <= ?
+        ORDER BY p.store, p.prod_id, p.day
+    """, (day.isoformat(),))
+
+    updates, removed = [], stale
+
+    def flush(key, series):
+        if series[-1][1] is None:
+            removed.append(key)
+        else:
+            updates.append((*key, series[0][0].isoformat(), *compute_rollup(series, day, series[0][0])))
+
+    key, series = None, []
+    for store, prod_id, change_day, current_price, old_price in cursor:
+        if (store, prod_id) != key:
+            if series:
+                flush(key, series)
+            key, series = (store, prod_id), []
+        series.append((date.fromisoformat(change_day), current_price, old_price))
+    if series:
+        flush(key, series)
+
+    with conn:
+        conn.executemany("INSERT OR REPLACE INTO price_rollups VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", updates)
+        conn.executemany("DELETE FROM price_rollups WHERE store = ? AND prod_id = ?", removed)
+        conn.execute("INSERT OR REPLACE INTO rollup_meta VALUES ('as_of', ?)", (day.isoformat(),))
+        conn.execute("DELETE FROM rollup_todo")
+    return len(updates)
+
+def get_rollup(conn, store, prod_id):
+    """Rollup row of one product as a dict (None if it is not listed)"""
+    conn.row_factory = sqlite3.Row
+    row = conn.execute("SELECT * FROM price_rollups WHERE store = ? AND prod_id = ?", (store, prod_id)).fetchone()
+    return dict(row) if row else None
+
+def refresh_rollups(db_path=HISTORY_DB):
+    """Open the history database, update the rollups and close it"""
+    conn = connect(db_path)
+    try:
+        return update_rollups(conn)
+    finally:
+        conn.close()
+
+def load_badges(db_path=HISTORY_DB):
+    """{(store, prod_id): badge} for every product that currently has one"""
+    conn = sqlite3.connect(db_path)
+    try:
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'price_rollups'").fetchone() is None:
+            return {}
+        return {(store, prod_id): badge for store, prod_id, badge in
+                conn.execute("SELECT store, prod_id, badge FROM price_rollups WHERE badge IS NOT NULL")}
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Trailing 30/90 day price rollups")
+    parser.add_argument("--db", default=HISTORY_DB)
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("update", help="update rollups to the latest snapshot in the history")
+    show_cmd = sub.add_parser("show", help="print the rollup of one product")
+    show_cmd.add_argument("store")
+    show_cmd.add_argument("prod_id")
+    args = parser.parse_args()
+
+    conn = connect(args.db)
+    if args.command == "update":
+        start = time.perf_counter()
+        count = update_rollups(conn)
+        print(f"Recomputed {count} rollups in {time.perf_counter() - start:.2f} s")
+    elif args.command == "show":
+        conn.executescript(SCHEMA)
+        print(get_rollup(conn, args.store, args.prod_id))
+    conn.close()
@@ -1,26 +1,28 @@
-import py7zr
 import streamlit as st
 import pandas as pd
-import base64
 import math
-import uuid
+import os
 from datetime import datetime
 from pathlib import Path
 from io import BytesIO
-import tempfile
-import shutil
+from product_store import product_uuid as generate_product_uuid, SqliteProductStore, DataFrameProductStore
+from snapshot_schema import load_snapshot_frame
+from snapshot_shards import is_sharded
+from price_history import HISTORY_DB
+from price_rollups import load_badges
+from best_value_index import BEST_VALUE_DB, best_value, index_groups
+from query_api import ApiProductStore
+from render_cache import STORE_LOGO_FILES, LogoRenderer, CardCache
+from dashboard_profiler import profiling_enabled, ProfileAggregate, RerunProfiler, NullProfiler
 
-def get_base64_of_bin_file(bin_file):
-    with open(bin_file, 'rb') as f:
-        data = f.read()
-    return base64.b64encode(data).decode()
+st.set_page_config(layout="wide")
 
-def generate_product_uuid(store, title, price, quantity):
-    """Generate a unique UUID for each product based on its attributes"""
-    unique_string = f"{store}|{title}|{price}|{quantity}"
-    return str(uuid.uuid5(uuid.NAMESPACE_DNS, unique_string))
+# Opt-in timing of each rerun (GROCERY_PROFILE=1 or ?profile=1), shown in the sidebar
+@st.cache_resource
+def get_profile_aggregate():
+    return ProfileAggregate()
 
-st.set_page_config(layout="wide")
+profiler = RerunProfiler() if profiling_enabled(st.query_params) else NullProfiler()
 
 st.markdown("""
 <style>
@@ -175,88 +177,123 @@ st.markdown("""
 .multiselect-container {
     margin-bottom: 15px;
 }
+
+/* Price history badge ("Lowest in 90 days", ...) */
+.price-badge {
+    display: inline-block;
+    font-size: 12px;
+    font-weight: bold;
+    color: #ffffff;
+    background-color: #2e7d32;
+    border-radius: 3px;
+    padding: 1px 6px;
+    margin-bottom: 5px;
+}
 </style>
 """, unsafe_allow_html=True)
 
 
 # Load and cache data - only once per session
 
-@st.cache_data
-def load_product_data():
-    script_dir = Path(__file__).parent
-    filename = script_dir / f"products_25-06-2025.7z"
-
-    # Use a temporary directory for extraction
-    with tempfile.TemporaryDirectory() as tmpdirname:
-        with py7zr.SevenZipFile(filename, mode='r') as archive:
-            archive.extractall(path=tmpdirname)
-
-        # Assuming there's only one file inside
-        extracted_dir = Path(tmpdirname)
-        extracted_file = next(extracted_dir.glob("*.json"))
+# The snapshot and database can be pointed elsewhere (bench_dashboard.py does so)
+SNAPSHOT_PATH = Path(os.environ.get("GROCERY_SNAPSHOT", Path(__file__).parent / "products_25-06-2025.7z"))
+# Per-store shards of the snapshot (snapshot_shards.py), used when present
+SHARD_PATH = SNAPSHOT_PATH.parent / SNAPSHOT_PATH.name.split(".")[0]
+if not is_sharded(SNAPSHOT_PATH) and is_sharded(SHARD_PATH):
+    SNAPSHOT_PATH = SHARD_PATH
+# A deployment can serve only some stores, e.g. GROCERY_STORES=penny,profi-baia-de-arama
+SERVED_STORES = tuple(s.strip() for s in os.environ.get("GROCERY_STORES", "").split(",") if s.strip()) or None
 
-        # Read the JSON file
-        df = pd.read_json(extracted_file)
+@st.cache_data
+def load_product_data(filename, stores=None):
+    # Compact dtypes; Product Link is derived and Description left out (see snapshot_schema)
+    df = load_snapshot_frame(filename, stores=stores)
 
     df = df.sort_values('MetrPrice', ascending=True)
     df['product_uuid'] = df.apply(lambda row: generate_product_uuid(
         row['Store'], row['Title'], row['Current Price'], row['Quantity']), axis=1)
     return df
 
-@st.cache_data
-def create_product_lookup(df):
-    lookup = {}
-    for _, row in df.iterrows():
-        lookup[row['product_uuid']] = {
-            'store': row['Store'],
-            'title': row['Title'],
-            'price': row['Current Price'],
-            'quantity': row['Quantity'],
-            'unit': row['Unit'],  # ADD THIS LINE - Include unit in lookup
-            'image_url': row['Image URL'],
-            'metr_price': row['MetrPrice'],
-            'prod_link' : row['Product Link']
-        }
-    return lookup
-
-df = load_product_data()
-product_lookup = create_product_lookup(df)
+# SQLite database written by the scraper; when present, filtering, sorting and
+# pagination run in SQL and only the rendered rows are read
+PRODUCT_DB = Path(os.environ.get("GROCERY_PRODUCT_DB", Path(__file__).parent / "products.sqlite"))
+
+# A query_api.py server can answer the queries instead, e.g. GROCERY_API_URL=http://127.0.0.1:8800
+API_URL = os.environ.get("GROCERY_API_URL")
+
+@st.cache_resource
+def get_product_store(db_mtime):
+    # db_mtime is part of the cache key so a freshly written database is picked up
+    if API_URL:
+        # The server follows new databases itself; responses are revalidated by ETag
+        return ApiProductStore(API_URL)
+    if db_mtime is not None:
+        return SqliteProductStore(PRODUCT_DB, SERVED_STORES)
+    return DataFrameProductStore(load_product_data(SNAPSHOT_PATH, SERVED_STORES))
+
+with profiler.stage("load_data"):
+    product_store = get_product_store(PRODUCT_DB.stat().st_mtime if PRODUCT_DB.exists() and not API_URL else None)
 
 # Define the original store order from the full dataset
-ORIGINAL_STORE_ORDER = list(df['Store'].unique())
+ORIGINAL_STORE_ORDER = product_store.stores()
+
+# Deal badges from the price history rollups, keyed by (Store, Prod ID)
+HISTORY_PATH = Path(__file__).parent / HISTORY_DB
+
+@st.cache_data
+def get_price_badges(history_mtime):
+    if history_mtime is None:
+        return {}
+    return load_badges(HISTORY_PATH)
+
+with profiler.stage("load_data"):
+    price_badges = get_price_badges(HISTORY_PATH.stat().st_mtime if HISTORY_PATH.exists() else None)
+
+# Top-k best value per category and unit, written by the scraper (best_value_index.py)
+BEST_VALUE_PATH = Path(os.environ.get("GROCERY_BEST_VALUE_DB", Path(__file__).parent / BEST_VALUE_DB))
+BEST_VALUE_MTIME = BEST_VALUE_PATH.stat().st_mtime if BEST_VALUE_PATH.exists() else None
+# MetrPrice is per g / ml / piece; shown per kg / l / piece
+UNIT_SCALE = {"g": (1000, "kg"), "ml": (1000, "l")}
+
+@st.cache_data
+def get_best_value_groups(index_mtime):
+    if index_mtime is None:
+        return []
+    return index_groups(BEST_VALUE_PATH)
+
+@st.cache_data
+def get_best_value(index_mtime, category, unit, stores):
+    return best_value(BEST_VALUE_PATH, category, unit, stores)
 
 script_dir = Path(__file__).parent
 # Get the parent directory (which contains the icon folder)
 parent_dir = script_dir.parent
 icon_dir = parent_dir / "icon"
 
-STORE_LOGOS = {
-    'auchan-hypermarket-titan': icon_dir / "Auchan_2018.svg",
-    'carrefour-hypermarket-mega-mall': icon_dir / "Carrefour_2009_(Horizontal).svg",
-    'freshful-now': icon_dir / "Freshful-logo.svg",
-    'kaufland-pantelimon': icon_dir / "Kaufland_1984_wordmark.svg",
-    'Penny': icon_dir / "Penny_Markt_2012.svg",
-    'profi-baia-de-arama': icon_dir / "Profi_2016_no_symbol.svg"
-}
+STORE_LOGOS = {store: icon_dir / file_name for store, file_name in STORE_LOGO_FILES.items()}
 
-@st.cache_data
-def get_store_logo(store_name):
-    # First check the predefined logos
-    logo_path = STORE_LOGOS.get(store_name)
-    if logo_path and logo_path.exists():
-        return str(logo_path)
-    
-    # If not found, try to find it in the icon directory
-    if icon_dir.exists():
-        for file in icon_dir.iterdir():
-            if store_name.lower().replace(' ', '-') in file.name.lower():
-                return str(file)
-    
-    return None
+@st.cache_resource
+def get_logo_renderer(stores):
+    # Logos are read and base64-encoded once per process instead of on every rerun
+    return LogoRenderer(stores, STORE_LOGOS, icon_dir)
+
+@st.cache_resource
+def get_card_cache():
+    # Product card HTML shared by all sessions, bounded and dropped with the snapshot
+    return CardCache()
+
+logo_renderer = get_logo_renderer(tuple(ORIGINAL_STORE_ORDER))
+card_cache = get_card_cache()
+if API_URL:
+    RENDER_SNAPSHOT = product_store.snapshot_hash()
+elif PRODUCT_DB.exists():
+    RENDER_SNAPSHOT = (product_store.snapshot, PRODUCT_DB.stat().st_mtime)
+else:
+    RENDER_SNAPSHOT = (str(SNAPSHOT_PATH), SNAPSHOT_PATH.stat().st_mtime)
 
 # Initialize selected products - simplified initialization
 if 'selected_products' not in st.session_state:
-    st.session_state.selected_products = {store: set() for store in df['Store'].unique()}
+    st.session_state.selected_products = {store: set() for store in ORIGINAL_STORE_ORDER}
 
 # Initialize product quantities - NEW
 if 'product_quantities' not in st.session_state:
@@ -272,11 +309,16 @@ if 'categories_multiselect' not in st.session_state:
 if 'widget_reset_counter' not in st.session_state:
     st.session_state.widget_reset_counter = 0
 
-min_price = math.floor(df['Current Price'].min())
-max_price = math.ceil(df['Current Price'].max())
+lowest_price, highest_price = product_store.price_bounds()
+if lowest_price is None or pd.isna(lowest_price):
+    # An empty database, or GROCERY_STORES naming stores that are not in it
+    st.warning("No products to show: the product data has no products for the stores served here.")
+    st.stop()
+min_price = math.floor(lowest_price)
+max_price = math.ceil(highest_price)
 
 def clear_all_selections():
-    st.session_state.selected_products = {store: set() for store in df['Store'].unique()}
+    st.session_state.selected_products = {store: set() for store in ORIGINAL_STORE_ORDER}
     st.session_state.product_quantities = {}
     st.session_state.units_multiselect = []
     # If 'lowval_multiselect' is a key for a widget, uncomment this:
@@ -304,16 +346,13 @@ with st.sidebar:
 
     st.markdown("<br>", unsafe_allow_html=True)
     
-    # Create temporary filtered dataframe for dynamic filter options
-    temp_df = df.copy()
-    if search_query:
-        temp_df = temp_df[temp_df['Title'].str.contains(search_query, case=False, na=False)]
+    # Filter options come from the current search results only
+    with profiler.stage("filter_options", product_store):
+        available_units, available_categories = product_store.filter_options(search_query)
     
     # Multi-select filters with dynamic options
     st.markdown('<div class="filter-title"></div>', unsafe_allow_html=True)
     
-    # Get available units from current search results
-    available_units = sorted(temp_df['Unit'].dropna().unique().tolist())
     selected_units = st.multiselect(
         "📦 Filter by Unit",
         options=available_units,
@@ -324,8 +363,6 @@ with st.sidebar:
 
     
     st.markdown('<div class="filter-title"></div>', unsafe_allow_html=True)
-    # Get available categories from current search results
-    available_categories = sorted(temp_df['Cathegori'].dropna().unique().tolist())
     selected_categories = st.multiselect(
         "📂 Filter by Category",
         options=available_categories,
@@ -364,59 +401,50 @@ with st.sidebar:
 st.markdown("**<-- Filters in '>>'**")
 st.caption(f"**Data Note:** This dashboard contains data inconsistencies including missing quantities, varied product descriptions, and consolidated categories from multiple sources. These inconsistencies will be reflected in search results and filters.")
 st.markdown("**Sort by Value Per Quantity**")
-# Apply all filters
-filtered_df = df.copy()
-
-# Apply search filter
-if search_query:
-    filtered_df = filtered_df[filtered_df['Title'].str.contains(search_query, case=False, na=False)]
-
-# Apply price range filter
-filtered_df = filtered_df[
-    (filtered_df['Current Price'] >= price_range[0]) & 
-    (filtered_df['Current Price'] <= price_range[1])
-]
-
-# Apply unit filter
-if selected_units:
-    filtered_df = filtered_df[filtered_df['Unit'].isin(selected_units)]
 
-# Apply category filter
-if selected_categories:
-    filtered_df = filtered_df[filtered_df['Cathegori'].isin(selected_categories)]
+best_value_groups = get_best_value_groups(BEST_VALUE_MTIME)
+if best_value_groups:
+    with st.expander("🏷️ Best value per category"), profiler.stage("best_value"):
+        bv_cols = st.columns(2)
+        bv_category = bv_cols[0].selectbox("Category", sorted({category for category, _ in best_value_groups}), key="best_value_category")
+        bv_unit = bv_cols[1].selectbox("Unit", [unit for category, unit in best_value_groups if category == bv_category], key="best_value_unit")
+        # A deployment serving only some stores ranks just those
+        bv_rows = get_best_value(BEST_VALUE_MTIME, bv_category, bv_unit, tuple(ORIGINAL_STORE_ORDER) if SERVED_STORES else None)
+        scale, per_unit = UNIT_SCALE.get(bv_unit, (1, bv_unit))
+        st.dataframe(pd.DataFrame([{
+            "Product": row["Title"],
+            "Store": row["Store"],
+            "Price (LEI)": row["Current Price"],
+            "Quantity": f"{row['Quantity']:g} {row['Unit']}",
+            f"LEI / {per_unit}": round(row["MetrPrice"] * scale, 2),
+        } for row in bv_rows]), hide_index=True)
+# Apply all filters
+filters = {
+    "search": search_query,
+    "units": selected_units,
+    "categories": selected_categories,
+    "price_range": price_range,
+}
+with profiler.stage("store_counts", product_store):
+    store_counts = product_store.store_counts(**filters)
 
 # Use the original store order
-filtered_stores = set(filtered_df['Store'].unique())
-stores = [store for store in ORIGINAL_STORE_ORDER if store in filtered_stores]
+stores = [store for store in ORIGINAL_STORE_ORDER if store_counts.get(store)]
 
-store_dfs = {store: filtered_df[filtered_df['Store'] == store].reset_index(drop=True) for store in stores}
 rows_per_page = 5
-rows = [st.columns(3), st.columns(3)]
+# Venues come from venues.json, so the grid grows a row for every 3 stores
+rows = [st.columns(3) for _ in range(math.ceil(len(stores) / 3))]
 
 for idx, store in enumerate(stores):
     
     col = rows[idx // 3][idx % 3]
-    with col:
+    with col, profiler.stage("store_cards", product_store):
         st.markdown("<div style='padding-top: 20px;'></div>", unsafe_allow_html=True)
-        logo_path = get_store_logo(store)
-        if logo_path:
-            try:
-                st.markdown(
-                    f"""
-                    <div style="display: flex; justify-content: center; align-items: center;">
-                        <img src="data:image/svg+xml;base64,{get_base64_of_bin_file(logo_path)}" style="width: 200px; height: 80px; border-radius: 8px;" />
-                    </div>
-                    """,
-                    unsafe_allow_html=True
-                )
-            except:
-                st.image(logo_path, width=50)
-        else:
-            st.markdown(f"<h3 style='text-align: center;'>{store}</h3>", unsafe_allow_html=True)
+        st.markdown(logo_renderer.grid_html(store), unsafe_allow_html=True)
         
         st.markdown("<div style='padding-bottom: 15px;'></div>", unsafe_allow_html=True)
-        store_df = store_dfs[store].copy()
-        total_pages = len(store_df) // rows_per_page + (len(store_df) % rows_per_page > 0)
+        store_count = store_counts[store]
+        total_pages = store_count // rows_per_page + (store_count % rows_per_page > 0)
         page_key = f'page_{store}'
         
         with st.container(height=300):
@@ -427,20 +455,15 @@ for idx, store in enumerate(stores):
                 st.session_state[page_key] = 1
             
             page = current_page
-            start_idx = (page - 1) * rows_per_page
-            end_idx = start_idx + rows_per_page
-            paginated_df = store_df.iloc[start_idx:end_idx].copy()
+            with profiler.stage("store_page", product_store):
+                page_rows = product_store.store_page(store, page, rows_per_page, **filters)
             
-            for _, row in paginated_df.iterrows():
-                image_url = row['Image URL']
-                product = row['Title']
+            for row in page_rows:
                 product_uuid = row['product_uuid']
                 price = row['Current Price']
                 quantity = row['Quantity']
-                metprice = row["MetrPrice"]
                 unit = row["Unit"]
-                MetrPrice = row["MetrPrice"]
-                prodlink = row["Product Link"]
+                image_html, title_html = card_cache.grid(RENDER_SNAPSHOT, row)
                 
                 # FIX: More robust checkbox state management
                 is_selected = product_uuid in st.session_state.selected_products[store]
@@ -449,17 +472,7 @@ for idx, store in enumerate(stores):
                 st.markdown("<div style='padding-top: 10px;'>", unsafe_allow_html=True)
                 
                 with cols[0]:
-                    st.markdown(
-                        f"""
-                        <div class="image-wrapper">
-                                <a href={prodlink}>
-                                    <img src="{image_url}" style="width: 300px; height: 160px; object-fit: cover; border-radius: 8px;" />
-                                </a>
-                            <a href="{image_url}" target="_blank" class="fullscreen-icon">🔍</a>
-                        </div>
-                        """,
-                        unsafe_allow_html=True
-                    )
+                    st.markdown(image_html, unsafe_allow_html=True)
                 
                 with cols[1]:
                                         # FIX: Include reset counter in checkbox key to force recreation when needed
@@ -484,16 +497,10 @@ for idx, store in enumerate(stores):
         
                     # Simplified checkbox - let Streamlit handle the state naturall                    
                     # Product title with hover tooltip
-                    short_title = product[:19] + "..." if len(product) > 2 else product
-                    st.markdown(
-                        f"""
-                        <div class="product-title-container">
-                            <span class="product-title-short">{short_title}</span>
-                            <div class="tooltip">{product}</div>
-                        </div>
-                        """,
-                        unsafe_allow_html=True
-                    )
+                    st.markdown(title_html, unsafe_allow_html=True)
+                    badge = price_badges.get((store, row['Prod ID']))
+                    if badge:
+                        st.markdown(f'<span class="price-badge">{badge}</span>', unsafe_allow_html=True)
                     st.markdown(f"LEI {price} / {quantity} {unit}")
 
 
@@ -509,11 +516,16 @@ for idx, store in enumerate(stores):
 
 st.subheader("🛒 Selected Products by Store")
 
+# Only the products in the cart are looked up
+with profiler.stage("cart_lookup", product_store):
+    product_lookup = product_store.lookup(
+        set().union(*(st.session_state.selected_products[store] for store in stores)))
+
 if len(stores) == 0:
     st.info("No products found matching your search and filters. Try adjusting your filters or search term.")
 else:
     # Add a container with fixed height and scrollbar
-    with st.container(height=600):
+    with st.container(height=600), profiler.stage("cart_render", product_store):
         store_columns = st.columns(len(stores))
         grand_total = 0
         
@@ -532,21 +544,7 @@ else:
                 grand_total += store_total
                 
                 # Display store logo
-                logo_path = get_store_logo(store)
-                if logo_path:
-                    try:
-                        st.markdown(
-                            f"""
-                            <div style="display: flex; justify-content: left; align-items: left;">
-                                <img src="data:image/svg+xml;base64,{get_base64_of_bin_file(logo_path)}" style="width: 90px; height: 35px; border-radius: 8px; padding-bottom: 5px;" />
-                            </div>
-                            """,
-                            unsafe_allow_html=True
-                        )
-                    except:
-                        st.markdown(f"<h4 style='text-align: center;'>{store}</h4>", unsafe_allow_html=True)
-                else:
-                    st.markdown(f"<h4 style='text-align: center;'>{store}</h4>", unsafe_allow_html=True)
+                st.markdown(logo_renderer.cart_html(store), unsafe_allow_html=True)
 
                 
                 # Display store total with styling
@@ -557,13 +555,10 @@ else:
                     for product_uuid in selected_product_uuids.copy():
                         if product_uuid in product_lookup:
                             product_info = product_lookup[product_uuid]
-                            product = product_info['title']
                             price = product_info['price']
                             quantity = product_info['quantity']
                             unit = product_info['unit']  # FIX: Get unit from lookup
-                            current_product_image = product_info['image_url']
-                            prodlink = product_info["prod_link"]
-                            metprice = product_info["metr_price"]
+                            image_html, title_html = card_cache.cart(RENDER_SNAPSHOT, product_uuid, product_info)
 
                         
                             # Get current quantity from session state
@@ -571,29 +566,10 @@ else:
                             
                             cols = st.columns([3, 1], gap="small")
                             with cols[0]:
-                                st.markdown(
-                                    f"""
-                                    <div class="image-wrapper">
-                                            <a href={prodlink}>
-                                                <img src="{current_product_image}" style="width: 200px; height: 100px; object-fit: cover; border-radius: 8px; padding-top: 0px; padding-bottom: 5px;" />
-                                            </a>
-                                        <a href="{current_product_image}" target="_blank" class="fullscreen-icon">🔍</a>
-                                    </div>
-                                    """,
-                                    unsafe_allow_html=True
-                                )
+                                st.markdown(image_html, unsafe_allow_html=True)
                                 
                                 # Product title with hover tooltip in selected products
-                                short_title = product[:20] + "..." if len(product) > 2 else product
-                                st.markdown(
-                                    f"""
-                                    <div class="product-title-container">
-                                        <span class="product-title-short">{short_title}</span>
-                                        <div class="tooltip">{product}</div>
-                                    </div>
-                                    """,
-                                    unsafe_allow_html=True
-                                )
+                                st.markdown(title_html, unsafe_allow_html=True)
                                 # Show total price for this product
                                 total_product_price = price * current_qty
                                 total_quant = quantity * current_qty
@@ -622,3 +598,21 @@ else:
                             st.markdown("---")
                 else:
                     st.write("No products selected")
+
+if profiler.enabled:
+    profile_aggregate = get_profile_aggregate()
+    rerun_stages = profiler.finish(profile_aggregate)
+    stage_percentiles = profile_aggregate.summary()
+    with st.sidebar:
+        with st.expander("⏱️ Rerun profile", expanded=True):
+            st.dataframe(pd.DataFrame([{
+                "stage": name,
+                "ms": round(stage["ms"], 1),
+                "calls": stage["calls"],
+                "rows": stage["rows"],
+                "copies": stage["copies"],
+                "p50 ms": round(stage_percentiles[name]["p50_ms"], 1),
+                "p95 ms": round(stage_percentiles[name]["p95_ms"], 1),
+            } for name, stage in rerun_stages.items()]), hide_index=True)
+            st.caption(f"Nested stages are included in their parent. Percentiles over the last "
+                       f"{profile_aggregate.window} reruns ({profile_aggregate.reruns} so far), all sessions.")
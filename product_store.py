@@ -0,0 +1,372 @@
+"""
+Product storage shared by the scraper and the dashboard.
+
+SqliteProductStore and DataFrameProductStore answer the same queries, so the
+dashboard can push filtering, MetrPrice sorting and per-store pagination down
+to SQLite when a database is available and fall back to pandas otherwise.
+"""
+import functools
+import os
+import re
+import sqlite3
+import threading
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+# (snapshot field, sql column, sql type)
+COLUMNS = [
+    ("Image URL", "image_url", "TEXT"),
+    ("Current Price", "current_price", "REAL"),
+    ("Old Price", "old_price", "REAL"),
+    ("Description", "description", "TEXT"),
+    ("Title", "title", "TEXT"),
+    ("Store", "store", "TEXT"),
+    ("Product Link", "product_link", "TEXT"),
+    ("Prod ID", "prod_id", "TEXT"),
+    ("Unit", "unit", "TEXT"),
+    ("MetrPrice", "metr_price", "REAL"),
+    ("Quantity", "quantity", "REAL"),
+    ("LowValFlag", "low_val_flag", "TEXT"),
+    ("catheg", "catheg", "TEXT"),
+    ("Cathegori", "cathegori", "TEXT"),
+    ("CategorySlug", "category_slug", "TEXT"),
+    ("product_uuid", "product_uuid", "TEXT"),
+]
+
+SCHEMA = """
+CREATE TABLE products (
+    {columns}
+);
+CREATE INDEX idx_products_store_metr ON products(store, metr_price);
+CREATE INDEX idx_products_unit ON products(unit);
+CREATE INDEX idx_products_cathegori ON products(cathegori);
+CREATE INDEX idx_products_price ON products(current_price);
+CREATE INDEX idx_products_uuid ON products(product_uuid);
+CREATE TABLE stores (name TEXT PRIMARY KEY, position INTEGER NOT NULL);
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+""".format(columns=",\n    ".join(f"{col} {typ}" for _, col, typ in COLUMNS))
+
+SELECT_COLUMNS = ", ".join(f'{col} AS "{field}"' for field, col, _ in COLUMNS)
+
+# SQLite limits the number of bound parameters per statement
+LOOKUP_CHUNK = 500
+
+# Characters that make a search a regular expression rather than plain text
+REGEX_CHARS = set(".^$*+?{}[]\\|()")
+
+@functools.lru_cache(maxsize=256)
+def search_regex(search):
+    """
+    The pattern of a title search: a case-insensitive regex, as str.contains
+    matched it, or the literal text when the search is not a valid regex
+    """
+    try:
+        return re.compile(search, re.IGNORECASE)
+    except re.error:
+        return re.compile(re.escape(search), re.IGNORECASE)
+
+def _regexp(search, title):
+    return title is not None and search_regex(search).search(title) is not None
+
+class QueryStats(threading.local):
+    """
+    Rows a store's queries touched and DataFrame copies they made, read by
+    dashboard_profiler. Counted per thread: Streamlit runs every rerun in its
+    own thread, so a rerun is not charged with other sessions' queries.
+    """
+    def __init__(self):
+        self.rows = 0
+        self.copies = 0
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        setattr(self, key, value)
+
+def product_uuid(store, title, price, quantity):
+    """Generate a unique UUID for each product based on its attributes"""
+    unique_string = f"{store}|{title}|{float(price)}|{float(quantity)}"
+    return str(uuid.uuid5(uuid.NAMESPACE_DNS, unique_string))
+
+# Venue page of a product link, in any city (see venues.json)
+VENUE_LINK = re.compile(r"https://wolt\.com/en/rou/[^/]+/venue/[^/]+")
+
+def venue_link(product_link, prod_id):
+    """The venue part of a product link, or None if the link is not venue link + / + Prod ID"""
+    suffix = f"/{prod_id}"
+    if not (product_link and product_link.endswith(suffix)):
+        return None
+    link = product_link[:-len(suffix)]
+    return link if VENUE_LINK.fullmatch(link) else None
+
+def with_product_links(records, venue_links):
+    """Put back the Product Link of records from a frame that derives it (see snapshot_schema)"""
+    if venue_links:
+        for record in records:
+            if "Product Link" not in record:
+                record["Product Link"] = f"{venue_links[record['Store']]}/{record['Prod ID']}"
+    return records
+
+def lookup_entry(row):
+    """Cart lookup record for one product row (snapshot field names)"""
+    return {
+        'store': row['Store'],
+        'title': row['Title'],
+        'price': row['Current Price'],
+        'quantity': row['Quantity'],
+        'unit': row['Unit'],
+        'image_url': row['Image URL'],
+        'metr_price': row['MetrPrice'],
+        'prod_link': row['Product Link'],
+    }
+
+def _create_search_index(conn):
+    """Create the title full-text index; returns the search mode it supports"""
+    try:
+        # trigram gives the same case-insensitive (Unicode aware) substring matching
+        # as str.contains, for plain text of 3 or more characters
+        conn.execute("CREATE VIRTUAL TABLE products_fts USING fts5("
+                     "title, content='products', content_rowid='rowid', tokenize='trigram')")
+        return "trigram"
+    except sqlite3.OperationalError:
+        pass
+    try:
+        conn.execute("CREATE VIRTUAL TABLE products_fts USING fts5("
+                     "title, content='products', content_rowid='rowid')")
+        return "fts5"
+    except sqlite3.OperationalError:
+        return "like"
+
+def write_products(db_path, products, snapshot_name=None):
+    """
+    Write a product snapshot to a fresh SQLite database.
+    The file is built next to db_path and swapped in atomically so a running
+    dashboard never sees a half-written database.
+    """
+    db_path = Path(db_path)
+    tmp_path = db_path.with_name(db_path.name + ".tmp")
+    if tmp_path.exists():
+        tmp_path.unlink()
+
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.executescript(SCHEMA)
+        search_mode = _create_search_index(conn)
+
+        placeholders = ", ".join("?" for _ in COLUMNS)
+        insert_sql = f"INSERT INTO products VALUES ({placeholders})"
+
+        def rows():
+            for product in products:
+                uid = product.get('product_uuid') or product_uuid(
+                    product['Store'], product['Title'], product['Current Price'], product['Quantity'])
+                yield tuple(uid if field == 'product_uuid' else product.get(field) for field, _, _ in COLUMNS)
+
+        conn.executemany(insert_sql, rows())
+        if search_mode != "like":
+            conn.execute("INSERT INTO products_fts(products_fts) VALUES('rebuild')")
+
+        # Same store order the dashboard used: cheapest MetrPrice first
+        conn.execute("""
+            INSERT INTO stores (name, position)
+            SELECT store, ROW_NUMBER() OVER (ORDER BY MIN(metr_price), MIN(rowid))
+            FROM products GROUP BY store
+        """)
+        count = conn.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+        conn.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", [
+            ("snapshot", snapshot_name or ""),
+            ("rows", str(count)),
+            ("search_mode", search_mode),
+            ("created", datetime.now().isoformat(timespec="seconds")),
+        ])
+        conn.commit()
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+
+    os.replace(tmp_path, db_path)
+    return count
+
+class SqliteProductStore:
+    """Read-only queries over a database written by write_products, optionally limited to some stores"""
+    def __init__(self, db_path, stores=None):
+        self.db_path = Path(db_path)
+        self.only_stores = list(stores) if stores else None
+        self._local = threading.local()
+        # Rows returned by queries (SQL makes no DataFrame copies)
+        self.stats = QueryStats()
+        meta = dict(self._conn().execute("SELECT key, value FROM meta").fetchall())
+        self.snapshot = meta.get("snapshot", "")
+        self.search_mode = meta.get("search_mode", "like")
+
+    def _conn(self):
+        # Streamlit serves sessions from several threads; give each its own connection
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path.resolve().as_uri() + "?mode=ro", uri=True)
+            conn.row_factory = sqlite3.Row
+            conn.create_function("regexp", 2, _regexp, deterministic=True)
+            self._local.conn = conn
+        return conn
+
+    def _where(self, search=None, units=None, categories=None, price_range=None, store=None):
+        clauses, params = [], []
+        if self.only_stores:
+            clauses.append(f"store IN ({', '.join('?' for _ in self.only_stores)})")
+            params.extend(self.only_stores)
+        if store is not None:
+            clauses.append("store = ?")
+            params.append(store)
+        if search:
+            if self.search_mode == "trigram" and len(search) >= 3 and not REGEX_CHARS & set(search):
+                clauses.append("rowid IN (SELECT rowid FROM products_fts WHERE products_fts MATCH ?)")
+                params.append('"' + search.replace('"', '""') + '"')
+            else:
+                # Regexes and short terms are matched by Python's re, like str.contains;
+                # LIKE folds only ASCII case, so it just narrows plain ASCII text first
+                if search.isascii() and not REGEX_CHARS & set(search):
+                    escaped = search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+                    clauses.append("title LIKE ? ESCAPE '\\'")
+                    params.append(f"%{escaped}%")
+                clauses.append("title REGEXP ?")
+                params.append(search)
+        if units:
+            clauses.append(f"unit IN ({', '.join('?' for _ in units)})")
+            params.extend(units)
+        if categories:
+            clauses.append(f"cathegori IN ({', '.join('?' for _ in categories)})")
+            params.extend(categories)
+        if price_range:
+            clauses.append("current_price BETWEEN ? AND ?")
+            params.extend(price_range)
+        where = " WHERE " + " AND ".join(clauses) if clauses else ""
+        return where, params
+
+    def stores(self):
+        names = [r[0] for r in self._conn().execute("SELECT name FROM stores ORDER BY position")]
+        return [name for name in names if not self.only_stores or name in self.only_stores]
+
+    def price_bounds(self):
+        where, params = self._where()
+        return tuple(self._conn().execute(f"SELECT MIN(current_price), MAX(current_price) FROM products{where}", params).fetchone())
+
+    def filter_options(self, search=None):
+        """Units and categories available for the current search"""
+        where, params = self._where(search=search)
+        conn = self._conn()
+        units = [r[0] for r in conn.execute(
+            f"SELECT DISTINCT unit FROM products{where} ORDER BY unit", params) if r[0] is not None]
+        categories = [r[0] for r in conn.execute(
+            f"SELECT DISTINCT cathegori FROM products{where} ORDER BY cathegori", params) if r[0] is not None]
+        self.stats["rows"] += len(units) + len(categories)
+        return units, categories
+
+    def store_counts(self, **filters):
+        where, params = self._where(**filters)
+        counts = dict(self._conn().execute(f"SELECT store, COUNT(*) FROM products{where} GROUP BY store", params).fetchall())
+        self.stats["rows"] += len(counts)
+        return counts
+
+    def store_page(self, store, page, rows_per_page, **filters):
+        """One page of a store's products, cheapest MetrPrice first"""
+        where, params = self._where(store=store, **filters)
+        sql = f"SELECT {SELECT_COLUMNS} FROM products{where} ORDER BY metr_price, rowid LIMIT ? OFFSET ?"
+        cursor = self._conn().execute(sql, params + [rows_per_page, (page - 1) * rows_per_page])
+        rows = [dict(r) for r in cursor]
+        self.stats["rows"] += len(rows)
+        return rows
+
+    def lookup(self, uuids):
+        """Cart lookup records for the given product uuids"""
+        uuids = list(uuids)
+        lookup = {}
+        for start in range(0, len(uuids), LOOKUP_CHUNK):
+            chunk = uuids[start:start + LOOKUP_CHUNK]
+            sql = f"SELECT {SELECT_COLUMNS} FROM products WHERE product_uuid IN ({', '.join('?' for _ in chunk)})"
+            for r in self._conn().execute(sql, chunk):
+                lookup.setdefault(r['product_uuid'], lookup_entry(r))
+                self.stats["rows"] += 1
+        return lookup
+
+class DataFrameProductStore:
+    """The same queries answered from an in-memory DataFrame sorted by MetrPrice"""
+    def __init__(self, df):
+        self.df = df
+        self.venue_links = df.attrs.get("venue_links")
+        # Row position of each product uuid (first occurrence); lookup entries
+        # are built only for the products in the cart
+        positions = df[['product_uuid']].assign(position=range(len(df)))
+        self._positions = positions[~positions['product_uuid'].duplicated()].set_index('product_uuid')['position']
+        self._last_filter = (None, None)
+        # Rows scanned by masks and DataFrames copied by boolean indexing
+        self.stats = QueryStats()
+
+    def _mask(self, df, mask):
+        self.stats["rows"] += len(df)
+        self.stats["copies"] += 1
+        return df[mask]
+
+    def _filtered(self, search=None, units=None, categories=None, price_range=None):
+        key = (search, tuple(units or ()), tuple(categories or ()), tuple(price_range or ()))
+        last_key, last_df = self._last_filter
+        if key == last_key:
+            return last_df
+
+        filtered_df = self.df
+        if search:
+            filtered_df = self._mask(filtered_df, filtered_df['Title'].str.contains(search_regex(search), na=False))
+        if price_range:
+            filtered_df = self._mask(filtered_df,
+                (filtered_df['Current Price'] >= price_range[0]) &
+                (filtered_df['Current Price'] <= price_range[1])
+            )
+        if units:
+            filtered_df = self._mask(filtered_df, filtered_df['Unit'].isin(units))
+        if categories:
+            filtered_df = self._mask(filtered_df, filtered_df['Cathegori'].isin(categories))
+
+        self._last_filter = (key, filtered_df)
+        return filtered_df
+
+    def stores(self):
+        return list(self.df['Store'].unique())
+
+    def price_bounds(self):
+        return self.df['Current Price'].min(), self.df['Current Price'].max()
+
+    def filter_options(self, search=None):
+        temp_df = self._filtered(search=search)
+        self.stats["rows"] += len(temp_df)
+        return (sorted(temp_df['Unit'].dropna().unique().tolist()),
+                sorted(temp_df['Cathegori'].dropna().unique().tolist()))
+
+    def store_counts(self, **filters):
+        filtered_df = self._filtered(**filters)
+        self.stats["rows"] += len(filtered_df)
+        return filtered_df['Store'].value_counts().to_dict()
+
+    def store_page(self, store, page, rows_per_page, **filters):
+        filtered_df = self._filtered(**filters)
+        store_df = self._mask(filtered_df, filtered_df['Store'] == store)
+        start_idx = (page - 1) * rows_per_page
+        return with_product_links(store_df.iloc[start_idx:start_idx + rows_per_page].to_dict('records'), self.venue_links)
+
+    def lookup(self, uuids):
+        positions = self._positions.reindex(list(uuids)).dropna().astype(int)
+        records = with_product_links(self.df.iloc[positions.to_numpy()].to_dict('records'), self.venue_links)
+        self.stats["rows"] += len(records)
+        return {row['product_uuid']: lookup_entry(row) for row in records}
+
+if __name__ == "__main__":
+    import sys
+    from snapshot_io import read_snapshot
+
+    if len(sys.argv) != 3:
+        print("Usage: python product_store.py products_DD-MM-YYYY.7z products.sqlite")
+        sys.exit(1)
+
+    snapshot_path, db_path = sys.argv[1], sys.argv[2]
+    count = write_products(db_path, read_snapshot(snapshot_path), Path(snapshot_path).name)
+    print(f"Wrote {count} products to {db_path}")
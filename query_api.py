@@ -0,0 +1,378 @@
+"""
+Headless JSON query API over the product database written by the scraper
+(products.sqlite), for clients that do not need the Streamlit dashboard.
+
+    GET  /meta                                  snapshot, stores, price bounds
+    GET  /options?search=lapte                  units and categories for a search
+    GET  /counts?search=&unit=&category=&min_price=&max_price=
+    GET  /products?store=penny&page=1&per_page=50&search=...&unit=g&unit=ml
+    GET  /lookup?uuid=...&uuid=...              cart lookup records by product uuid
+    POST /cart  {"items": {"<uuid>": 2, ...}}   cart priced per store
+    GET  /stats                                 cache hits and misses
+
+Filters are the dashboard's: search (title substring), unit and category
+(repeatable), min_price / max_price. /products returns the matching products
+cheapest MetrPrice first, one page at a time, for one store or all of them.
+
+Every GET response carries an ETag made of the snapshot hash and the query,
+so a client revalidating with If-None-Match gets a bodyless 304 until the
+scraper writes a new database. Responses are also kept in a bounded LRU
+cache keyed the same way; the database file is watched and a new snapshot
+replaces the store and empties the cache. The server runs one thread per
+connection and SqliteProductStore gives each thread its own read-only
+connection, so clients are served concurrently.
+
+ApiProductStore is the client: it answers the ProductStore queries of the
+dashboard through the API (GROCERY_API_URL in productStoreappMain.py).
+
+    python query_api.py --port 8800 [--db products.sqlite] [--stores penny profi-baia-de-arama]
+"""
+import hashlib
+import json
+import math
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlencode, urlparse
+
+from product_store import QueryStats, SqliteProductStore
+
+PRODUCT_DB = "products.sqlite"
+
+# Responses kept in the LRU cache
+RESPONSE_CACHE_SIZE = 2048
+# Largest page /products serves
+MAX_PER_PAGE = 200
+# Seconds between two checks of the database file for a new snapshot
+RELOAD_CHECK_SECONDS = 1.0
+# uuids per /lookup request sent by ApiProductStore
+CLIENT_LOOKUP_CHUNK = 50
+
+class ApiError(Exception):
+    """A request the API answers with an error status"""
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class ResponseCache:
+    """Thread-safe LRU of encoded response bodies"""
+    def __init__(self, size=RESPONSE_CACHE_SIZE):
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            body = self._entries.get(key)
+            if body is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+            return body
+
+    def put(self, key, body):
+        with self._lock:
+            self._entries[key] = body
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+def snapshot_hash(store):
+    """Hash of the database's snapshot identity (name, rows and build time written by write_products)"""
+    conn = store._conn()
+    meta = dict(conn.execute("SELECT key, value FROM meta").fetchall())
+    identity = "|".join([meta.get("snapshot", ""), meta.get("rows", ""), meta.get("created", ""),
+                         ",".join(store.only_stores or [])])
+    return hashlib.blake2b(identity.encode("utf-8"), digest_size=8).hexdigest()
+
+def _filters(query):
+    """Store query keyword arguments from the query string"""
+    filters = {}
+    if query.get("search", [""])[0]:
+        filters["search"] = query["search"][0]
+    if query.get("unit"):
+        filters["units"] = query["unit"]
+    if query.get("category"):
+        filters["categories"] = query["category"]
+    if "min_price" in query or "max_price" in query:
+        try:
+            filters["price_range"] = (float(query.get("min_price", ["-inf"])[0]),
+                                      float(query.get("max_price", ["inf"])[0]))
+        except ValueError:
+            raise ApiError(400, "min_price and max_price must be numbers")
+    return filters
+
+def _int_param(query, name, default, low, high):
+    try:
+        value = int(query.get(name, [default])[0])
+    except ValueError:
+        raise ApiError(400, f"{name} must be an integer")
+    if not low <= value <= high:
+        raise ApiError(400, f"{name} must be between {low} and {high}")
+    return value
+
+def price_cart(lookup, quantities):
+    """Per-store totals of a cart ({uuid: quantity}) from lookup records"""
+    stores, missing = {}, []
+    for uuid, quantity in quantities.items():
+        entry = lookup.get(uuid)
+        if entry is None:
+            missing.append(uuid)
+            continue
+        line_total = round(entry["price"] * quantity, 2)
+        store = stores.setdefault(entry["store"], {"total": 0.0, "items": []})
+        store["items"].append({"uuid": uuid, "title": entry["title"], "price": entry["price"],
+                               "quantity": quantity, "line_total": line_total})
+        store["total"] = round(store["total"] + line_total, 2)
+    return {"stores": stores, "grand_total": round(sum(s["total"] for s in stores.values()), 2), "missing": missing}
+
+class QueryService:
+    """The API's answers over a SqliteProductStore that follows the database file"""
+    def __init__(self, db_path=PRODUCT_DB, stores=None, cache_size=RESPONSE_CACHE_SIZE):
+        self.db_path = Path(db_path)
+        self.only_stores = stores
+        self.cache = ResponseCache(cache_size)
+        self._lock = threading.Lock()
+        self._checked = 0.0
+        self._load()
+
+    def _load(self):
+        self._mtime = self.db_path.stat().st_mtime
+        store = SqliteProductStore(self.db_path, self.only_stores)
+        # Swapped in one assignment, so a request never pairs a store with another snapshot's hash
+        self._current = (store, snapshot_hash(store))
+        self.cache.clear()
+
+    def current(self):
+        """(store, snapshot hash), reloaded when the scraper has replaced the database"""
+        now = time.monotonic()
+        if now - self._checked >= RELOAD_CHECK_SECONDS:
+            with self._lock:
+                if now - self._checked >= RELOAD_CHECK_SECONDS:
+                    self._checked = now
+                    if self.db_path.stat().st_mtime != self._mtime:
+                        self._load()
+        return self._current
+
+    def answer(self, store, current_hash, path, query):
+        """JSON-ready result of a GET"""
+        if path == "/meta":
+            low, high = store.price_bounds()
+            return {"snapshot": store.snapshot, "snapshot_hash": current_hash, "stores": store.stores(),
+                    "min_price": low, "max_price": high, "search_mode": store.search_mode}
+        if path == "/options":
+            units, categories = store.filter_options(query.get("search", [""])[0] or None)
+            return {"units": units, "categories": categories}
+        if path == "/counts":
+            return store.store_counts(**_filters(query))
+        if path == "/products":
+            filters = _filters(query)
+            page = _int_param(query, "page", 1, 1, 10 ** 9)
+            per_page = _int_param(query, "per_page", 50, 1, MAX_PER_PAGE)
+            shop = query.get("store", [None])[0]
+            counts = store.store_counts(**filters)
+            total = counts.get(shop, 0) if shop else sum(counts.values())
+            return {"store": shop, "page": page, "per_page": per_page, "total": total,
+                    "pages": -(-total // per_page), "products": store.store_page(shop, page, per_page, **filters)}
+        if path == "/lookup":
+            return store.lookup(query.get("uuid", []))
+        if path == "/stats":
+            return {"cache_hits": self.cache.hits, "cache_misses": self.cache.misses,
+                    "cache_entries": len(self.cache), "snapshot_hash": current_hash}
+        raise ApiError(404, f"Unknown path {path}")
+
+def make_handler(service):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Headers and body go out in two writes; without TCP_NODELAY the body
+        # waits for the client's delayed ACK (~40 ms on Linux)
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, body=b"", etag=None):
+            try:
+                self.send_response(status)
+                if etag:
+                    self.send_header("ETag", etag)
+                    # Cached copies are revalidated, since the snapshot can change at any time
+                    self.send_header("Cache-Control", "no-cache")
+                if status != 304:
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if status != 304:
+                    self.wfile.write(body)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+        def _error(self, status, message):
+            self._send(status, json.dumps({"error": message}).encode("utf-8"))
+
+        def do_GET(self):
+            parsed = urlparse(self.path)
+            query = parse_qs(parsed.query)
+            store, current_hash = service.current()
+            if parsed.path == "/stats":
+                self._send(200, json.dumps(service.answer(store, current_hash, parsed.path, query)).encode("utf-8"))
+                return
+
+            # Same query, same snapshot: same response
+            canonical = urlencode(sorted((k, v) for k, values in query.items() for v in values))
+            tag = hashlib.blake2b(f"{parsed.path}?{canonical}".encode("utf-8"), digest_size=8).hexdigest()
+            etag = f'"{current_hash}-{tag}"'
+            if etag in [t.strip() for t in self.headers.get("If-None-Match", "").split(",")]:
+                self._send(304, etag=etag)
+                return
+
+            key = (current_hash, parsed.path, canonical)
+            body = service.cache.get(key)
+            if body is None:
+                try:
+                    body = json.dumps(service.answer(store, current_hash, parsed.path, query), ensure_ascii=False).encode("utf-8")
+                except ApiError as e:
+                    self._error(e.status, str(e))
+                    return
+                service.cache.put(key, body)
+            self._send(200, body, etag)
+
+        def do_POST(self):
+            if urlparse(self.path).path != "/cart":
+                self._error(404, f"Unknown path {self.path}")
+                return
+            try:
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                quantities = {str(uuid): float(quantity) for uuid, quantity in payload.get("items", {}).items()}
+                if not all(math.isfinite(quantity) and quantity >= 0 for quantity in quantities.values()):
+                    raise ValueError("quantities must be finite and not negative")
+            except (ValueError, TypeError, AttributeError):
+                self._error(400, 'Expected {"items": {"<uuid>": quantity}} with quantities of 0 or more')
+                return
+            store, _ = service.current()
+            self._send(200, json.dumps(price_cart(store.lookup(quantities), quantities), ensure_ascii=False).encode("utf-8"))
+
+    return Handler
+
+def serve(db_path=PRODUCT_DB, host="127.0.0.1", port=8800, stores=None, cache_size=RESPONSE_CACHE_SIZE, ready=None):
+    """Run the API until interrupted (ready, if given, is set once listening)"""
+    server = ThreadingHTTPServer((host, port), make_handler(QueryService(db_path, stores, cache_size)))
+    server.daemon_threads = True
+    if ready is not None:
+        ready.set()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+class ApiProductStore:
+    """ProductStore queries answered by a query API server, revalidated with ETags"""
+    def __init__(self, base_url, timeout=10):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self._etags = ResponseCache()  # url -> (etag, decoded result)
+        # Rows received
+        self.stats = QueryStats()
+        self._get("/meta")  # fails early when the server is not there
+
+    def _get(self, path, params=()):
+        url = f"{self.base_url}{path}?{urlencode(list(params))}"
+        request = urllib.request.Request(url)
+        cached = self._etags.get(url)
+        if cached is not None:
+            request.add_header("If-None-Match", cached[0])
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                result = json.load(response)
+                self._etags.put(url, (response.headers.get("ETag"), result))
+                return result
+        except urllib.error.HTTPError as e:
+            if e.code == 304 and cached is not None:
+                return cached[1]
+            raise
+
+    @staticmethod
+    def _filter_params(search=None, units=None, categories=None, price_range=None):
+        params = [("search", search)] if search else []
+        params += [("unit", unit) for unit in units or ()]
+        params += [("category", category) for category in categories or ()]
+        if price_range:
+            params += [("min_price", price_range[0]), ("max_price", price_range[1])]
+        return params
+
+    # Read from /meta on every access: the server can switch to a new
+    # database at any time, and a revalidated /meta is a 304
+    @property
+    def snapshot(self):
+        return self._get("/meta")["snapshot"]
+
+    @property
+    def search_mode(self):
+        return self._get("/meta")["search_mode"]
+
+    def snapshot_hash(self):
+        """Hash of the snapshot the server answers from right now"""
+        return self._get("/meta")["snapshot_hash"]
+
+    def stores(self):
+        return self._get("/meta")["stores"]
+
+    def price_bounds(self):
+        meta = self._get("/meta")
+        return meta["min_price"], meta["max_price"]
+
+    def filter_options(self, search=None):
+        result = self._get("/options", [("search", search)] if search else [])
+        self.stats["rows"] += len(result["units"]) + len(result["categories"])
+        return result["units"], result["categories"]
+
+    def store_counts(self, **filters):
+        counts = self._get("/counts", self._filter_params(**filters))
+        self.stats["rows"] += len(counts)
+        return counts
+
+    def store_page(self, store, page, rows_per_page, **filters):
+        # No store is the page over every store
+        params = [("store", store)] if store is not None else []
+        params += [("page", page), ("per_page", rows_per_page)] + self._filter_params(**filters)
+        rows = self._get("/products", params)["products"]
+        self.stats["rows"] += len(rows)
+        return rows
+
+    def lookup(self, uuids):
+        # Sorted so the same cart asks the same URLs (and revalidates them)
+        uuids = sorted(uuids)
+        lookup = {}
+        for start in range(0, len(uuids), CLIENT_LOOKUP_CHUNK):
+            lookup.update(self._get("/lookup", [("uuid", uuid) for uuid in uuids[start:start + CLIENT_LOOKUP_CHUNK]]))
+        self.stats["rows"] += len(lookup)
+        return lookup
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="JSON query API over products.sqlite")
+    parser.add_argument("--db", default=PRODUCT_DB)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8800)
+    parser.add_argument("--stores", nargs="+", help="serve only these stores")
+    parser.add_argument("--cache-size", type=int, default=RESPONSE_CACHE_SIZE, help="responses kept in the LRU cache")
+    args = parser.parse_args()
+
+    print(f"Serving {args.db} on http://{args.host}:{args.port}")
+    serve(args.db, args.host, args.port, args.stores, args.cache_size)
@@ -0,0 +1,95 @@
+"""
+Archive of raw API page payloads, so normalization rules can be re-applied
+offline without crawling again.
+
+An archive directory holds:
+- payloads.pack: zlib-compressed payloads appended back to back. Each distinct
+  payload is stored once (keyed by sha1), so a category page that did not
+  change since a previous day costs nothing.
+- index_DD-MM-YYYY.jsonl: the pages fetched on that day, in crawl order, with
+  the category URL they belong to and where their payload sits in the pack.
+"""
+import hashlib
+import json
+import zlib
+from pathlib import Path
+
+RAW_ARCHIVE_DIR = "raw_archive"
+
+def read_payload(pack_file, entry):
+    """Decompress the payload of one index entry from an open pack file"""
+    pack_file.seek(entry["offset"])
+    return zlib.decompress(pack_file.read(entry["length"]))
+
+class RawArchive:
+    """Append pages of one crawl day to the archive, or read them back"""
+    def __init__(self, directory, date_str, mode="r"):
+        self.directory = Path(directory)
+        self.date_str = date_str
+        self.pack_path = self.directory / "payloads.pack"
+        self.index_path = self.directory / f"index_{date_str}.jsonl"
+        self.mode = mode
+        self.pages = 0
+        self.new_payloads = 0
+        self.bytes_in = 0
+        self.bytes_stored = 0
+
+        # Payloads already in the pack, from every day's index
+        self._blobs = {}
+        for index_path in sorted(self.directory.glob("index_*.jsonl")):
+            for entry in self._read_index(index_path):
+                self._blobs[entry["sha1"]] = (entry["offset"], entry["length"])
+
+        if mode == "a":
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._pack = open(self.pack_path, "ab")
+            self._index = open(self.index_path, "a", encoding="utf-8")
+        elif mode == "r":
+            if not self.index_path.exists():
+                raise FileNotFoundError(f"No raw pages archived for {date_str} in {self.directory}")
+            self._pack = open(self.pack_path, "rb")
+            self._index = None
+        else:
+            raise ValueError(f"Unknown mode {mode!r}")
+
+    @staticmethod
+    def _read_index(index_path):
+        with open(index_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    def add(self, url, payload):
+        """Archive the raw bytes of a page that data_getting will process for url"""
+        digest = hashlib.sha1(payload).hexdigest()
+        if digest not in self._blobs:
+            blob = zlib.compress(payload, 6)
+            self._pack.seek(0, 2)
+            offset = self._pack.tell()
+            self._pack.write(blob)
+            self._pack.flush()
+            self._blobs[digest] = (offset, len(blob))
+            self.new_payloads += 1
+            self.bytes_stored += len(blob)
+
+        offset, length = self._blobs[digest]
+        entry = {"url": url, "sha1": digest, "offset": offset, "length": length}
+        self._index.write(json.dumps(entry) + "\n")
+        self.pages += 1
+        self.bytes_in += len(payload)
+
+    def entries(self):
+        """Index entries of the day, in crawl order"""
+        return list(self._read_index(self.index_path))
+
+    def close(self):
+        # Pack first so an index line never points past the end of the pack
+        self._pack.close()
+        if self._index is not None:
+            self._index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
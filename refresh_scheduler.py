@@ -0,0 +1,465 @@
+"""
+Adaptive refresh scheduler: recrawls the categories whose prices move often
+more often than the stable ones, for a fixed request budget.
+
+Every Wolt category of every venue (a venue slug and category id, as crawled
+by store_scraper) has a learned change rate: price changes per product per
+day, taken from the price history for the store and category slug and then
+from what each recrawl finds changed. With products changing as a Poisson
+process of rate r, a category recrawled every I days shows, on average, the
+current price for a share (1 - e^(-r I)) / (r I) of its products: its
+freshness. allocate picks the intervals that maximize the product-weighted
+freshness of the whole catalog while spending at most the daily budget of
+requests (pages), every interval staying between one tick and
+MAX_INTERVAL_DAYS.
+
+The daemon wakes every TICK_HOURS, crawls the categories that are due (the
+most overdue first, within the budget of the tick), probes the next category
+id of each venue for new categories, merges the fresh products into the last
+snapshot and publishes it like store_scraper does. Each publish replaces
+the day in the price history, so the history keeps the last state of every
+day for its rollups and for history_rates. The first tick (no state yet) crawls
+everything once to learn the categories and their costs.
+
+    python refresh_scheduler.py run [--budget PAGES_PER_DAY] [--tick-hours 6] [--once]
+    python refresh_scheduler.py plan [--budget PAGES_PER_DAY]   # intervals, freshness vs uniform recrawls
+    python refresh_scheduler.py status [--json]                 # freshness of every category right now
+"""
+import json
+import math
+import sqlite3
+import time
+from datetime import date
+from pathlib import Path
+
+import store_scraper
+from category_classifier import reclassify
+from price_history import ATTR_FIELDS, HISTORY_DB
+from scraper_metrics import RunMetrics, venue_name
+from snapshot_io import list_snapshots, read_snapshot
+from venue_registry import url_venue_slug
+
+STATE_DB = "refresh_state.sqlite"
+
+# Hours between two ticks of the daemon; also the shortest refresh interval
+TICK_HOURS = 6
+# Every category is recrawled at least this often, however stable
+MAX_INTERVAL_DAYS = 14
+# Weight of the newest observation in a category's change rate
+RATE_SMOOTHING = 0.3
+# Change rate used before anything is known (changes per product per day)
+DEFAULT_RATE = 0.05
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS categories (
+    venue TEXT NOT NULL,
+    category_id INTEGER NOT NULL,
+    url_template TEXT NOT NULL,
+    store TEXT NOT NULL,
+    category_slug TEXT,
+    products INTEGER NOT NULL DEFAULT 0,
+    pages INTEGER NOT NULL DEFAULT 1,
+    change_rate REAL,
+    observations INTEGER NOT NULL DEFAULT 0,
+    last_crawled REAL,
+    interval_days REAL,
+    PRIMARY KEY (venue, category_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS venue_ends (
+    venue TEXT PRIMARY KEY,
+    url_template TEXT NOT NULL,
+    missing_from INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS scheduler_meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+def connect(db_path=STATE_DB):
+    conn = sqlite3.connect(db_path)
+    conn.executescript(SCHEMA)
+    return conn
+
+class Category:
+    """Scheduling state of one (venue, category id)"""
+    def __init__(self, venue, category_id, url_template, store, category_slug=None, products=0, pages=1,
+                 change_rate=None, observations=0, last_crawled=None, interval_days=None):
+        self.venue = venue
+        self.category_id = category_id
+        self.url_template = url_template
+        self.store = store
+        self.category_slug = category_slug
+        self.products = products
+        self.pages = pages
+        self.change_rate = change_rate
+        self.observations = observations
+        self.last_crawled = last_crawled
+        self.interval_days = interval_days
+
+    @property
+    def url(self):
+        return self.url_template.format(self.category_id)
+
+    def age_days(self, now):
+        return None if self.last_crawled is None else max(now - self.last_crawled, 0) / 86400
+
+    def freshness(self, now):
+        """Expected share of the category's products still at the price shown"""
+        age = self.age_days(now)
+        if age is None:
+            return 0.0
+        return math.exp(-(self.change_rate or 0) * age)
+
+def load_categories(conn):
+    return [Category(*row) for row in conn.execute(
+        "SELECT venue, category_id, url_template, store, category_slug, products, pages, change_rate, "
+        "observations, last_crawled, interval_days FROM categories ORDER BY venue, category_id")]
+
+def save_categories(conn, categories):
+    with conn:
+        conn.executemany("INSERT OR REPLACE INTO categories VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", [
+            (c.venue, c.category_id, c.url_template, c.store, c.category_slug, c.products, c.pages,
+             c.change_rate, c.observations, c.last_crawled, c.interval_days) for c in categories])
+
+def _get_meta(conn, key):
+    row = conn.execute("SELECT value FROM scheduler_meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+def _set_meta(conn, key, value):
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO scheduler_meta VALUES (?, ?)", (key, value))
+
+def history_rates(history_db=HISTORY_DB):
+    """
+    {(store, category slug): price changes per product per day} learned from
+    the daily snapshots of the price history, plus an overall rate under the
+    key None. Each product counts for the category of its latest version.
+    """
+    if not Path(history_db).exists():
+        return {}
+    slug_index = ATTR_FIELDS.index("CategorySlug")
+    conn = sqlite3.connect(history_db)
+    try:
+        days = [date.fromisoformat(day) for (day,) in conn.execute("SELECT day FROM snapshots ORDER BY day")]
+        if len(days) < 2:
+            return {}
+        position = {day.isoformat(): index for index, day in enumerate(days)}
+        categories = dict(((store, prod_id), slug) for store, prod_id, slug in conn.execute(
+            f"SELECT store, prod_id, json_extract(attrs, '$[{slug_index}]') FROM product_versions v "
+            "WHERE day = (SELECT MAX(day) FROM product_versions w WHERE w.store = v.store AND w.prod_id = v.prod_id)"))
+
+        # Per category: [snapshot transitions with the product listed on both days, days they cover, changes]
+        totals = {}
+        rows = conn.execute("SELECT store, prod_id, day, current_price FROM price_changes ORDER BY store, prod_id, day")
+        previous = None
+        for store, prod_id, day, price in rows:
+            key = (store, prod_id)
+            if previous is not None and previous[0] == key and previous[2] is not None:
+                # The previous change point held until this one: a new price (or only a new
+                # Old Price / MetrPrice), or the day the product was no longer listed
+                start, end = position[previous[1]], position[day]
+                _add_exposure(totals, (store, categories.get(key)), days, start, end if price is not None else end - 1,
+                              int(price is not None and price != previous[2]))
+            if previous is not None and previous[0] != key and previous[2] is not None:
+                # Listed until the last snapshot
+                _add_exposure(totals, (previous[0][0], categories.get(previous[0])), days,
+                              position[previous[1]], len(days) - 1, 0)
+            previous = (key, day, price)
+        if previous is not None and previous[2] is not None:
+            _add_exposure(totals, (previous[0][0], categories.get(previous[0])), days,
+                          position[previous[1]], len(days) - 1, 0)
+    finally:
+        conn.close()
+
+    rates = {key: _sampled_rate(*counts) for key, counts in totals.items() if counts[0]}
+    overall = [sum(counts[i] for counts in totals.values()) for i in range(3)]
+    if overall[0]:
+        rates[None] = _sampled_rate(*overall)
+    return rates
+
+def _add_exposure(totals, key, days, start, end, changes):
+    if end <= start:
+        return
+    counts = totals.setdefault(key, [0, 0, 0])
+    counts[0] += end - start
+    counts[1] += (days[end] - days[start]).days
+    counts[2] += changes
+
+def _sampled_rate(compared, days, changed):
+    """
+    Poisson change rate from crawls that only show whether a price moved
+    since the previous crawl, not how many times: compared (product, interval)
+    pairs covering days in total, changed of which saw a new price. The 0.5
+    terms keep the estimate finite when every price changed.
+    """
+    return -math.log((compared - changed + 0.5) / (compared + 0.5)) / (days / compared)
+
+def observe(category, compared, changed, now):
+    """Fold the products found changed by a recrawl into the category's change rate"""
+    age = category.age_days(now)
+    if not compared or not age:
+        return
+    rate = _sampled_rate(compared, compared * age, changed)
+    # The first recrawl is blended with the rate the history gave the category
+    if category.change_rate is None:
+        category.change_rate = rate
+    else:
+        category.change_rate = (1 - RATE_SMOOTHING) * category.change_rate + RATE_SMOOTHING * rate
+    category.observations += 1
+
+def expected_freshness(rate, interval_days):
+    """Time-averaged share of current prices for a category recrawled every interval_days"""
+    x = rate * interval_days
+    return 1.0 if x < 1e-9 else (1 - math.exp(-x)) / x
+
+def _frequency(weight, cost, rate, multiplier, low, high):
+    # The gain of one more crawl per day, weight * dF/df = weight * (1 - (1 + x) e^-x) / rate
+    # with x = rate / f, falls as f grows: find where it drops to multiplier * cost
+    target = multiplier * cost * rate / weight
+    if target >= 1:
+        return low
+    lo_x, hi_x = rate / high, rate / low
+    if 1 - (1 + lo_x) * math.exp(-lo_x) >= target:
+        return high
+    if 1 - (1 + hi_x) * math.exp(-hi_x) <= target:
+        return low
+    for _ in range(60):
+        mid = (lo_x + hi_x) / 2
+        if 1 - (1 + mid) * math.exp(-mid) < target:
+            lo_x = mid
+        else:
+            hi_x = mid
+    return rate / ((lo_x + hi_x) / 2)
+
+def allocate(categories, budget, min_interval=TICK_HOURS / 24, max_interval=MAX_INTERVAL_DAYS):
+    """
+    Set interval_days on every category so that the product-weighted expected
+    freshness is the highest the budget (pages per day) allows
+    """
+    low, high = 1 / max_interval, 1 / min_interval
+    items = [(c, max(c.products, 1), max(c.pages, 1), max(c.change_rate or 0, 1e-6)) for c in categories]
+    if not items:
+        return
+    floor = sum(cost * low for _, _, cost, _ in items)
+    if budget <= floor:
+        frequencies = [low] * len(items)
+    elif budget >= sum(cost * high for _, _, cost, _ in items):
+        frequencies = [high] * len(items)
+    else:
+        # Lagrange multiplier of the budget: the larger it is, the fewer crawls
+        lo_m, hi_m = 0.0, 1.0
+        while sum(cost * _frequency(w, cost, r, hi_m, low, high) for _, w, cost, r in items) > budget:
+            hi_m *= 2
+        for _ in range(60):
+            mid = (lo_m + hi_m) / 2
+            if sum(cost * _frequency(w, cost, r, mid, low, high) for _, w, cost, r in items) > budget:
+                lo_m = mid
+            else:
+                hi_m = mid
+        frequencies = [_frequency(w, cost, r, hi_m, low, high) for _, w, cost, r in items]
+    for (category, _, _, _), frequency in zip(items, frequencies):
+        category.interval_days = 1 / frequency
+
+def catalog_freshness(categories, intervals):
+    """Product-weighted expected freshness of the categories for the given intervals"""
+    weight = sum(max(c.products, 1) for c in categories)
+    return sum(max(c.products, 1) * expected_freshness(c.change_rate or 0, interval)
+               for c, interval in zip(categories, intervals)) / weight if weight else 1.0
+
+def full_crawl_cost(categories):
+    """Pages per day of recrawling every category daily, as store_scraper does"""
+    return sum(max(c.pages, 1) for c in categories)
+
+def apply_history_rates(categories, rates):
+    """Give the categories no recrawl has measured yet the rate the price history shows"""
+    for category in categories:
+        if category.observations == 0:
+            category.change_rate = rates.get((category.store, category.category_slug), rates.get(None, DEFAULT_RATE))
+
+def due_categories(categories, now, tick_budget):
+    """The categories to crawl this tick: the most overdue first, within tick_budget pages"""
+    due = []
+    for category in categories:
+        age = category.age_days(now)
+        if age is None:
+            due.append((math.inf, category))
+        elif age >= (category.interval_days or 0) - 1e-6:
+            due.append((age / category.interval_days, category))
+    due.sort(key=lambda entry: -entry[0])
+
+    chosen, spent = [], 0
+    for _, category in due:
+        # A category larger than the whole tick budget still goes through on its own
+        if spent + category.pages <= tick_budget or not chosen:
+            chosen.append(category)
+            spent += category.pages
+    return chosen
+
+def _base_products(conn):
+    snapshot = _get_meta(conn, "snapshot")
+    if snapshot and Path(snapshot).exists():
+        return read_snapshot(snapshot)
+    snapshots = list_snapshots(".")
+    return read_snapshot(snapshots[-1]) if snapshots else []
+
+def tick(db_path=STATE_DB, budget=None, tick_hours=TICK_HOURS, history_db=HISTORY_DB):
+    """Crawl what is due and publish the merged snapshot; returns the tick's counts"""
+    store_scraper.metrics = metrics = RunMetrics()
+    now = time.time()
+    conn = connect(db_path)
+    try:
+        categories = load_categories(conn)
+        ends = {venue: (url_template, missing_from)
+                for venue, url_template, missing_from in conn.execute("SELECT * FROM venue_ends")}
+        bootstrap = not categories
+        with metrics.phase("schedule"):
+            rates = history_rates(history_db)
+            apply_history_rates(categories, rates)
+            budget = budget or full_crawl_cost(categories)
+            allocate(categories, budget, tick_hours / 24)
+            chosen = due_categories(categories, now, budget * tick_hours / 24)
+
+        base = [] if bootstrap else _base_products(conn)
+        base_prices = {(p.get("Store"), p.get("Prod ID")): p.get("Current Price") for p in base}
+        fresh, refreshed, seen_products = [], set(), store_scraper.SeenProducts()
+        crawled = failed = probes = 0
+
+        def crawl(category):
+            """"done", "missing" or "failed" (a failed category stays due)"""
+            nonlocal crawled, failed
+            try:
+                result = store_scraper.fetch_category(category.url, seen_products)
+            except Exception as e:
+                print(f"Failed {category.venue} category {category.category_id}: {e}")
+                failed += 1
+                return "failed"
+            if result is None:
+                return "missing"
+            products, _, pages, category_slug = result
+            compared = [p for p in products if (p["Store"], p["Prod ID"]) in base_prices]
+            changed = sum(base_prices[(p["Store"], p["Prod ID"])] != p["Current Price"] for p in compared)
+            observe(category, len(compared), changed, now)
+            category.category_slug, category.products, category.pages = category_slug, len(products), pages
+            category.last_crawled = now
+            fresh.extend(products)
+            refreshed.add((category.store, category_slug))
+            crawled += 1
+            return "done"
+
+        with metrics.phase("crawl"):
+            for category in chosen:
+                if crawl(category) == "missing":
+                    # The venue dropped the category: so do its products and its schedule
+                    refreshed.add((category.store, category.category_slug))
+                    categories.remove(category)
+                    with conn:
+                        conn.execute("DELETE FROM categories WHERE venue = ? AND category_id = ?",
+                                     (category.venue, category.category_id))
+            # Bootstrap crawls every id of every venue; later ticks only probe the id after the last one
+            if bootstrap:
+                ends = {url_venue_slug(url): (url, 1) for url in store_scraper.venue_urls}
+            for venue, (url_template, category_id) in sorted(ends.items()):
+                while True:
+                    category = Category(venue, category_id, url_template, venue_name(url_template))
+                    probes += not bootstrap
+                    outcome = crawl(category)
+                    # An id that failed to load is only kept while bootstrapping, to be crawled next tick
+                    if outcome == "missing" or (outcome == "failed" and not bootstrap):
+                        break
+                    categories.append(category)
+                    category_id += 1
+                    if not bootstrap:
+                        break
+                ends[venue] = (url_template, category_id)
+
+        with metrics.phase("classify"):
+            reclassify(fresh)
+        # Products of the recrawled categories are replaced; the rest of the catalog carries over
+        fresh_keys = {(p["Store"], p["Prod ID"]) for p in fresh}
+        products = [p for p in base if (p.get("Store"), p.get("CategorySlug")) not in refreshed
+                    and (p.get("Store"), p.get("Prod ID")) not in fresh_keys] + fresh
+        snapshot = store_scraper.publish_snapshot(products)
+
+        # New categories start from the history's rates too
+        apply_history_rates(categories, rates)
+        allocate(categories, budget or full_crawl_cost(categories), tick_hours / 24)
+        save_categories(conn, categories)
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO venue_ends VALUES (?, ?, ?)",
+                             [(venue, url_template, missing_from) for venue, (url_template, missing_from) in ends.items()])
+        _set_meta(conn, "snapshot", snapshot)
+        return {"crawled": crawled, "probes": probes, "failed": failed,
+                "pages": metrics.report()["totals"]["pages"], "products": len(products),
+                "freshness": catalog_freshness(categories, [c.interval_days for c in categories])}
+    finally:
+        conn.close()
+
+def run(db_path=STATE_DB, budget=None, tick_hours=TICK_HOURS, once=False):
+    """Tick every tick_hours until interrupted"""
+    while True:
+        started = time.time()
+        stats = tick(db_path, budget, tick_hours)
+        print(f"Tick: crawled {stats['crawled']} categories ({stats['pages']} pages, {stats['probes']} probes, "
+              f"{stats['failed']} failed), {stats['products']} products, "
+              f"expected freshness {stats['freshness']:.1%}")
+        if once:
+            return
+        time.sleep(max(started + tick_hours * 3600 - time.time(), 0))
+
+def freshness(db_path=STATE_DB, now=None):
+    """Per category: venue, category id, store, slug, change rate, interval, age and freshness right now"""
+    now = time.time() if now is None else now
+    conn = connect(db_path)
+    try:
+        categories = load_categories(conn)
+    finally:
+        conn.close()
+    return [{"venue": c.venue, "category_id": c.category_id, "store": c.store, "category_slug": c.category_slug,
+             "products": c.products, "change_rate": c.change_rate, "interval_days": c.interval_days,
+             "age_days": c.age_days(now), "freshness": c.freshness(now)} for c in categories]
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Adaptive category refresh scheduler")
+    parser.add_argument("--db", default=STATE_DB)
+    sub = parser.add_subparsers(dest="command", required=True)
+    run_parser = sub.add_parser("run", help="crawl what is due every tick")
+    run_parser.add_argument("--budget", type=float, help="pages per day (default: what a daily full crawl costs)")
+    run_parser.add_argument("--tick-hours", type=float, default=TICK_HOURS)
+    run_parser.add_argument("--once", action="store_true", help="run a single tick")
+    plan_parser = sub.add_parser("plan", help="intervals the budget buys, against recrawling everything evenly")
+    plan_parser.add_argument("--budget", type=float)
+    plan_parser.add_argument("--tick-hours", type=float, default=TICK_HOURS)
+    status_parser = sub.add_parser("status", help="freshness of every category right now")
+    status_parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        run(args.db, args.budget, args.tick_hours, args.once)
+    elif args.command == "plan":
+        conn = connect(args.db)
+        try:
+            categories = load_categories(conn)
+        finally:
+            conn.close()
+        if not categories:
+            parser.error(f"no categories in {args.db} yet (run a first tick)")
+        budget = args.budget or full_crawl_cost(categories)
+        allocate(categories, budget, args.tick_hours / 24)
+        uniform = full_crawl_cost(categories) / budget
+        for c in sorted(categories, key=lambda c: c.interval_days):
+            print(f"{c.interval_days * 24:>8.1f} h  {c.change_rate:>8.4f}/day  {c.pages:>4} pages  {c.store} {c.category_slug}")
+        print(f"Budget {budget:.0f} pages/day: expected freshness "
+              f"{catalog_freshness(categories, [c.interval_days for c in categories]):.1%} adaptive, "
+              f"{catalog_freshness(categories, [uniform] * len(categories)):.1%} recrawling all every {uniform * 24:.1f} h")
+    else:
+        rows = freshness(args.db)
+        if args.json:
+            print(json.dumps(rows, indent=2, ensure_ascii=False))
+        else:
+            for row in sorted(rows, key=lambda r: r["freshness"]):
+                age = "never" if row["age_days"] is None else f"{row['age_days'] * 24:.1f} h"
+                print(f"{row['freshness']:>7.1%}  age {age:>9}  every {(row['interval_days'] or 0) * 24:>6.1f} h  "
+                      f"{row['store']} {row['category_slug']}")
+            weight = sum(max(r["products"], 1) for r in rows)
+            if weight:
+                print(f"Catalog freshness: {sum(max(r['products'], 1) * r['freshness'] for r in rows) / weight:.1%}")
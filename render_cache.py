@@ -0,0 +1,208 @@
+"""
+Render cache for the dashboard: store logos and product card HTML.
+
+Store logos are read and base64-encoded once, into data URIs and the two
+logo fragments the dashboard shows (grid header and cart column), instead
+of on every rerun. The HTML fragments of product cards (image and title
+blocks, grid and cart variants) are kept per product uuid in a bounded LRU
+shared by every session. The cache is keyed by a snapshot key and empties
+itself when the dashboard hands it a new one, so a new snapshot never shows
+old fragments.
+
+    python render_cache.py products_25-06-2025.7z    # page views timed with and without the cache
+"""
+import base64
+import mimetypes
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+# Card fragments kept (one entry per product and variant)
+CARD_CACHE_SIZE = 5000
+
+ICON_DIR = Path(__file__).parent / "icon"
+
+# Logo file (in the icon directory) of the stores whose name is not in it
+STORE_LOGO_FILES = {
+    'auchan-hypermarket-titan': "Auchan_2018.svg",
+    'carrefour-hypermarket-mega-mall': "Carrefour_2009_(Horizontal).svg",
+    'freshful-now': "Freshful-logo.svg",
+    'kaufland-pantelimon': "Kaufland_1984_wordmark.svg",
+    'Penny': "Penny_Markt_2012.svg",
+    'profi-baia-de-arama': "Profi_2016_no_symbol.svg"
+}
+
+def find_logo(store_name, store_logos, icon_dir=ICON_DIR):
+    """Path of a store's logo: the configured one, else an icon file named after the store"""
+    logo_path = store_logos.get(store_name)
+    if logo_path and Path(logo_path).exists():
+        return Path(logo_path)
+    icon_dir = Path(icon_dir)
+    if icon_dir.exists():
+        for file in icon_dir.iterdir():
+            if store_name.lower().replace(' ', '-') in file.name.lower():
+                return file
+    return None
+
+def data_uri(path):
+    """The file as a base64 data URI"""
+    mime = mimetypes.guess_type(str(path))[0] or "image/svg+xml"
+    with open(path, 'rb') as f:
+        return f"data:{mime};base64,{base64.b64encode(f.read()).decode()}"
+
+class LogoRenderer:
+    """Logo fragments of every store, encoded once"""
+    def __init__(self, stores, store_logos, icon_dir=ICON_DIR):
+        self.uris = {}
+        for store in stores:
+            path = find_logo(store, store_logos, icon_dir)
+            if path is None:
+                continue
+            try:
+                self.uris[store] = data_uri(path)
+            except OSError:
+                pass  # shown as the store name, like a store without a logo
+
+    def grid_html(self, store):
+        uri = self.uris.get(store)
+        if uri is None:
+            return f"<h3 style='text-align: center;'>{store}</h3>"
+        return f"""
+                    <div style="display: flex; justify-content: center; align-items: center;">
+                        <img src="{uri}" style="width: 200px; height: 80px; border-radius: 8px;" />
+                    </div>
+                    """
+
+    def cart_html(self, store):
+        uri = self.uris.get(store)
+        if uri is None:
+            return f"<h4 style='text-align: center;'>{store}</h4>"
+        return f"""
+                            <div style="display: flex; justify-content: left; align-items: left;">
+                                <img src="{uri}" style="width: 90px; height: 35px; border-radius: 8px; padding-bottom: 5px;" />
+                            </div>
+                            """
+
+def grid_card_html(row):
+    """(image block, title block) of a product card in a store's grid, from a store_page row"""
+    image_url, title, prodlink = row['Image URL'], row['Title'], row['Product Link']
+    short_title = title[:19] + "..." if len(title) > 2 else title
+    image_html = f"""
+                        <div class="image-wrapper">
+                                <a href={prodlink}>
+                                    <img src="{image_url}" style="width: 300px; height: 160px; object-fit: cover; border-radius: 8px;" />
+                                </a>
+                            <a href="{image_url}" target="_blank" class="fullscreen-icon">🔍</a>
+                        </div>
+                        """
+    title_html = f"""
+                        <div class="product-title-container">
+                            <span class="product-title-short">{short_title}</span>
+                            <div class="tooltip">{title}</div>
+                        </div>
+                        """
+    return image_html, title_html
+
+def cart_card_html(entry):
+    """(image block, title block) of a product in the cart, from a lookup entry"""
+    image_url, title, prodlink = entry['image_url'], entry['title'], entry['prod_link']
+    short_title = title[:20] + "..." if len(title) > 2 else title
+    image_html = f"""
+                                    <div class="image-wrapper">
+                                            <a href={prodlink}>
+                                                <img src="{image_url}" style="width: 200px; height: 100px; object-fit: cover; border-radius: 8px; padding-top: 0px; padding-bottom: 5px;" />
+                                            </a>
+                                        <a href="{image_url}" target="_blank" class="fullscreen-icon">🔍</a>
+                                    </div>
+                                    """
+    title_html = f"""
+                                    <div class="product-title-container">
+                                        <span class="product-title-short">{short_title}</span>
+                                        <div class="tooltip">{title}</div>
+                                    </div>
+                                    """
+    return image_html, title_html
+
+class CardCache:
+    """Bounded LRU of card fragments by (variant, product uuid), for one snapshot at a time"""
+    def __init__(self, size=CARD_CACHE_SIZE):
+        self.size = size
+        self.snapshot = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def _get(self, snapshot, key, build, record):
+        with self._lock:
+            if snapshot != self.snapshot:
+                self._entries.clear()
+                self.snapshot = snapshot
+            fragments = self._entries.get(key)
+            if fragments is not None:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return fragments
+            self.misses += 1
+        # Built outside the lock; two sessions building the same card store the same value
+        fragments = build(record)
+        with self._lock:
+            if snapshot == self.snapshot:
+                self._entries[key] = fragments
+                while len(self._entries) > self.size:
+                    self._entries.popitem(last=False)
+        return fragments
+
+    def grid(self, snapshot, row):
+        return self._get(snapshot, ("grid", row['product_uuid']), grid_card_html, row)
+
+    def cart(self, snapshot, product_uuid, entry):
+        return self._get(snapshot, ("cart", product_uuid), cart_card_html, entry)
+
+    def __len__(self):
+        return len(self._entries)
+
+if __name__ == "__main__":
+    import argparse
+    import tempfile
+    import time
+
+    from product_store import SqliteProductStore, write_products
+    from snapshot_io import read_snapshot
+
+    parser = argparse.ArgumentParser(description="Time dashboard page rendering with and without the render cache")
+    parser.add_argument("snapshot")
+    parser.add_argument("--views", type=int, default=200, help="page views per store")
+    parser.add_argument("--icon-dir", default=str(ICON_DIR))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = Path(workdir) / "products.sqlite"
+        write_products(db_path, read_snapshot(args.snapshot), Path(args.snapshot).name)
+        store = SqliteProductStore(db_path)
+        stores = store.stores()
+        pages = {name: [store.store_page(name, page, 5) for page in range(1, 6)] for name in stores}
+
+        store_logos = {name: Path(args.icon_dir) / file_name for name, file_name in STORE_LOGO_FILES.items()}
+        # What a rerun did before: encode both logo variants and build every card
+        start = time.perf_counter()
+        for view in range(args.views):
+            for name in stores:
+                path = find_logo(name, store_logos, args.icon_dir)
+                if path is not None:
+                    data_uri(path), data_uri(path)
+                for row in pages[name][view % 5]:
+                    grid_card_html(row)
+        uncached = time.perf_counter() - start
+
+        start = time.perf_counter()
+        logos, cards = LogoRenderer(stores, store_logos, args.icon_dir), CardCache()
+        for view in range(args.views):
+            for name in stores:
+                logos.grid_html(name), logos.cart_html(name)
+                for row in pages[name][view % 5]:
+                    cards.grid(store.snapshot, row)
+        cached = time.perf_counter() - start
+
+    print(f"{args.views} views of {len(stores)} stores ({len(logos.uris)} logos): "
+          f"{uncached * 1000 / args.views:.2f} ms per view uncached, {cached * 1000 / args.views:.2f} ms cached "
+          f"({cards.hits} hits, {cards.misses} misses)")
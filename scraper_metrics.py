@@ -0,0 +1,195 @@
+"""
+Run metrics for the scraper.
+
+RunMetrics collects, per venue, request counts by status, a latency
+histogram, retries by reason (429, other HTTP errors, timeouts, connection
+errors), bytes received, items parsed and duplicates skipped, plus time per
+phase and title-parsing fallbacks. The result is written as a JSON run
+report or as a Prometheus text file (node_exporter textfile format) so runs
+can be compared night to night.
+"""
+import json
+import re
+import time
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the request latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def venue_name(url):
+    """Store name of a Wolt venue URL (slug up to the first digit), as used in the products"""
+    if '/slug/' not in url:
+        return "unknown"
+    store_slug = url.split('/slug/')[1].split('/assortment')[0]
+    return re.split(r'\d', store_slug, maxsplit=1)[0].rstrip('-')
+
+class VenueMetrics:
+    def __init__(self):
+        self.requests = {}  # status code (or "error") -> count
+        self.retries = {}   # reason -> count
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_sum = 0.0
+        self.bytes = 0
+        self.pages = 0
+        self.items_parsed = 0
+        self.duplicates = 0
+        self.category_seconds = 0.0
+        self.parse_seconds = 0.0
+
+    def to_dict(self):
+        count = sum(self.latency_buckets)
+        return {
+            "requests": sum(self.requests.values()),
+            "requests_by_status": dict(self.requests),
+            "retries": dict(self.retries),
+            "latency": {
+                "count": count,
+                "sum_seconds": round(self.latency_sum, 4),
+                "mean_seconds": round(self.latency_sum / count, 4) if count else None,
+                "buckets": {str(bound): n for bound, n in zip(LATENCY_BUCKETS + ("+Inf",), self.latency_buckets)},
+            },
+            "bytes": self.bytes,
+            "pages": self.pages,
+            "items_parsed": self.items_parsed,
+            "duplicates": self.duplicates,
+            "category_seconds": round(self.category_seconds, 3),
+            "parse_seconds": round(self.parse_seconds, 3),
+        }
+
+class RunMetrics:
+    def __init__(self):
+        self.started = time.time()
+        self.venues = {}
+        self.phases = {}
+        self.parse_fallbacks = {}
+
+    def venue(self, url):
+        name = venue_name(url)
+        if name not in self.venues:
+            self.venues[name] = VenueMetrics()
+        return self.venues[name]
+
+    def record_request(self, url, status, seconds, nbytes=0):
+        venue = self.venue(url)
+        venue.requests[status] = venue.requests.get(status, 0) + 1
+        for idx, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                venue.latency_buckets[idx] += 1
+                break
+        else:
+            venue.latency_buckets[-1] += 1
+        venue.latency_sum += seconds
+        venue.bytes += nbytes
+
+    def record_retry(self, url, reason):
+        venue = self.venue(url)
+        venue.retries[reason] = venue.retries.get(reason, 0) + 1
+
+    def record_page(self, url, items_parsed, duplicates, seconds):
+        venue = self.venue(url)
+        venue.pages += 1
+        venue.items_parsed += items_parsed
+        venue.duplicates += duplicates
+        venue.parse_seconds += seconds
+
+    def record_category(self, url, seconds):
+        self.venue(url).category_seconds += seconds
+
+    def record_fallback(self, kind):
+        self.parse_fallbacks[kind] = self.parse_fallbacks.get(kind, 0) + 1
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def merge_parse_counts(self, other):
+        """Add the page/item/fallback counts of a RunMetrics from a worker process"""
+        for name, venue in other.venues.items():
+            mine = self.venues.setdefault(name, VenueMetrics())
+            mine.pages += venue.pages
+            mine.items_parsed += venue.items_parsed
+            mine.duplicates += venue.duplicates
+            mine.parse_seconds += venue.parse_seconds
+        for kind, count in other.parse_fallbacks.items():
+            self.parse_fallbacks[kind] = self.parse_fallbacks.get(kind, 0) + count
+
+    def merge(self, other):
+        """Add everything a RunMetrics of a crawl worker process recorded (phases excepted)"""
+        for name, venue in other.venues.items():
+            mine = self.venues.setdefault(name, VenueMetrics())
+            for status, count in venue.requests.items():
+                mine.requests[status] = mine.requests.get(status, 0) + count
+            for reason, count in venue.retries.items():
+                mine.retries[reason] = mine.retries.get(reason, 0) + count
+            mine.latency_buckets = [a + b for a, b in zip(mine.latency_buckets, venue.latency_buckets)]
+            mine.latency_sum += venue.latency_sum
+            mine.bytes += venue.bytes
+            mine.category_seconds += venue.category_seconds
+        self.merge_parse_counts(other)
+
+    def report(self):
+        venues = {name: venue.to_dict() for name, venue in sorted(self.venues.items())}
+        totals = {key: sum(v[key] for v in venues.values())
+                  for key in ("requests", "bytes", "pages", "items_parsed", "duplicates")}
+        totals["retries"] = sum(sum(v["retries"].values()) for v in venues.values())
+        totals["rate_limited"] = sum(v["retries"].get("429", 0) for v in venues.values())
+        return {
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+            "duration_seconds": round(time.time() - self.started, 3),
+            "totals": totals,
+            "phases_seconds": {name: round(seconds, 3) for name, seconds in self.phases.items()},
+            "parse_fallbacks": dict(self.parse_fallbacks),
+            "venues": venues,
+        }
+
+    def write_json(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, indent=2)
+
+    def write_prometheus(self, path, prefix="grocery_scraper"):
+        """Write the metrics in the Prometheus text exposition format"""
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            for labels, value in samples:
+                label_str = ",".join(f'{k}="{v}"' for k, v in labels.items())
+                lines.append(f"{prefix}_{name}{{{label_str}}} {value}" if label_str else f"{prefix}_{name} {value}")
+
+        metric("requests_total", "counter", "HTTP requests by venue and status",
+               [({"venue": n, "status": s}, c) for n, v in self.venues.items() for s, c in v.requests.items()])
+        metric("retries_total", "counter", "Retried requests by venue and reason",
+               [({"venue": n, "reason": r}, c) for n, v in self.venues.items() for r, c in v.retries.items()])
+
+        lines.append(f"# HELP {prefix}_request_duration_seconds Request latency by venue")
+        lines.append(f"# TYPE {prefix}_request_duration_seconds histogram")
+        for name, venue in self.venues.items():
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), venue.latency_buckets):
+                cumulative += count
+                lines.append(f'{prefix}_request_duration_seconds_bucket{{venue="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'{prefix}_request_duration_seconds_sum{{venue="{name}"}} {venue.latency_sum:.6f}')
+            lines.append(f'{prefix}_request_duration_seconds_count{{venue="{name}"}} {cumulative}')
+
+        metric("bytes_total", "counter", "Response bytes received by venue",
+               [({"venue": n}, v.bytes) for n, v in self.venues.items()])
+        metric("pages_total", "counter", "Pages parsed by venue",
+               [({"venue": n}, v.pages) for n, v in self.venues.items()])
+        metric("items_parsed_total", "counter", "Items normalized by venue",
+               [({"venue": n}, v.items_parsed) for n, v in self.venues.items()])
+        metric("duplicates_total", "counter", "Duplicate items skipped by venue",
+               [({"venue": n}, v.duplicates) for n, v in self.venues.items()])
+        metric("parse_fallbacks_total", "counter", "Titles handled by a fallback rule",
+               [({"kind": k}, c) for k, c in self.parse_fallbacks.items()])
+        metric("phase_seconds", "gauge", "Wall time per scraper phase",
+               [({"phase": p}, f"{s:.3f}") for p, s in self.phases.items()])
+        metric("run_timestamp_seconds", "gauge", "Start of the run",
+               [({}, int(self.started))])
+
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
@@ -0,0 +1,158 @@
+"""
+Streaming diff between two daily snapshots.
+
+Both snapshots are streamed, sorted by (Store, Prod ID) with an external
+merge sort (sorted runs spilled to temporary files) and merge-joined, so
+memory stays bounded by the run size whatever the catalog size.
+
+The changeset is written as JSON lines, one entry per product:
+    {"op": "added", "key": [store, prod_id], "Title": ..., "Current Price": ...}
+    {"op": "removed", "key": [store, prod_id], "Title": ...}
+    {"op": "changed", "key": [store, prod_id], "fields": {"Current Price": [old, new], ...}}
+"""
+import heapq
+import json
+import os
+import tempfile
+import time
+
+from snapshot_io import iter_snapshot
+
+# Fields compared between the two days
+TRACKED_FIELDS = ["Current Price", "Old Price", "Title", "Unit", "Quantity", "Cathegori", "CategorySlug"]
+PRICE_FIELDS = {"Current Price", "Old Price"}
+CATEGORY_FIELDS = {"Cathegori", "CategorySlug"}
+
+# Records held in memory per sorted run
+RUN_SIZE = 50000
+
+def _key(record):
+    return record["Store"], record["Prod ID"]
+
+def _project(record):
+    """Keep only what the diff needs so runs stay small"""
+    return [record["Store"], record["Prod ID"]] + [record.get(field) for field in TRACKED_FIELDS]
+
+def _read_run(path):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            yield json.loads(line)
+
+def sorted_records(records, run_size=RUN_SIZE, tmpdir=None):
+    """
+    Yield projected records sorted by (store, prod_id) using at most run_size
+    records in memory. Spilled runs are removed once the generator finishes.
+    """
+    run_paths, run = [], []
+    try:
+        for record in records:
+            run.append(_project(record))
+            if len(run) >= run_size:
+                run.sort(key=lambda r: (r[0], r[1]))
+                fd, run_path = tempfile.mkstemp(suffix=".jsonl", dir=tmpdir)
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    for r in run:
+                        f.write(json.dumps(r, ensure_ascii=False) + "\n")
+                run_paths.append(run_path)
+                run = []
+
+        run.sort(key=lambda r: (r[0], r[1]))
+        if not run_paths:
+            yield from run
+            return
+        yield from heapq.merge(run, *(_read_run(p) for p in run_paths), key=lambda r: (r[0], r[1]))
+    finally:
+        for run_path in run_paths:
+            os.remove(run_path)
+
+def merge_join(old_sorted, new_sorted):
+    """Yield changeset entries from two streams sorted by (store, prod_id)"""
+    old_iter, new_iter = iter(old_sorted), iter(new_sorted)
+    old, new = next(old_iter, None), next(new_iter, None)
+    previous_key = None
+
+    while old is not None or new is not None:
+        old_key = (old[0], old[1]) if old is not None else None
+        new_key = (new[0], new[1]) if new is not None else None
+
+        if new is None or (old is not None and old_key < new_key):
+            if old_key != previous_key:
+                yield {"op": "removed", "key": list(old_key), "Title": old[2 + TRACKED_FIELDS.index("Title")]}
+            previous_key = old_key
+            old = next(old_iter, None)
+        elif old is None or new_key < old_key:
+            if new_key != previous_key:
+                entry = {"op": "added", "key": list(new_key)}
+                entry.update(zip(TRACKED_FIELDS, new[2:]))
+                yield entry
+            previous_key = new_key
+            new = next(new_iter, None)
+        else:
+            changed = {field: [a, b] for field, a, b in zip(TRACKED_FIELDS, old[2:], new[2:]) if a != b}
+            if changed and new_key != previous_key:
+                yield {"op": "changed", "key": list(new_key), "fields": changed}
+            previous_key = new_key
+            old, new = next(old_iter, None), next(new_iter, None)
+
+class _Counter:
+    """Pass-through iterator that counts the rows read from a snapshot"""
+    def __init__(self, iterable):
+        self.iterable = iterable
+        self.count = 0
+
+    def __iter__(self):
+        for item in self.iterable:
+            self.count += 1
+            yield item
+
+def diff_snapshots(old_path, new_path, out=None, run_size=RUN_SIZE):
+    """
+    Diff two snapshot files, writing the changeset as JSON lines to out (a text
+    file object, optional). Returns the summary statistics.
+    """
+    start = time.perf_counter()
+    old_rows, new_rows = _Counter(iter_snapshot(old_path)), _Counter(iter_snapshot(new_path))
+    summary = {"added": 0, "removed": 0, "changed": 0, "price_changes": 0, "price_up": 0,
+               "price_down": 0, "category_changes": 0}
+
+    for entry in merge_join(sorted_records(old_rows, run_size), sorted_records(new_rows, run_size)):
+        summary[entry["op"]] += 1
+        if entry["op"] == "changed":
+            fields = entry["fields"]
+            if PRICE_FIELDS & fields.keys():
+                summary["price_changes"] += 1
+            if "Current Price" in fields:
+                before, after = fields["Current Price"]
+                summary["price_up" if (after or 0) > (before or 0) else "price_down"] += 1
+            if CATEGORY_FIELDS & fields.keys():
+                summary["category_changes"] += 1
+        if out is not None:
+            out.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    elapsed = time.perf_counter() - start
+    rows = old_rows.count + new_rows.count
+    summary.update({
+        "old_rows": old_rows.count,
+        "new_rows": new_rows.count,
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(rows / elapsed) if elapsed else None,
+    })
+    return summary
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Stream the changes between two daily snapshots")
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument("-o", "--output", help="changeset file (JSON lines); defaults to stdout")
+    parser.add_argument("--run-size", type=int, default=RUN_SIZE, help="records kept in memory per sorted run")
+    args = parser.parse_args()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as out:
+            summary = diff_snapshots(args.old, args.new, out, args.run_size)
+    else:
+        summary = diff_snapshots(args.old, args.new, sys.stdout, args.run_size)
+    print(json.dumps(summary, indent=2), file=sys.stderr)
@@ -0,0 +1,176 @@
+import gzip
+import json
+import lzma
+import re
+from datetime import datetime
+from io import BytesIO, TextIOWrapper
+from pathlib import Path
+
+import py7zr
+from py7zr.io import BytesIOFactory
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+SNAPSHOT_PATTERN = re.compile(r"products_(\d{2}-\d{2}-\d{4})")
+
+class Codec:
+    """
+    How the JSON of a snapshot is compressed. compress/decompress work on
+    bytes in memory; open_stream, when set, opens a file for streaming reads.
+    """
+    def __init__(self, name, suffix, compress, decompress, default_level=None, open_stream=None):
+        self.name = name
+        self.suffix = suffix
+        self.compress = compress  # compress(data, level, inner_name)
+        self.decompress = decompress
+        self.default_level = default_level
+        self.open_stream = open_stream
+
+def _compress_7z(data, level, inner_name):
+    buffer = BytesIO()
+    with py7zr.SevenZipFile(buffer, "w") as archive:
+        archive.writef(BytesIO(data), inner_name)
+    return buffer.getvalue()
+
+def _extract_7z(source):
+    """The bytes of the single file inside a 7z archive (a path or file object)"""
+    with py7zr.SevenZipFile(source, mode="r") as archive:
+        # Assuming there's only one file inside
+        factory = BytesIOFactory(sum(entry.uncompressed for entry in archive.list()) + 1)
+        archive.extractall(factory=factory)
+    extracted = next(iter(factory.products.values()))
+    extracted.seek(0)
+    return extracted.read()
+
+def _decompress_7z(data):
+    return _extract_7z(BytesIO(data))
+
+CODECS = {
+    "7z": Codec("7z", ".7z", _compress_7z, _decompress_7z),
+    "xz": Codec("xz", ".json.xz", lambda data, level, name: lzma.compress(data, preset=level), lzma.decompress,
+                default_level=6, open_stream=lambda path: lzma.open(path, "rb")),
+    "gzip": Codec("gzip", ".json.gz", lambda data, level, name: gzip.compress(data, compresslevel=level, mtime=0),
+                  gzip.decompress, default_level=6, open_stream=lambda path: gzip.open(path, "rb")),
+    "json": Codec("json", ".json", lambda data, level, name: data, lambda data: data,
+                  open_stream=lambda path: open(path, "rb")),
+}
+if zstandard is not None:
+    CODECS["zstd"] = Codec(
+        "zstd", ".json.zst",
+        lambda data, level, name: zstandard.ZstdCompressor(level=level).compress(data),
+        lambda data: zstandard.ZstdDecompressor().decompress(data),
+        default_level=3, open_stream=lambda path: zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True))
+if lz4 is not None:
+    CODECS["lz4"] = Codec(
+        "lz4", ".json.lz4",
+        lambda data, level, name: lz4.frame.compress(data, compression_level=level),
+        lz4.frame.decompress, default_level=0, open_stream=lambda path: lz4.frame.open(path, "rb"))
+
+def codec_for_path(path):
+    """The codec of a snapshot file, from its suffix"""
+    name = Path(path).name
+    matches = [codec for codec in CODECS.values() if name.endswith(codec.suffix)]
+    if not matches:
+        raise ValueError(f"Unknown snapshot format: {path}")
+    return max(matches, key=lambda codec: len(codec.suffix))
+
+def snapshot_filename(date_str, codec="7z"):
+    return f"products_{date_str}{CODECS[codec].suffix}"
+
+def snapshot_date(path):
+    """Return the date encoded in a products_DD-MM-YYYY.* file name"""
+    match = SNAPSHOT_PATTERN.search(Path(path).name)
+    if not match:
+        raise ValueError(f"Not a snapshot file name: {path}")
+    return datetime.strptime(match.group(1), "%d-%m-%Y").date()
+
+def _is_snapshot_file(path):
+    try:
+        codec_for_path(path)
+    except ValueError:
+        return False
+    return path.is_file() and SNAPSHOT_PATTERN.search(path.name) is not None
+
+def list_snapshots(directory="."):
+    """All products_DD-MM-YYYY snapshot files in a directory, whatever their codec, oldest first"""
+    return sorted((p for p in Path(directory).glob("products_*") if _is_snapshot_file(p)), key=snapshot_date)
+
+def iter_json_array(f, chunk_size=1 << 20):
+    """Yield the elements of a JSON array from a text file without loading it whole"""
+    decoder = json.JSONDecoder()
+    buffer, pos, eof = "", 0, False
+
+    def skip(chars):
+        nonlocal pos
+        while pos < len(buffer) and buffer[pos] in chars:
+            pos += 1
+
+    def fill():
+        nonlocal buffer, pos, eof
+        chunk = f.read(chunk_size)
+        eof = not chunk
+        buffer, pos = buffer[pos:] + chunk, 0
+
+    fill()
+    skip(" \t\r\n")
+    if buffer[pos:pos + 1] != "[":
+        raise ValueError("Snapshot is not a JSON array")
+    pos += 1
+
+    while True:
+        skip(" \t\r\n,")
+        if pos >= len(buffer):
+            if eof:
+                raise ValueError("Unterminated JSON array")
+            fill()
+            continue
+        if buffer[pos] == "]":
+            return
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            fill()
+            continue
+        if end == len(buffer) and not eof:
+            # A scalar may continue in the next chunk
+            fill()
+            continue
+        pos = end
+        yield item
+
+def iter_snapshot(path):
+    """Stream the products of a snapshot one by one"""
+    path = Path(path)
+    codec = codec_for_path(path)
+    if codec.open_stream is not None:
+        with codec.open_stream(path) as raw, TextIOWrapper(raw, encoding="utf-8") as f:
+            yield from iter_json_array(f)
+        return
+
+    # 7z has no streaming reader; decompress into memory (no temp files) and
+    # parse the products from that buffer
+    with TextIOWrapper(BytesIO(_extract_7z(path)), encoding="utf-8") as f:
+        yield from iter_json_array(f)
+
+def read_snapshot(path):
+    """Load the product list stored in a daily snapshot, decompressing it in memory"""
+    path = Path(path)
+    return json.loads(codec_for_path(path).decompress(path.read_bytes()))
+
+def write_snapshot(path, products, level=None):
+    """Write products as a single JSON document, compressed with the codec of the file suffix"""
+    path = Path(path)
+    codec = codec_for_path(path)
+    data = json.dumps(products, ensure_ascii=False).encode("utf-8")
+    inner_name = path.name[:-len(codec.suffix)] + ".json"
+    path.write_bytes(codec.compress(data, codec.default_level if level is None else level, inner_name))
@@ -0,0 +1,115 @@
+"""
+Explicit DataFrame schema for loaded snapshots.
+
+Building the DataFrame straight from the JSON records gives every column a
+default dtype: the few distinct values of Store, Unit, Cathegori, ... are
+stored once per row, and long text nobody looks at (Description) is kept.
+load_snapshot_frame instead:
+- stores the repetitive columns as categoricals,
+- downcasts MetrPrice (only used for sorting) to float32; prices and
+  quantities are shown and summed, so they stay float64,
+- drops Product Link, which is the store's venue link (city and venue slug)
+  + Prod ID, and keeps the venue link per store in df.attrs["venue_links"]
+  (DataFrameProductStore puts it back on the few records it returns),
+- leaves out Description; lazy_column reads it back for given products.
+A sharded snapshot directory (see snapshot_shards) is read the same way, only
+for the stores asked for.
+
+    python snapshot_schema.py products_25-06-2025.7z    # bytes per row, before and after
+"""
+import pandas as pd
+
+from product_store import venue_link
+from snapshot_io import iter_snapshot, read_snapshot
+from snapshot_shards import is_sharded, load_shards
+
+CATEGORICAL_COLUMNS = ["Store", "Unit", "Cathegori", "catheg", "CategorySlug", "LowValFlag"]
+FLOAT32_COLUMNS = ["MetrPrice"]
+FLOAT64_COLUMNS = ["Current Price", "Old Price", "Quantity"]
+LAZY_COLUMNS = ["Description"]
+
+def apply_schema(df):
+    """Cast the known columns of a snapshot DataFrame to their compact dtypes"""
+    for column in CATEGORICAL_COLUMNS:
+        if column in df:
+            df[column] = df[column].astype("category")
+    for column in FLOAT32_COLUMNS:
+        if column in df:
+            df[column] = pd.to_numeric(df[column], errors="coerce").astype("float32")
+    for column in FLOAT64_COLUMNS:
+        if column in df:
+            df[column] = pd.to_numeric(df[column], errors="coerce").astype("float64")
+    return df
+
+def load_snapshot_frame(path, lazy_columns=LAZY_COLUMNS, derive_links=True, stores=None):
+    """Load a snapshot (archive or shard directory) as a DataFrame with the compact schema"""
+    if is_sharded(path):
+        source = load_shards(path, stores)
+    else:
+        source = (r for r in iter_snapshot(path) if stores is None or r.get("Store") in stores)
+
+    records, venue_links, derivable = [], {}, derive_links
+    for record in source:
+        for column in lazy_columns:
+            record.pop(column, None)
+        if derivable:
+            link = venue_link(record.get("Product Link"), record.get("Prod ID"))
+            # Every product of a store must share one venue link, or the links are kept as they are
+            derivable = link is not None and venue_links.setdefault(record.get("Store"), link) == link
+        records.append(record)
+
+    df = apply_schema(pd.DataFrame(records))
+    if derivable and "Product Link" in df:
+        df = df.drop(columns=["Product Link"])
+        df.attrs["venue_links"] = venue_links
+    return df
+
+def lazy_column(path, column, keys):
+    """Values of a column left out by load_snapshot_frame, for the given (Store, Prod ID) keys"""
+    wanted = set(keys)
+    values = {}
+    if is_sharded(path):
+        records = load_shards(path, {store for store, _ in wanted})
+    else:
+        records = iter_snapshot(path)
+    for record in records:
+        key = (record.get("Store"), record.get("Prod ID"))
+        if key in wanted:
+            values[key] = record.get(column)
+            if len(values) == len(wanted):
+                break
+    return values
+
+def memory_report(path):
+    """Bytes per row of each column, default dtypes against the compact schema"""
+    before = pd.DataFrame(read_snapshot(path))
+    after = load_snapshot_frame(path)
+    before_usage = before.memory_usage(deep=True, index=False)
+    after_usage = after.memory_usage(deep=True, index=False)
+    rows = len(before)
+    columns = {}
+    for column in before.columns:
+        columns[column] = {
+            "dtype": str(after[column].dtype) if column in after else "dropped",
+            "before": round(before_usage[column] / rows, 1),
+            "after": round(after_usage[column] / rows, 1) if column in after else 0.0,
+        }
+    return {
+        "rows": rows,
+        "columns": columns,
+        "before_bytes_per_row": round(before_usage.sum() / rows, 1),
+        "after_bytes_per_row": round(after_usage.sum() / rows, 1),
+    }
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) != 2:
+        print("Usage: python snapshot_schema.py products_DD-MM-YYYY.7z")
+        sys.exit(1)
+
+    report = memory_report(sys.argv[1])
+    print(f"{'column':<16}{'dtype':>12}{'before':>10}{'after':>10}  (bytes per row, {report['rows']} rows)")
+    for column, usage in report["columns"].items():
+        print(f"{column:<16}{usage['dtype']:>12}{usage['before']:>10}{usage['after']:>10}")
+    print(f"{'total':<16}{'':>12}{report['before_bytes_per_row']:>10}{report['after_bytes_per_row']:>10}")
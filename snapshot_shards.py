@@ -0,0 +1,209 @@
+"""
+Daily snapshots split into per-store shards.
+
+A sharded snapshot is a directory products_DD-MM-YYYY/ holding one shard
+(7z by default, or any snapshot_io codec) per store (stores with more than SHARD_ROWS products get one shard per
+Cathegori instead) and an index.json listing every shard with its store,
+category and row count. Shards are written in parallel processes and read
+in parallel threads, a reader
+only opens the shards of the stores it asks for, and a partial re-scrape can
+replace the shards of a single store with update_store.
+
+    python snapshot_shards.py split products_25-06-2025.7z
+    python snapshot_shards.py load products_25-06-2025 --stores penny profi-baia-de-arama
+    python snapshot_shards.py info products_25-06-2025
+"""
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
+from snapshot_io import CODECS, read_snapshot, snapshot_date, write_snapshot
+
+INDEX_FILE = "index.json"
+
+# Shards are written here first and moved next to the index when complete
+TMP_DIR = ".tmp"
+
+# Stores with more products than this are split by category
+SHARD_ROWS = 5000
+
+def _slug(value):
+    return re.sub(r"[^a-z0-9]+", "-", str(value).lower()).strip("-") or "none"
+
+def shard_directory(date_str, base_dir="."):
+    return Path(base_dir) / f"products_{date_str}"
+
+def plan_shards(products, shard_rows=SHARD_ROWS):
+    """Group products into shards: {(store, category or None): [products]}"""
+    by_store = {}
+    for product in products:
+        by_store.setdefault(product.get("Store"), []).append(product)
+
+    shards = {}
+    for store, store_products in by_store.items():
+        if len(store_products) <= shard_rows:
+            shards[(store, None)] = store_products
+            continue
+        for product in store_products:
+            shards.setdefault((store, product.get("Cathegori")), []).append(product)
+    return shards
+
+def _map(function, *iterables, processes=None, jobs=1, executor=ProcessPoolExecutor):
+    # A pool of one worker would only add the cost of pickling the products
+    workers = processes or min(jobs, os.cpu_count() or 1)
+    if workers <= 1:
+        return list(map(function, *iterables))
+    with executor(max_workers=workers) as pool:
+        return list(pool.map(function, *iterables))
+
+def _shard_file(store, category, codec):
+    if category is None:
+        return f"{_slug(store)}{CODECS[codec].suffix}"
+    return f"{_slug(store)}__{_slug(category)}{CODECS[codec].suffix}"
+
+def _write_shard(path, products):
+    # Swapped in whole, so a reader never opens a half-written shard (the
+    # temporary file keeps the name, which the archive stores inside it)
+    tmp_path = path.parent / TMP_DIR / path.name
+    write_snapshot(tmp_path, products)
+    size = os.path.getsize(tmp_path)
+    os.replace(tmp_path, path)
+    return size
+
+def _read_index(directory):
+    with open(Path(directory) / INDEX_FILE, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def _write_index(directory, index):
+    # Written last and swapped in, so readers never see shards that are not there yet
+    tmp_path = Path(directory) / (INDEX_FILE + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, Path(directory) / INDEX_FILE)
+
+def _write_shards(directory, shards, processes=None, codec="7z"):
+    """Write {(store, category): products} in parallel and return their index entries"""
+    directory = Path(directory)
+    (directory / TMP_DIR).mkdir(parents=True, exist_ok=True)
+    keys = list(shards)
+    files = [_shard_file(store, category, codec) for store, category in keys]
+    sizes = _map(_write_shard, [directory / f for f in files], [shards[k] for k in keys],
+                 processes=processes, jobs=len(keys))
+    try:
+        (directory / TMP_DIR).rmdir()
+    except OSError:
+        pass  # another writer is still using it
+    return [{"file": f, "store": store, "category": category, "rows": len(shards[(store, category)]), "bytes": size}
+            for f, (store, category), size in zip(files, keys, sizes)]
+
+def write_shards(directory, products, processes=None, shard_rows=SHARD_ROWS, codec="7z"):
+    """Write a sharded snapshot of products to directory; returns the index"""
+    directory = Path(directory)
+    entries = _write_shards(directory, plan_shards(products, shard_rows), processes, codec)
+    index = {"snapshot": directory.name, "rows": sum(e["rows"] for e in entries), "shards": entries}
+    _write_index(directory, index)
+    return index
+
+def update_store(directory, store, products, processes=None, shard_rows=SHARD_ROWS, codec="7z"):
+    """
+    Replace the shards of one store after a partial re-scrape; returns the index.
+    The new shards are swapped in first and the index last, then the store's
+    shards the new index no longer lists are removed.
+    """
+    directory = Path(directory)
+    index = _read_index(directory)
+    old_files = {e["file"] for e in index["shards"] if e["store"] == store}
+    store_products = [p for p in products if p.get("Store") == store]
+    entries = _write_shards(directory, plan_shards(store_products, shard_rows), processes, codec) if store_products else []
+
+    index["shards"] = [e for e in index["shards"] if e["store"] != store] + entries
+    index["rows"] = sum(e["rows"] for e in index["shards"])
+    _write_index(directory, index)
+    for stale in old_files - {e["file"] for e in entries}:
+        os.remove(directory / stale)
+    return index
+
+def shard_stores(directory):
+    """Stores of a sharded snapshot, from its index"""
+    return sorted({e["store"] for e in _read_index(directory)["shards"]})
+
+def load_shards(directory, stores=None, categories=None, threads=None):
+    """
+    Products of the selected stores (and categories), reading their shards in
+    parallel threads. The dashboard calls this inside the Streamlit server, a
+    threaded process that is not safe to fork, and worker processes would
+    also pickle every record back; only the scraper's writes use processes.
+    """
+    directory = Path(directory)
+    entries = [e for e in _read_index(directory)["shards"]
+               if (stores is None or e["store"] in stores)
+               and (categories is None or e["category"] is None or e["category"] in categories)]
+    if not entries:
+        return []
+
+    paths = [directory / e["file"] for e in entries]
+    shard_products = _map(read_snapshot, paths, processes=threads, jobs=len(paths), executor=ThreadPoolExecutor)
+
+    products = []
+    for shard in shard_products:
+        if categories is None:
+            products.extend(shard)
+        else:
+            # Whole-store shards hold every category
+            products.extend(p for p in shard if p.get("Cathegori") in categories)
+    return products
+
+def is_sharded(path):
+    return Path(path).is_dir() and (Path(path) / INDEX_FILE).exists()
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Per-store snapshot shards")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    split_parser = subparsers.add_parser("split", help="shard an existing products_DD-MM-YYYY.7z")
+    split_parser.add_argument("snapshot")
+    split_parser.add_argument("--output", help="shard directory (default: next to the snapshot)")
+    split_parser.add_argument("--shard-rows", type=int, default=SHARD_ROWS)
+    split_parser.add_argument("--processes", type=int)
+    split_parser.add_argument("--codec", choices=sorted(CODECS), default="7z")
+
+    load_parser = subparsers.add_parser("load", help="time loading some or all stores")
+    load_parser.add_argument("directory")
+    load_parser.add_argument("--stores", nargs="+")
+    load_parser.add_argument("--threads", type=int)
+
+    update_parser = subparsers.add_parser("update", help="replace one store's shards from a re-scrape")
+    update_parser.add_argument("directory")
+    update_parser.add_argument("snapshot", help="snapshot holding the re-scraped products")
+    update_parser.add_argument("--store", required=True)
+    update_parser.add_argument("--processes", type=int)
+
+    info_parser = subparsers.add_parser("info", help="list the shards of a directory")
+    info_parser.add_argument("directory")
+    args = parser.parse_args()
+
+    if args.command == "split":
+        snapshot = Path(args.snapshot)
+        output = Path(args.output) if args.output else shard_directory(snapshot_date(snapshot).strftime("%d-%m-%Y"), snapshot.parent)
+        start = time.perf_counter()
+        index = write_shards(output, read_snapshot(snapshot), args.processes, args.shard_rows, args.codec)
+        print(f"Wrote {index['rows']} products in {len(index['shards'])} shards to {output} "
+              f"in {time.perf_counter() - start:.2f} seconds")
+    elif args.command == "load":
+        start = time.perf_counter()
+        products = load_shards(args.directory, args.stores, threads=args.threads)
+        print(f"Loaded {len(products)} products in {time.perf_counter() - start:.2f} seconds")
+    elif args.command == "update":
+        index = update_store(args.directory, args.store, read_snapshot(args.snapshot), args.processes)
+        shards = [e for e in index["shards"] if e["store"] == args.store]
+        print(f"{args.store}: {sum(e['rows'] for e in shards)} products in {len(shards)} shards")
+    else:
+        index = _read_index(args.directory)
+        for entry in sorted(index["shards"], key=lambda e: (e["store"], e["category"] or "")):
+            print(f"{entry['file']:<60}{entry['rows']:>8}{entry['bytes'] / 1024:>10.1f} KB")
+        print(f"{index['rows']} products in {len(index['shards'])} shards")
@@ -2,20 +2,39 @@ import requests
 import json
 import time
 import re
+import hashlib
+import os
+import socket
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-import py7zr
-from io import BytesIO,StringIO
-
-# Venue URLs
-venue_urls = [
-   "https://consumer-api.wolt.com/consumer-api/consumer-assortment/v1/venues/slug/freshful-now-67ecf9a6e78872a14652406a/assortment/categories/slug/{}?language=ro",
-    "https://consumer-api.wolt.com/consumer-api/consumer-assortment/v1/venues/slug/profi-baia-de-arama-3491-67fce8707ec55f4e5199f8d2/assortment/categories/slug/{}?language=ro",
-    "https://consumer-api.wolt.com/consumer-api/consumer-assortment/v1/venues/slug/penny-4469-67ee32d9a0c535a55340303e/assortment/categories/slug/{}?language=ro",
-   "https://consumer-api.wolt.com/consumer-api/consumer-assortment/v1/venues/slug/auchan-hypermarket-titan-67e2bd731248946a75c7a535/assortment/categories/slug/{}?language=ro",
-   "https://consumer-api.wolt.com/consumer-api/consumer-assortment/v1/venues/slug/carrefour-hypermarket-mega-mall-9139-67ee8dde26be843d2832a717/assortment/categories/slug/{}?language=ro",
-    "https://consumer-api.wolt.com/consumer-api/consumer-assortment/v1/venues/slug/kaufland-pantelimon-2470-67ecfaaae78872a1465240a6/assortment/categories/slug/{}?language=ro"
-
-]
+from functools import lru_cache
+from pathlib import Path
+from product_store import write_products
+from snapshot_io import write_snapshot, snapshot_filename, CODECS
+from snapshot_shards import write_shards, shard_directory
+from raw_archive import RawArchive, RAW_ARCHIVE_DIR, read_payload
+from scraper_metrics import RunMetrics
+from price_history import record_snapshot, HISTORY_DB
+from price_rollups import refresh_rollups
+from category_classifier import reclassify
+from best_value_index import refresh_index, BEST_VALUE_DB
+from venue_registry import load_venues, url_venue_slug, DEFAULT_CITY
+from crawl_queue import CrawlQueue, CRAWL_QUEUE_DIR, QUEUE_DB
+
+# Venues come from the registry (venues.json, see venue_registry.py)
+venues = load_venues()
+venue_urls = [venue.url_template() for venue in venues]
+venue_cities = {venue.slug: venue.city for venue in venues}
+
+# Seconds before a request is abandoned and retried
+REQUEST_TIMEOUT = 30
+
+# Compression of the daily snapshot and its shards (see snapshot_io.CODECS)
+SNAPSHOT_CODEC = "7z"
+
+# Metrics of the current run (replaced at the start of every run)
+metrics = RunMetrics()
 
 # Unit conversion factors
 CONVERSION_FACTORS = {
@@ -38,6 +57,45 @@ class FailedRequest:
         self.attempts = 0
         self.last_error = None
 
+# Fields a duplicate takes from the last category it appears in
+CATEGORY_FIELDS = ("catheg", "Cathegori", "CategorySlug")
+
+class SeenProducts:
+    """Products already collected during a run, by (store slug, product id).
+
+    Keys are stored as 64-bit blake2b digests instead of string tuples so memory
+    stays small even for hundreds of thousands of products. A product seen again
+    in another category keeps its first copy (and position) but takes the
+    category of the last one, as the old end-of-run deduplication kept the last.
+    """
+    def __init__(self):
+        self._products = {}
+        self.duplicates = 0
+
+    def _digest(self, store_slug, prod_id):
+        key = f"{store_slug}\x1f{prod_id}".encode("utf-8")
+        return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little")
+
+    def seen(self, store_slug, prod_id, category):
+        """
+        True (and counted) if the product was already collected; the kept copy
+        then takes the CATEGORY_FIELDS of category
+        """
+        kept = self._products.get(self._digest(store_slug, prod_id))
+        if kept is None:
+            return False
+        for field in CATEGORY_FIELDS:
+            kept[field] = category[field]
+        self.duplicates += 1
+        return True
+
+    def add(self, store_slug, prod_id, product):
+        """Record a collected product"""
+        self._products[self._digest(store_slug, prod_id)] = product
+
+    def __len__(self):
+        return len(self._products)
+
 def evaluate_quantity(quant):
     """Safely evaluate a quantity string (e.g., "4*2" -> 8)"""
     try:
@@ -75,6 +133,7 @@ def preprocess_title(title):
 
 def extract_all_units_and_quantities(title):
     if not title:
+        metrics.record_fallback("empty_title")
         return 1, "buc"
 
     title_lower = title.lower()
@@ -84,12 +143,15 @@ def extract_all_units_and_quantities(title):
 
     # Handle special cases first
     if "per bucata" in title_lower or "pe bucata" in title_lower:
+        metrics.record_fallback("per_bucata")
         return 1, "buc"
     
     if re.search(r"vrac\s*/?\s*100G", title_cleaned):
+        metrics.record_fallback("vrac_100g")
         return 100, "g"
     
     if re.search(r"vrac\s*/?\s*kg", title_cleaned):
+        metrics.record_fallback("vrac_kg")
         return 1000, "g"
 
     # Main pattern matching
@@ -111,9 +173,10 @@ def extract_all_units_and_quantities(title):
 
     # Only fall back to vrac special case if no units were found at all
     if "vrac" in title_cleaned and not re.search(rf'\b({indicators})\b', title_cleaned):
-        print(f"DEBUG: Vrac fallback triggered")  # Debug line
+        metrics.record_fallback("vrac_no_unit")
         return 1000, "g"
 
+    metrics.record_fallback("no_quantity")
     return 1, "buc"
 
 def get_with_retries(url, max_retries=10, initial_wait=1, max_wait=20):
@@ -122,7 +185,9 @@ def get_with_retries(url, max_retries=10, initial_wait=1, max_wait=20):
     
     for attempt in range(max_retries):
         try:
-            response = requests.get(url, timeout=30)
+            start = time.perf_counter()
+            response = requests.get(url, timeout=REQUEST_TIMEOUT)
+            metrics.record_request(url, response.status_code, time.perf_counter() - start, len(response.content))
             
             # Success cases
             if response.status_code == 200:
@@ -130,22 +195,28 @@ def get_with_retries(url, max_retries=10, initial_wait=1, max_wait=20):
             elif response.status_code == 404:
                 return response  # Let caller handle 404s
             elif response.status_code == 429:
+                metrics.record_retry(url, "429")
                 print(f"429 Too Many Requests. Waiting {wait_time} seconds before retrying (Attempt {attempt + 1})...")
             else:
+                metrics.record_retry(url, "http_error")
                 print(f"HTTP {response.status_code}. Waiting {wait_time} seconds before retrying (Attempt {attempt + 1})...")
             
             time.sleep(wait_time)
             wait_time = min(wait_time * 2, max_wait)  # Exponential backoff with cap
             
         except requests.exceptions.Timeout:
+            metrics.record_request(url, "timeout", time.perf_counter() - start)
+            metrics.record_retry(url, "timeout")
             print(f"Timeout on attempt {attempt + 1}. Waiting {wait_time} seconds...")
             time.sleep(wait_time)
             wait_time = min(wait_time * 1.5, max_wait)
         except requests.exceptions.ConnectionError:
+            metrics.record_retry(url, "connection")
             print(f"Connection error on attempt {attempt + 1}. Waiting {wait_time} seconds...")
             time.sleep(wait_time)
             wait_time = min(wait_time * 1.5, max_wait)
         except Exception as e:
+            metrics.record_retry(url, "error")
             print(f"Request error on attempt {attempt + 1}: {e}")
             time.sleep(wait_time)
             wait_time = min(wait_time * 1.5, max_wait)
@@ -160,7 +231,9 @@ def get_with_infinite_retries(url, initial_wait=1, max_wait=21):
     while True:
         attempt += 1
         try:
-            response = requests.get(url, timeout=30)
+            start = time.perf_counter()
+            response = requests.get(url, timeout=REQUEST_TIMEOUT)
+            metrics.record_request(url, response.status_code, time.perf_counter() - start, len(response.content))
             
             # Success cases
             if response.status_code == 200:
@@ -168,51 +241,69 @@ def get_with_infinite_retries(url, initial_wait=1, max_wait=21):
             elif response.status_code == 404:
                 return response  # Let caller handle 404s
             elif response.status_code == 429:
+                metrics.record_retry(url, "429")
                 print(f"429 Too Many Requests. Waiting {wait_time} seconds before retrying (Attempt {attempt})...")
             else:
+                metrics.record_retry(url, "http_error")
                 print(f"HTTP {response.status_code}. Waiting {wait_time} seconds before retrying (Attempt {attempt})...")
             
             time.sleep(wait_time)
             wait_time = min(wait_time * 1.2, max_wait)  # Gradual backoff with cap
             
         except requests.exceptions.Timeout:
+            metrics.record_request(url, "timeout", time.perf_counter() - start)
+            metrics.record_retry(url, "timeout")
             print(f"Timeout on attempt {attempt}. Waiting {wait_time} seconds...")
             time.sleep(wait_time)
             wait_time = min(wait_time * 1.1, max_wait)
         except requests.exceptions.ConnectionError:
+            metrics.record_retry(url, "connection")
             print(f"Connection error on attempt {attempt}. Waiting {wait_time} seconds...")
             time.sleep(wait_time)
             wait_time = min(wait_time * 1.1, max_wait)
         except Exception as e:
+            metrics.record_retry(url, "error")
             print(f"Request error on attempt {attempt}: {e}. Waiting {wait_time} seconds...")
             time.sleep(wait_time)
             wait_time = min(wait_time * 1.1, max_wait)
 
+CATEGORY_FILE = Path(__file__).parent / 'finalusechateg.json'
+
 def chateg():
-    with open(r'finalusechateg.json', 'r', encoding='utf-8') as f1:
+    with open(CATEGORY_FILE, 'r', encoding='utf-8') as f1:
         reader1 = json.load(f1)
     fdata = reader1
     return fdata
 
-def data_getting(url, data, all_data, slugs_data, last_main_slug=None):
+def clean_category(category_string):
+    return re.sub(r'[^a-z0-9]', '', category_string.lower())
+
+@lru_cache(maxsize=None)
+def cleaned_category_map():
+    """Cleaned Wolt category name -> dashboard category, read once per process"""
+    category_map = {row['Original Category']: row['New Category'] for row in chateg()}
+    return {clean_category(k): v for k, v in category_map.items()}
+
+def data_getting(url, data, all_data, slugs_data, last_main_slug=None, seen_products=None):
     """
     Process API response and extract product data, using the last main slug
     if the current data's items are empty.
+    Items already in seen_products (same store slug and product id) are skipped
+    before any title parsing; the kept copy moves to this page's category.
     Returns the main slug to be used for the next iteration.
     """
+    parse_start = time.perf_counter()
+    items_parsed = duplicates_before = 0
+    if seen_products is not None:
+        duplicates_before = seen_products.duplicates
+
     # Extract store name
     after_slug = url.split('/slug/')[1]
     before_assortment = after_slug.split('/assortment')[0]
     parts = re.split(r'\d', before_assortment, maxsplit=1)
     store_name = parts[0].rstrip('-')
 
-    categtoreplace = chateg()
-    category_map = {row['Original Category']: row['New Category'] for row in categtoreplace}
-
-    def clean(category_string):
-        return re.sub(r'[^a-z0-9]', '', category_string.lower())
-
-    cleanedcategory_map = {clean(k): v for k, v in category_map.items()}
+    cleanedcategory_map = cleaned_category_map()
 
     # Get items (handle as list)
     items = data.get('items', [])
@@ -223,6 +314,11 @@ def data_getting(url, data, all_data, slugs_data, last_main_slug=None):
     category_info = data.get('category', {})
     category_name = category_info.get('name', 'N/A')
     category_slug = category_info.get('slug', 'N/A')
+    page_category = {
+        "catheg": category_name,
+        "Cathegori": cleanedcategory_map.get(clean_category(category_name), "Miscellaneous"),
+        "CategorySlug": category_slug
+    }
     
     # Save slug and store information
     slug_entry = {
@@ -242,6 +338,11 @@ def data_getting(url, data, all_data, slugs_data, last_main_slug=None):
 
     # Process items (only if there are any)
     for item in items:
+        # Skip products already collected from another category or page
+        prod_id = item.get('id', "N/A")
+        if seen_products is not None and prod_id != "N/A" and seen_products.seen(before_assortment, prod_id, page_category):
+            continue
+
         # Safe price conversion
         current_priceunrd = item.get('price', 0) / 100 if item.get('price') else 0
         current_price = round(current_priceunrd, 2)
@@ -256,8 +357,7 @@ def data_getting(url, data, all_data, slugs_data, last_main_slug=None):
                 image_url = item['images'].get('url', "N/A")
 
         # Build product data
-        prod_id = item.get('id', "N/A")
-        product_link = f"https://wolt.com/en/rou/bucharest/venue/{before_assortment}/{prod_id}"
+        product_link = f"https://wolt.com/en/rou/{venue_cities.get(before_assortment, DEFAULT_CITY)}/venue/{before_assortment}/{prod_id}"
         title = item.get('name', "N/A")
 
         # Extract quantity and unit from title
@@ -268,6 +368,7 @@ def data_getting(url, data, all_data, slugs_data, last_main_slug=None):
             price_metric = current_price / quant if quant and current_price else 0
         except (TypeError, ZeroDivisionError):
             price_metric = 0
+            metrics.record_fallback("price_metric_error")
             print(f"Price calculation error - Title: {title}, Quantity: {quant}, Price: {current_price}")
 
         if price_metric < 0.0003:
@@ -275,9 +376,11 @@ def data_getting(url, data, all_data, slugs_data, last_main_slug=None):
         else:
             low_valflag = "Norm"
 
-        cleanedcategory_name = clean(category_name)
+        cleanedcategory_name = clean_category(category_name)
 
         useChateg = cleanedcategory_map.get(cleanedcategory_name, "Miscellaneous") 
+        if useChateg == "Miscellaneous":
+            metrics.record_fallback("unmapped_category")
 
         category_data = {
             "Image URL": image_url,
@@ -298,12 +401,24 @@ def data_getting(url, data, all_data, slugs_data, last_main_slug=None):
         }
 
         all_data.append(category_data)
+        if seen_products is not None and prod_id != "N/A":
+            seen_products.add(before_assortment, prod_id, category_data)
+        items_parsed += 1
+
+    duplicates = seen_products.duplicates - duplicates_before if seen_products is not None else 0
+    metrics.record_page(url, items_parsed, duplicates, time.perf_counter() - parse_start)
     
     # Return the main slug to be used for the next iteration
 
-def process_category(base_url, category_id, all_data, slugs_data, failed_requests):
+def archive_page(raw_archive, url, response):
+    """Keep the raw payload of a page handed to data_getting when archiving is on"""
+    if raw_archive is not None:
+        raw_archive.add(url, response.content)
+
+def process_category(base_url, category_id, all_data, slugs_data, failed_requests, seen_products=None, raw_archive=None):
     """Process a single category and handle pagination"""
     url = base_url.format(category_id)
+    category_start = time.perf_counter()
     
     try:
         response = get_with_retries(url)
@@ -321,7 +436,8 @@ def process_category(base_url, category_id, all_data, slugs_data, failed_request
         print(f"Category {category_id}: {category_name}")
         
         # Process main page
-        data_getting(url, data, all_data, slugs_data)
+        archive_page(raw_archive, url, response)
+        data_getting(url, data, all_data, slugs_data, seen_products=seen_products)
         
         # Handle pagination
         nextpt = data.get('metadata', {}).get('next_page_token')
@@ -330,7 +446,8 @@ def process_category(base_url, category_id, all_data, slugs_data, failed_request
             try:
                 response = get_with_retries(urlpg)
                 data = response.json()
-                data_getting(url, data, all_data, slugs_data)
+                archive_page(raw_archive, url, response)
+                data_getting(url, data, all_data, slugs_data, seen_products=seen_products)
                 nextpt = data.get('metadata', {}).get('next_page_token')
             except Exception as e:
                 print(f"Failed pagination request for category {category_id}: {e}")
@@ -347,8 +464,38 @@ def process_category(base_url, category_id, all_data, slugs_data, failed_request
         failed_req.last_error = str(e)
         failed_requests.append(failed_req)
         return True  # Continue to next category
+    finally:
+        metrics.record_category(url, time.perf_counter() - category_start)
 
-def retry_failed_requests(failed_requests, all_data, slugs_data):
+def fetch_category(url, seen_products=None):
+    """
+    Crawl one category URL with all its pages. Returns None when the category
+    does not exist, else (products, slug entries, pages requested, category slug).
+    Request errors are raised to the caller.
+    """
+    category_start = time.perf_counter()
+    try:
+        response = get_with_retries(url)
+        if response.status_code == 404:
+            return None
+        data = response.json()
+        if 'detail' in data and 'not found' in data['detail']:
+            return None
+
+        all_data, slugs_data, pages = [], [], 1
+        category_slug = data.get('category', {}).get('slug', 'N/A')
+        data_getting(url, data, all_data, slugs_data, seen_products=seen_products)
+        nextpt = data.get('metadata', {}).get('next_page_token')
+        while nextpt:
+            data = get_with_retries(url + "&page_token=" + nextpt).json()
+            pages += 1
+            data_getting(url, data, all_data, slugs_data, seen_products=seen_products)
+            nextpt = data.get('metadata', {}).get('next_page_token')
+        return all_data, slugs_data, pages, category_slug
+    finally:
+        metrics.record_category(url, time.perf_counter() - category_start)
+
+def retry_failed_requests(failed_requests, all_data, slugs_data, seen_products=None, raw_archive=None):
     """Retry all failed requests until they succeed"""
     if not failed_requests:
         return
@@ -381,7 +528,8 @@ def retry_failed_requests(failed_requests, all_data, slugs_data):
                         continue  # Don't add back to failed requests
                     
                     # Successfully got data, process it
-                    data_getting(failed_req.url, data, all_data, slugs_data)
+                    archive_page(raw_archive, failed_req.url, response)
+                    data_getting(failed_req.url, data, all_data, slugs_data, seen_products=seen_products)
                     
                     # Also handle pagination for retried main requests
                     nextpt = data.get('metadata', {}).get('next_page_token')
@@ -390,7 +538,8 @@ def retry_failed_requests(failed_requests, all_data, slugs_data):
                         try:
                             response = get_with_infinite_retries(urlpg)
                             data = response.json()
-                            data_getting(failed_req.url, data, all_data, slugs_data)
+                            archive_page(raw_archive, failed_req.url, response)
+                            data_getting(failed_req.url, data, all_data, slugs_data, seen_products=seen_products)
                             nextpt = data.get('metadata', {}).get('next_page_token')
                         except Exception as e:
                             print(f"Failed pagination in retry: {e}")
@@ -405,7 +554,8 @@ def retry_failed_requests(failed_requests, all_data, slugs_data):
                     # Retry pagination request with infinite retries
                     response = get_with_infinite_retries(failed_req.url)
                     data = response.json()
-                    data_getting(failed_req.base_url.format(failed_req.category_id), data, all_data, slugs_data)
+                    archive_page(raw_archive, failed_req.base_url.format(failed_req.category_id), response)
+                    data_getting(failed_req.base_url.format(failed_req.category_id), data, all_data, slugs_data, seen_products=seen_products)
                     print(f"✓ Successfully retried pagination request for category {failed_req.category_id}")
                     
             except KeyboardInterrupt:
@@ -429,73 +579,322 @@ def retry_failed_requests(failed_requests, all_data, slugs_data):
     
     print(f"\n✅ All failed requests successfully retried!")
 
-def remove_duplicates(products):
-    """Remove duplicate products based on image URL"""
-    unique_products = {}
-    for product in reversed(products):
-        image_url = product.get("Image URL")
-        if image_url not in unique_products:
-            unique_products[image_url] = product
-    return list(reversed(unique_products.values()))
-
-def main():
-    """Main scraping function"""
+def crawl_job(queue, job, worker):
+    """Crawl one leased (venue, category) with all its pages and hand the products to the queue"""
+    url = job.url
+    category_start = time.perf_counter()
+    all_data, slugs_data, seen_products = [], [], SeenProducts()
+    try:
+        response = get_with_retries(url)
+        if response.status_code == 404:
+            queue.missing(job, worker)
+            return
+        data = response.json()
+        if 'detail' in data and 'not found' in data['detail']:
+            queue.missing(job, worker)
+            return
+
+        print(f"{job.venue} category {job.category_id}: {data.get('category', {}).get('name', 'N/A')}")
+        data_getting(url, data, all_data, slugs_data, seen_products=seen_products)
+        nextpt = data.get('metadata', {}).get('next_page_token')
+        while nextpt:
+            # A worker that lost its lease leaves the category to the new one
+            if not queue.renew(job, worker):
+                return
+            data = get_with_retries(url + "&page_token=" + nextpt).json()
+            data_getting(url, data, all_data, slugs_data, seen_products=seen_products)
+            nextpt = data.get('metadata', {}).get('next_page_token')
+        queue.complete(job, worker, all_data, slugs_data, seen_products.duplicates)
+    except Exception as e:
+        print(f"Failed {job.venue} category {job.category_id} (attempt {job.attempts}): {e}")
+        queue.fail(job, worker, e)
+    finally:
+        metrics.record_category(url, time.perf_counter() - category_start)
+
+def run_worker(queue_dir, worker=None, request_timeout=None, idle_wait=(0.02, 1.0)):
+    """
+    Lease and crawl jobs until the queue is drained; returns the worker's metrics.
+    An idle worker polls again after idle_wait[0] seconds, doubling up to idle_wait[1].
+    """
+    global metrics, REQUEST_TIMEOUT
+    metrics = RunMetrics()
+    if request_timeout is not None:
+        REQUEST_TIMEOUT = request_timeout
+    worker = worker or f"{socket.gethostname()}-{os.getpid()}"
+    queue = CrawlQueue(queue_dir)
+    wait = idle_wait[0]
+    try:
+        while True:
+            job = queue.lease(worker)
+            if job is not None:
+                crawl_job(queue, job, worker)
+                wait = idle_wait[0]
+            elif queue.drained():
+                break
+            else:
+                # Other workers are still crawling and queue the next category ids
+                # as they find categories, usually within a page or two
+                time.sleep(wait)
+                wait = min(wait * 2, idle_wait[1])
+    finally:
+        queue.close()
+    return metrics
+
+def crawl_with_queue(queue_dir, workers):
+    """
+    Crawl every venue through a CrawlQueue with local worker processes (other
+    machines can join with --worker). Returns the products, category slugs
+    and number of duplicates, as the sequential crawl collects them.
+    """
+    queue = CrawlQueue(queue_dir)
+    priorities = {venue.slug: venue.priority for venue in venues}
+    queue.seed((url_venue_slug(url), url, priorities.get(url_venue_slug(url), 0)) for url in venue_urls)
+
+    host = socket.gethostname()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_worker, queue_dir, f"{host}-{os.getpid()}-{n}", REQUEST_TIMEOUT) for n in range(workers)]
+        for future in futures:
+            metrics.merge(future.result())
+
+    # Same (store slug, Prod ID) deduplication as the sequential crawl, in venue and category order
+    all_data, slugs_data, seen_products, seen_slugs = [], [], SeenProducts(), set()
+    for venue_slug, category_id, result in queue.results():
+        seen_products.duplicates += result["duplicates"]
+        for product in result["products"]:
+            prod_id = product["Prod ID"]
+            if prod_id != "N/A":
+                if seen_products.seen(venue_slug, prod_id, product):
+                    continue
+                seen_products.add(venue_slug, prod_id, product)
+            all_data.append(product)
+        for slug_entry in result["slugs"]:
+            if (slug_entry["category_slug"], slug_entry["store_slug"]) not in seen_slugs:
+                seen_slugs.add((slug_entry["category_slug"], slug_entry["store_slug"]))
+                slugs_data.append(slug_entry)
+
+    failed = queue.counts().get("failed", 0)
+    if failed:
+        print(f"⚠️  Warning: {failed} categories could not be crawled (see python crawl_queue.py {queue_dir} --jobs)")
+    queue.close()
+    return all_data, slugs_data, seen_products.duplicates
+
+def _replay_venue(pack_path, entries):
+    """Re-run data_getting over one venue's archived pages (runs in a worker process)"""
+    global metrics
+    metrics = RunMetrics()
+    all_data, slugs_data = [], []
+    seen_products = SeenProducts()
+    with open(pack_path, "rb") as pack_file:
+        for entry in entries:
+            data = json.loads(read_payload(pack_file, entry))
+            data_getting(entry["url"], data, all_data, slugs_data, seen_products=seen_products)
+    return all_data, slugs_data, seen_products.duplicates, metrics
+
+def replay_raw_archive(date_str, raw_dir=RAW_ARCHIVE_DIR, output_dir="replayed", processes=None):
+    """
+    Normalize an archived crawl again without network access.
+    Pages are grouped by venue so (store slug, Prod ID) deduplication stays
+    exact while venues are processed in parallel.
+    """
+    global metrics
+    metrics = RunMetrics()
+    start = time.perf_counter()
+    with RawArchive(raw_dir, date_str) as archive:
+        entries = archive.entries()
+        pack_path = archive.pack_path
+
+    by_venue = OrderedDict()
+    for entry in entries:
+        store_slug = entry["url"].split('/slug/')[1].split('/assortment')[0]
+        by_venue.setdefault(store_slug, []).append(entry)
+
+    all_data, slugs_data, duplicates = [], [], 0
+    with metrics.phase("replay"), ProcessPoolExecutor(max_workers=processes or min(len(by_venue), os.cpu_count() or 1) or 1) as pool:
+        futures = [pool.submit(_replay_venue, pack_path, venue_entries) for venue_entries in by_venue.values()]
+        for future in futures:
+            venue_data, venue_slugs, venue_duplicates, venue_metrics = future.result()
+            all_data.extend(venue_data)
+            slugs_data.extend(venue_slugs)
+            duplicates += venue_duplicates
+            metrics.merge_parse_counts(venue_metrics)
+    with metrics.phase("classify"):
+        reclassified = reclassify(all_data, processes)
+    elapsed = time.perf_counter() - start
+
+    print(f"Replayed {len(entries)} pages from {len(by_venue)} venues in {elapsed:.2f} seconds "
+          f"({len(entries) / elapsed:.0f} pages/s, {(len(all_data) + duplicates) / elapsed:.0f} items/s)")
+    print(f"Collected {len(all_data)} unique products, skipped {duplicates} duplicates")
+    print(f"Classified {reclassified} Miscellaneous products by title keywords")
+
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    output_path = Path(output_dir) / snapshot_filename(date_str, SNAPSHOT_CODEC)
+    with metrics.phase("write_archive"):
+        write_snapshot(output_path, all_data)
+    print(f"Product data saved to {output_path}")
+    metrics.write_json(Path(output_dir) / f"run_report_{date_str}.json")
+    return all_data
+
+def crawl_queue_directory(resume=False):
+    """
+    Queue directory of a crawl with workers: a new one per run, named by its
+    start time, or with resume the most recently used one (to finish an
+    interrupted crawl instead of starting over)
+    """
+    if resume:
+        queues = sorted(Path(CRAWL_QUEUE_DIR).glob(f"*/{QUEUE_DB}"), key=os.path.getmtime)
+        if queues:
+            return queues[-1].parent
+        print("No crawl queue to resume, starting a new one")
+    return Path(CRAWL_QUEUE_DIR) / datetime.now().strftime("%d-%m-%Y_%H%M%S")
+
+def main(archive_raw=False, prometheus_path=None, workers=None, resume=False):
+    """
+    Main scraping function; with workers, categories are crawled in parallel
+    through a CrawlQueue (a new one unless resume)
+    """
+    global metrics
+    metrics = RunMetrics()
+
+    # Raw page payloads are kept for offline replay when requested
+    raw_archive = RawArchive(RAW_ARCHIVE_DIR, datetime.now().strftime("%d-%m-%Y"), mode="a") if archive_raw else None
+
     active_venues = {url: True for url in venue_urls}
     all_data = []
     slugs_data = []  # New list to store slug information
     failed_requests = []
+    seen_products = SeenProducts()  # (store slug, Prod ID) keys, deduplicated as items arrive
  
     i = 1
-    while any(active_venues.values()):
-        for base_url in venue_urls:
-            if not active_venues[base_url]:
-                continue
+    with metrics.phase("crawl"):
+        if workers:
+            # Failed categories go back to the queue, so there is nothing left for retry_failed
+            queue_dir = crawl_queue_directory(resume)
+            print(f"Crawl queue {queue_dir} (other machines can join with --worker {queue_dir})")
+            all_data, slugs_data, seen_products.duplicates = crawl_with_queue(queue_dir, workers)
+        else:
+            while any(active_venues.values()):
+                for base_url in venue_urls:
+                    if not active_venues[base_url]:
+                        continue
 
-            success = process_category(base_url, i, all_data, slugs_data, failed_requests)
-            if not success:
-                print(f"Done with venue at slug {i}")
-                active_venues[base_url] = False
+                    success = process_category(base_url, i, all_data, slugs_data, failed_requests, seen_products, raw_archive)
+                    if not success:
+                        print(f"Done with venue at slug {i}")
+                        active_venues[base_url] = False
 
-            time.sleep(0.1)
+                    time.sleep(0.1)
 
-        i += 1
+                i += 1
 
     # Retry all failed requests at the end
-    retry_failed_requests(failed_requests, all_data, slugs_data)
+    with metrics.phase("retry_failed"):
+        retry_failed_requests(failed_requests, all_data, slugs_data, seen_products, raw_archive)
+
+    if raw_archive is not None:
+        raw_archive.close()
+        print(f"Archived {raw_archive.pages} raw pages ({raw_archive.new_payloads} new payloads, "
+              f"{raw_archive.bytes_in / 1e6:.1f} MB -> {raw_archive.bytes_stored / 1e6:.1f} MB)")
 
-    # Remove duplicates
-    unique_products = remove_duplicates(all_data)
+    # Duplicates were already dropped while crawling
+    unique_products = all_data
     
     print(f"\nScraping complete! Collected {len(unique_products)} unique products")
+    print(f"Skipped {seen_products.duplicates} duplicate products (same store and Prod ID)")
     print(f"Collected {len(slugs_data)} unique category slugs")
     if failed_requests:
         print(f"⚠️  Warning: {len(failed_requests)} requests could not be recovered")
 
+    # Products whose Wolt category is not in finalusechateg.json get one from their title
+    with metrics.phase("classify"):
+        reclassified = reclassify(unique_products)
+    print(f"Classified {reclassified} Miscellaneous products by title keywords")
+
+    publish_snapshot(unique_products, prometheus_path)
+
+    # Save slugs data
+   #with open('slugs.json', 'w', encoding='utf-8') as json_file:
+    #   json.dump(slugs_data, json_file, indent=4, ensure_ascii=False)
     
+    print("Slugs data saved to slugs.json")
+    return unique_products
 
+def publish_snapshot(unique_products, prometheus_path=None):
+    """
+    Write a crawl's products everywhere the dashboard reads them: today's
+    snapshot and shards, products.sqlite, the price history and rollups and
+    the best value index, then the run report. Returns the snapshot file name.
+    """
     today = datetime.now()
     date_str = today.strftime("%d-%m-%Y")
+    snapshot_name = snapshot_filename(date_str, SNAPSHOT_CODEC)
 
-    # Create JSON string
-    json_str = json.dumps(unique_products, ensure_ascii=False)
-    json_bytes = json_str.encode("utf-8")
-
-    # Use BytesIO instead of StringIO for binary data
-    json_io = BytesIO(json_bytes)
+    # Write the snapshot archive
+    with metrics.phase("write_archive"):
+        write_snapshot(snapshot_name, unique_products)
 
-    # Write to 7z archive
-    with py7zr.SevenZipFile(f"products_{date_str}.7z", "w") as archive:
-        archive.writef(json_io, f"products_{date_str}.json")
+    # Per-store shards, so the dashboard can load only the stores it serves
+    with metrics.phase("write_shards"):
+        shard_index = write_shards(shard_directory(date_str), unique_products, codec=SNAPSHOT_CODEC)
+    print(f"Wrote {len(shard_index['shards'])} shards to {shard_directory(date_str)}")
 
     
-    print(F"Product data saved to products_{date_str}.json")
-    
-    # Save slugs data
-   #with open('slugs.json', 'w', encoding='utf-8') as json_file:
-    #   json.dump(slugs_data, json_file, indent=4, ensure_ascii=False)
-    
-    print("Slugs data saved to slugs.json")
+    print(F"Product data saved to {snapshot_name}")
+
+    # Indexed copy of the latest snapshot for the dashboard
+    with metrics.phase("write_database"):
+        write_products("products.sqlite", unique_products, snapshot_name)
+    print("Product database saved to products.sqlite")
+
+    # Only the prices that moved since the last run are added to the history; a
+    # second publish on the same day replaces the day, which keeps its latest state
+    with metrics.phase("price_history"):
+        history_stats = record_snapshot(HISTORY_DB, today, unique_products, snapshot_name, replace=True)
+        if history_stats:
+            replaced = " (replaced today's entry)" if history_stats["replaced"] else ""
+            print(f"Price history: {history_stats['price_changes']} price changes, {history_stats['removed']} removed products{replaced}")
+            print(f"Updated {refresh_rollups(HISTORY_DB)} price rollups")
+
+    # Top-k best value per category and unit, moved along with the diff from the indexed snapshot
+    with metrics.phase("best_value"):
+        index_stats = refresh_index(BEST_VALUE_DB, unique_products, snapshot_name)
+    print(f"Best value index: ranked {index_stats['recomputed']} of {index_stats['groups']} groups")
+
+    # Machine-readable run report, to compare runs night to night
+    metrics.write_json(f"run_report_{date_str}.json")
+    print(f"Run report saved to run_report_{date_str}.json")
+    if prometheus_path:
+        metrics.write_prometheus(prometheus_path)
+        print(f"Prometheus metrics saved to {prometheus_path}")
+    return snapshot_name
    
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Scrape grocery assortments from Wolt")
+    parser.add_argument("--archive-raw", action="store_true", help=f"keep raw page payloads in {RAW_ARCHIVE_DIR}/ for offline replay")
+    parser.add_argument("--replay", metavar="DD-MM-YYYY", help="re-normalize an archived crawl instead of scraping")
+    parser.add_argument("--raw-dir", default=RAW_ARCHIVE_DIR, help="raw archive directory used by --replay")
+    parser.add_argument("--output-dir", default="replayed", help="where --replay writes the snapshot")
+    parser.add_argument("--processes", type=int, help="worker processes for --replay")
+    parser.add_argument("--metrics-prom", metavar="PATH", help="also write run metrics as a Prometheus text file")
+    parser.add_argument("--workers", type=int, help="crawl with this many worker processes through a job queue")
+    parser.add_argument("--worker", metavar="QUEUE_DIR", help="join an existing crawl queue as a worker (e.g. from another machine)")
+    parser.add_argument("--resume", action="store_true",
+                        help="with --workers, finish the most recent crawl queue instead of starting a new one")
+    parser.add_argument("--codec", choices=sorted(CODECS), default=SNAPSHOT_CODEC, help="snapshot compression (see bench_codecs.py)")
+    args = parser.parse_args()
+    SNAPSHOT_CODEC = args.codec
+
+    if args.archive_raw and args.workers:
+        parser.error("--archive-raw is not supported with --workers")
+    if args.resume and not args.workers:
+        parser.error("--resume needs --workers")
+
+    if args.worker:
+        worker_metrics = run_worker(args.worker)
+        print(f"Worker done: {worker_metrics.report()['totals']['pages']} pages crawled")
+    elif args.replay:
+        replay_raw_archive(args.replay, args.raw_dir, args.output_dir, args.processes)
+    else:
+        main(archive_raw=args.archive_raw, prometheus_path=args.metrics_prom, workers=args.workers, resume=args.resume)
\ No newline at end of file
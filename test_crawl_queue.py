@@ -0,0 +1,34 @@
+from crawl_queue import CrawlQueue
+
+VENUE = "test-venue"
+LAST_CATEGORY = 10
+
+def crawl(queue, broken, abandon=False):
+    """Run one worker until the queue drains; broken fails every time (or is left leased when abandon)"""
+    while not queue.drained():
+        job = queue.lease("worker")
+        if job is None:
+            continue
+        if job.category_id > LAST_CATEGORY:
+            queue.missing(job, "worker")
+        elif job.category_id == broken:
+            if not abandon:
+                queue.fail(job, "worker", "HTTP 500")
+        else:
+            queue.complete(job, "worker", [{"id": job.category_id}], [VENUE])
+
+def test_failed_category_keeps_probing(tmp_path):
+    queue = CrawlQueue(tmp_path, max_attempts=2, probe_ahead=2)
+    queue.seed([(VENUE, "https://example.com/{}", 0)])
+    crawl(queue, broken=3)
+    assert [category_id for _, category_id, _ in queue.results()] == [1, 2, 4, 5, 6, 7, 8, 9, 10]
+    assert queue.counts()["failed"] == 1
+    queue.close()
+
+def test_expired_lease_keeps_probing(tmp_path):
+    queue = CrawlQueue(tmp_path, lease_seconds=-1, max_attempts=2, probe_ahead=2)
+    queue.seed([(VENUE, "https://example.com/{}", 0)])
+    crawl(queue, broken=3, abandon=True)
+    assert [category_id for _, category_id, _ in queue.results()] == [1, 2, 4, 5, 6, 7, 8, 9, 10]
+    assert queue.unfinished() == [(VENUE, 3, "failed", None, 2, "lease expired")]
+    queue.close()
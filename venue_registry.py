@@ -0,0 +1,69 @@
+"""
+Registry of the Wolt venues to crawl, read from venues.json.
+
+Each entry holds the venue's slug (as in its Wolt URL), its city and a
+priority. The crawl queue hands out the jobs of higher priority venues
+first, so the biggest catalogs (the longest crawls) start early; products
+are still written in registry order. "enabled": false keeps a venue listed
+without crawling it.
+
+    [{"slug": "penny-4469-67ee32d9a0c535a55340303e", "city": "bucharest", "priority": 1}, ...]
+
+    python venue_registry.py                   # the enabled venues
+    python venue_registry.py --city bucharest
+"""
+import json
+from pathlib import Path
+
+VENUES_FILE = Path(__file__).parent / "venues.json"
+DEFAULT_CITY = "bucharest"
+
+API_BASE = "https://consumer-api.wolt.com"
+# Category URL of a venue, {} being the category id
+CATEGORY_PATH = "/consumer-api/consumer-assortment/v1/venues/slug/{slug}/assortment/categories/slug/{{}}?language=ro"
+
+class Venue:
+    """One registry entry"""
+    def __init__(self, slug, city=DEFAULT_CITY, priority=0, enabled=True):
+        self.slug = slug
+        self.city = city
+        self.priority = priority
+        self.enabled = enabled
+
+    def url_template(self, api_base=API_BASE):
+        """Category URL template of the venue, as used in store_scraper.venue_urls"""
+        return api_base + CATEGORY_PATH.format(slug=self.slug)
+
+def load_venues(path=VENUES_FILE, city=None, include_disabled=False):
+    """Venues of the registry in file order, optionally only those of one city"""
+    with open(path, "r", encoding="utf-8") as f:
+        entries = json.load(f)
+
+    venues, seen = [], set()
+    for entry in entries:
+        venue = Venue(entry["slug"], entry.get("city", DEFAULT_CITY), int(entry.get("priority", 0)),
+                      entry.get("enabled", True))
+        if venue.slug in seen:
+            raise ValueError(f"Venue {venue.slug} is listed twice in {path}")
+        seen.add(venue.slug)
+        if (venue.enabled or include_disabled) and (city is None or venue.city == city):
+            venues.append(venue)
+    return venues
+
+def url_venue_slug(url):
+    """Venue slug of a category URL or URL template"""
+    return url.split('/slug/')[1].split('/assortment')[0]
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="List the venues of the registry")
+    parser.add_argument("--file", default=str(VENUES_FILE))
+    parser.add_argument("--city")
+    parser.add_argument("--all", action="store_true", help="include disabled venues")
+    args = parser.parse_args()
+
+    venues = load_venues(args.file, args.city, args.all)
+    for venue in sorted(venues, key=lambda v: (-v.priority, v.city, v.slug)):
+        print(f"{venue.priority:>4}  {venue.city:<16}{venue.slug}{'' if venue.enabled else '  (disabled)'}")
+    print(f"{len(venues)} venues in {len({v.city for v in venues})} cities")